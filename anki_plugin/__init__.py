@@ -9,6 +9,7 @@
 ######################################################################
 
 
+import logging
 from PyQt6.QtWidgets import QApplication
 
 try:
@@ -27,6 +28,8 @@ from aqt.qt import *
 
 
 def main():
+    # shows the timing of the loading phases, see load_timing
+    logging.basicConfig(level=logging.INFO)
     app = QApplication(sys.argv)
     window = MangAnkiWindow()
     sys.exit(app.exec())
@@ -9,6 +9,8 @@
 ######################################################################
 
 import enum
+import itertools
+import logging
 import os
 import pickle
 import asyncio
@@ -17,14 +19,31 @@ try:
     from .resources import Resource, Resources
     from . import dict_lookup
     from .dict_lookup import DictionaryLookup, DictionaryEntry
+    from .dict_loader import load_dictionary, DEFAULT_BACKEND
+    from .dict_service import connect_dictionary_service
+    from .text_scanner import entries_in_text
+    from .deinflector import look_up_deinflected
+    from .lookup_cache import CachedLookup, LookupCache
+    from .word_list import import_word_list
+    from .wildcard_index import is_pattern
+    from .load_timing import TimedPhase
+    from .memory_report import memory_report
 except:
     from resources import Resource, Resources
     import dict_lookup
     from dict_lookup import DictionaryLookup, DictionaryEntry
+    from dict_loader import load_dictionary, DEFAULT_BACKEND
+    from dict_service import connect_dictionary_service
+    from text_scanner import entries_in_text
+    from deinflector import look_up_deinflected
+    from lookup_cache import CachedLookup, LookupCache
+    from word_list import import_word_list
+    from wildcard_index import is_pattern
+    from load_timing import TimedPhase
+    from memory_report import memory_report
 
 
 class AppState(enum.Enum):
-    LOADING_AND_PREPARING = 0
     INITIAL = 1
     IMAGE_COPIED_NO_MARKING = 2
     MARKING_GIVEN_NO_EXPR = 3
@@ -32,13 +51,17 @@ class AppState(enum.Enum):
     ENTRY_SELECTED_READY_TO_TRANSFER = 5
 
 
+logger = logging.getLogger(__name__)
+
 APP_STATE_STORE_FILE = "%s/%s" % (os.path.dirname(__file__), "app.pickle")
+# at most that many entries are listed while typing, to keep lookups fast
+MAX_CANDIDATES = 50
 
 
 class AppLogic:
     def __init__(self):
         resources_dict = {
-            "AppState": AppState.LOADING_AND_PREPARING,
+            "AppState": AppState.INITIAL,
             "Image": None,
             "OriginalClipboardImage": None,
             "Marking": None,
@@ -46,15 +69,24 @@ class AppLogic:
             "SelectedTranslationIndex": None,
             "SelectedTranslation": None,
             "PossibleEntries": None,
+            # texts of PossibleEntries as listed, set before PossibleEntries
+            "PossibleEntryTexts": None,
             "Dictionary": None,
+            "DictionaryBackend": DEFAULT_BACKEND,
+            "PreferredLanguagesOnly": True,
+            # whether the dictionary is held by the dictionary service
+            "DictionaryService": False,
             "CurrentTakobotoLink": None,
             "TranslationLanguages": None,
             "PreferredTranslationLanguage": "eng",
             "AudioPath": "",
             "AudioPathUrl": None,
             "Tag": "",
+            # ImportedWord's of an imported word list still to be shown
+            "ImportedWords": (),
         }
         self._r = Resources(resources_dict)
+        self._lookup_cache = LookupCache()
         self._r.add_listener(
             "OriginalClipboardImage", self.on_change_original_clipboard_image
         )
@@ -68,6 +100,7 @@ class AppLogic:
             self.on_change_preferred_translation_language,
         )
         self._r.add_listener("AudioPathUrl", self.process_potential_audio_url)
+        self._r.add_listener("Dictionary", self._lookup_cache.clear)
 
     def process_potential_audio_url(self):
         url = self._r["AudioPathUrl"]
@@ -79,17 +112,79 @@ class AppLogic:
             if ext in [".mp3", ".wav"]:
                 self._r["AudioPath"] = path
 
-    def do_initial_loading_tasks(self):
-        self._r.Dictionary = dict_lookup.DictionaryLookup.de_pickle()
-        if self._r.Dictionary is None:
-            self._r.Dictionary = DictionaryLookup()
-            self._r.Dictionary.parse_file()
-            self._r.Dictionary.pickle()  # for next time
-        self._r.TranslationLanguages = self._r.Dictionary.get_languages()
+    def _get_needed_languages(self):
+        """Languages whose glosses have to be loaded, or None for all."""
+        if not self._r.PreferredLanguagesOnly:
+            return None
+        return {self._r.PreferredTranslationLanguage, "eng"}
+
+    def load_dictionary(self, on_progress=None, on_rebuilt=None):
+        """Loads and returns the dictionary of the chosen backend without touching
+        any resource, so it can run on a background thread; pass the result to
+        set_dictionary(). on_progress gets messages on the loading stages, and
+        on_rebuilt the rebuilt dictionary if the loaded one was outdated (see
+        dict_loader). With DictionaryService set, the dictionary of the dictionary
+        service is returned instead, if it can be reached; should the service be
+        lost later on, on_rebuilt gets the dictionary replacing it."""
+        if self._r.DictionaryService:
+            dictionary = connect_dictionary_service(
+                self._r.DictionaryBackend,
+                languages=self._get_needed_languages(),
+                on_progress=on_progress,
+                on_rebuilt=on_rebuilt,
+            )
+            if dictionary is not None:
+                return dictionary
+            logger.warning(
+                "Dictionary service not available, loading the dictionary here."
+            )
+        return load_dictionary(
+            self._r.DictionaryBackend,
+            languages=self._get_needed_languages(),
+            on_rebuilt=on_rebuilt,
+            on_progress=on_progress,
+        )
+
+    def set_dictionary(self, dictionary):
+        """Makes dictionary the one used for lookups. Until the first one is set,
+        lookups find nothing; the current expression is looked up again here."""
+        self._r.Dictionary = dictionary
+        self._r.TranslationLanguages = dictionary.get_languages()
+        if self._r.CurrentEntry:
+            self.on_change_current_entry()
+
+    def load_languages(self, dictionary):
+        """Reads the glosses needed for the preferred translation language into
+        dictionary if they are missing (see dict_loader), without touching any
+        resource, so it can run on a background thread; pass the result to
+        on_languages_loaded()."""
+        dictionary.load_languages(self._get_needed_languages())
+        return dictionary
+
+    def on_languages_loaded(self, dictionary):
+        """Looks up the current expression again with the glosses read by
+        load_languages(), unless another dictionary has been set meanwhile."""
+        if dictionary is not self._r.Dictionary:
+            return
+        # cached lookups may lack the glosses
+        self._lookup_cache.clear()
+        if self._r.CurrentEntry:
+            self.on_change_current_entry()
+
+    def is_dictionary_loaded(self):
+        return self._r.Dictionary is not None
+
+    def get_memory_report(self):
+        """Returns the memory diagnostics of the dictionary as text (see
+        memory_report)."""
+        return memory_report(self._r.Dictionary)
 
     def get_resources(self):
         return self._r
 
+    def get_lookup_cache(self):
+        return self._lookup_cache
+
     def get_state(self):
         return self._r.AppState
 
@@ -97,13 +192,12 @@ class AppLogic:
         self._r.CurrentEntry = None
         self._r.SelectedTranslationIndex = None
         self._r.SelectedTranslation = None
+        self._r.PossibleEntryTexts = None
         self._r.PossibleEntries = None
         self._r.CurrentTakobotoLink = None
 
     def on_change_original_clipboard_image(self):
         self._reset_entry_resources()
-        if self._r.AppState == AppState.LOADING_AND_PREPARING:
-            return
         self._r.AppState = AppState.INITIAL
         if self._r.OriginalClipboardImage:
             self._r.AppState = AppState.IMAGE_COPIED_NO_MARKING
@@ -116,10 +210,10 @@ class AppLogic:
             self._r.AppState = AppState.MARKING_GIVEN_NO_EXPR
 
     def on_change_current_entry(self):
-        if self._r.AppState == AppState.LOADING_AND_PREPARING:
-            return
         self._r.CurrentTakobotoLink = None
-        self._r.PossibleEntries = self._r.Dictionary.look_up(self._r.CurrentEntry)
+        lookup = self._look_up_candidates(self._r.CurrentEntry)
+        self._r.PossibleEntryTexts = lookup.texts
+        self._r.PossibleEntries = lookup.entries
         self._r.SelectedTranslationIndex = None
         self._r.SelectedTranslation = None
         if self._r.PossibleEntries and self._r.AppState in [
@@ -130,6 +224,84 @@ class AppLogic:
         elif self._r.AppState != AppState.INITIAL:
             self._r.AppState = AppState.MARKING_GIVEN_NO_EXPR
 
+    def _look_up_candidates(self, text):
+        """Returns the CachedLookup for text in the preferred language, from the
+        lookup cache if possible."""
+        if not text or self._r.Dictionary is None:
+            # not cached: set_dictionary() repeats the lookup
+            return CachedLookup([], [])
+        language = self._r.PreferredTranslationLanguage
+        lookup = self._lookup_cache.get(text, language)
+        if lookup is None:
+            entries = self._find_possible_entries(text)
+            lookup = CachedLookup(
+                entries, [entry.stringify(language) for entry in entries]
+            )
+            self._lookup_cache.put(text, language, lookup)
+        return lookup
+
+    def _find_possible_entries(self, text):
+        if not text:
+            return []
+        dictionary = self._r.Dictionary
+        if is_pattern(text):
+            return dictionary.look_up_pattern(text, MAX_CANDIDATES)
+        entries = {}
+        # exact matches, then other spellings (katakana/hiragana, long vowels),
+        # then dictionary forms of conjugated words, then longer
+        # words starting with the text, so that candidates show up while the
+        # expression is still being typed
+        for entry in itertools.chain(
+            dictionary.look_up(text),
+            dictionary.look_up_normalized(text),
+            (match.entry for match in look_up_deinflected(dictionary, text)),
+            dictionary.look_up_prefix(text, MAX_CANDIDATES),
+        ):
+            entries.setdefault(entry.unique_id, entry)
+            if len(entries) >= MAX_CANDIDATES:
+                break
+        if entries:
+            return list(entries.values())
+        # maybe a translation: reverse lookup in the preferred language
+        for language in dict.fromkeys((self._r.PreferredTranslationLanguage, "eng")):
+            found = dictionary.look_up_translation(text, language, MAX_CANDIDATES)
+            if found:
+                return found
+        # maybe a misread or misspelled word
+        found = dictionary.look_up_similar(text, MAX_CANDIDATES)
+        if found:
+            return found
+        # probably a whole phrase or sentence: offer the words found in it
+        return entries_in_text(dictionary, text, MAX_CANDIDATES)
+
+    def import_word_list(self, file_name):
+        """Looks up all words of the word list file_name and queues them for
+        show_next_imported_word(). Returns the imported words; raises OSError,
+        UnicodeDecodeError or csv.Error if the file cannot be read."""
+        words = import_word_list(self._r.Dictionary, file_name)
+        self._r.ImportedWords = tuple(words)
+        return words
+
+    def show_next_imported_word(self):
+        """Makes the next queued word the current expression, listing the entries
+        found for it on import. No screenshot is needed for it."""
+        if not self._r.ImportedWords:
+            return
+        word = self._r.ImportedWords[0]
+        self._r.ImportedWords = self._r.ImportedWords[1:]
+        language = self._r.PreferredTranslationLanguage
+        if word.entries:
+            self._lookup_cache.put(
+                word.text,
+                language,
+                CachedLookup(
+                    word.entries, [entry.stringify(language) for entry in word.entries]
+                ),
+            )
+        if self._r.AppState in [AppState.INITIAL, AppState.IMAGE_COPIED_NO_MARKING]:
+            self._r.AppState = AppState.MARKING_GIVEN_NO_EXPR
+        self._r.CurrentEntry = word.text
+
     def on_change_selected_translation_index(self):
         self._r.SelectedTranslation = None
         if self._r.SelectedTranslationIndex is not None:
@@ -140,6 +312,7 @@ class AppLogic:
                 self._r.AppState = AppState.ENTRY_SELECTED_READY_TO_TRANSFER
 
     def on_change_preferred_translation_language(self):
+        # glosses of a language not loaded so far follow via load_languages()
         current_entry = self._r.CurrentEntry
         self._r.CurrentEntry = ""
         self._r.CurrentEntry = current_entry
@@ -148,15 +321,22 @@ class AppLogic:
         to_be_stored = {
             "preferred_translation_language": self._r.PreferredTranslationLanguage,
             "tag": self._r.Tag,
+            "dictionary_backend": self._r.DictionaryBackend,
+            "preferred_languages_only": self._r.PreferredLanguagesOnly,
+            "dictionary_service": self._r.DictionaryService,
         }
         try:
             with open(APP_STATE_STORE_FILE, "wb") as pickle_file:
                 pickle.dump(to_be_stored, pickle_file)
         except Exception as e:
-            print("Could not save program state: %s" % e)
+            logger.warning("Could not save program state: %s", e)
 
     def read_stored_program_state(self):
         """Restores program settings."""
+        with TimedPhase("read_stored_program_state"):
+            self._read_stored_program_state()
+
+    def _read_stored_program_state(self):
         try:
             with open(APP_STATE_STORE_FILE, "rb") as pickle_file:
                 pickled_entity = pickle.load(pickle_file)
@@ -164,5 +344,14 @@ class AppLogic:
                     "preferred_translation_language"
                 ]
                 self._r.Tag = pickled_entity["tag"]
+                self._r.DictionaryBackend = pickled_entity.get(
+                    "dictionary_backend", DEFAULT_BACKEND
+                )
+                self._r.PreferredLanguagesOnly = pickled_entity.get(
+                    "preferred_languages_only", True
+                )
+                self._r.DictionaryService = pickled_entity.get(
+                    "dictionary_service", False
+                )
         except Exception as e:
-            print("Could not restore program state (normal for startup): %s" % e)
+            logger.info("Could not restore program state (normal for startup): %s", e)
@@ -0,0 +1,55 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Lookup of many expressions at once, e.g. of an imported word list.
+# Every step checks all expressions still unresolved in one batch:
+# exact readings first, then other spellings (see kana), then the
+# dictionary forms of conjugated words (see deinflector). Works with
+# every dictionary backend.
+######################################################################
+
+import typing
+
+try:
+    from .kana import normalize_kana
+    from .deinflector import look_up_deinflected_many
+except:
+    from kana import normalize_kana
+    from deinflector import look_up_deinflected_many
+
+
+def look_up_many(dictionary, texts: typing.Iterable[str]) -> typing.Dict[str, list]:
+    """Returns text -> entries for all distinct texts, in their order. The entries
+    are those of the first step finding any: the exact reading, other spellings,
+    or dictionary forms of a conjugated text. Texts without any get an empty
+    list."""
+    texts = list(dict.fromkeys(texts))
+    result = dict.fromkeys(texts)
+    entry_ids = dictionary.get_entry_ids_many(texts)
+    missing = [text for text in texts if text not in entry_ids]
+    # texts sharing a normalized spelling are looked up once
+    normalized_ids = {}
+    for text in missing:
+        normalized = normalize_kana(text)
+        if normalized not in normalized_ids:
+            normalized_ids[normalized] = dictionary.get_normalized_entry_ids(text)
+        if normalized_ids[normalized]:
+            entry_ids[text] = normalized_ids[normalized]
+    entries = {}
+
+    def get_entry(entry_id):
+        entry = entries.get(entry_id)
+        if entry is None:
+            entry = entries[entry_id] = dictionary.get_entry(entry_id)
+        return entry
+
+    for text, ids in entry_ids.items():
+        result[text] = [get_entry(entry_id) for entry_id in ids]
+    deinflected = look_up_deinflected_many(
+        dictionary, [text for text in texts if result[text] is None]
+    )
+    for text, matches in deinflected.items():
+        result[text] = [match.entry for match in matches]
+    return result
@@ -0,0 +1,40 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Small least-recently-used cache with a fixed maximal size.
+######################################################################
+
+import collections
+
+
+class BoundedCache:
+    """Maps keys to values, dropping the least recently used item once more than
+    max_size items are stored."""
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        try:
+            self._items.move_to_end(key)
+        except KeyError:
+            return default
+        return self._items[key]
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
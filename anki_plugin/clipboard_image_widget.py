@@ -14,10 +14,8 @@ from PyQt6.QtCore import Qt, QPoint, QUrl
 
 try:
     from .resources import Resources
-    from .app_logic import AppState
 except:
     from resources import Resources
-    from app_logic import AppState
 
 
 class ClipboardImageWidget(QWidget):
@@ -47,8 +45,6 @@ class ClipboardImageWidget(QWidget):
         return start_x, start_y, width, height
 
     def on_clipboard_changed(self):
-        if self._r.AppState == AppState.LOADING_AND_PREPARING:
-            return
         mime_data = self.clipboard.mimeData()
         if mime_data.hasImage():
             # Retrieve image data
@@ -0,0 +1,313 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Rule-based deinflection of Japanese verbs and adjectives: an
+# inflected word is turned into candidate dictionary forms, each with
+# the chain of inflections leading to it. Every rule says which word
+# types it applies to and which word type its result has; candidates
+# are checked against the part-of-speech tags of the found entries.
+# The rules are compiled once into a table keyed by suffix.
+######################################################################
+
+import typing
+
+# word types; the last two are intermediate forms only
+ICHIDAN = 1 << 0
+GODAN = 1 << 1
+SURU = 1 << 2
+KURU = 1 << 3
+ADJ_I = 1 << 4
+ADJ_NA = 1 << 5
+SURU_NOUN = 1 << 6
+TE_FORM = 1 << 7
+MASU_FORM = 1 << 8
+ANY = (1 << 9) - 1
+
+
+class _Rule(typing.NamedTuple):
+    base: str
+    types_in: int
+    types_out: int
+    reason: str
+
+
+class Deinflection(typing.NamedTuple):
+    """Candidate dictionary form word of an inflected text. types are the word types
+    the dictionary entry has to have, reasons the inflections applied to word, from
+    the innermost to the outermost."""
+
+    word: str
+    types: int
+    reasons: tuple
+
+
+class DeinflectedEntry(typing.NamedTuple):
+    entry: typing.Any
+    word: str
+    reasons: tuple
+
+
+# godan verb endings: dictionary form, i-stem, a-stem, e-stem, o-stem, te-form
+_GODAN_ROWS = [
+    ("く", "き", "か", "け", "こ", "いて"),
+    ("ぐ", "ぎ", "が", "げ", "ご", "いで"),
+    ("す", "し", "さ", "せ", "そ", "して"),
+    ("つ", "ち", "た", "て", "と", "って"),
+    ("ぬ", "に", "な", "ね", "の", "んで"),
+    ("ぶ", "び", "ば", "べ", "ぼ", "んで"),
+    ("む", "み", "ま", "め", "も", "んで"),
+    ("る", "り", "ら", "れ", "ろ", "って"),
+    ("う", "い", "わ", "え", "お", "って"),
+]
+
+
+def _past(te_form):
+    return te_form[:-1] + ("た" if te_form.endswith("て") else "だ")
+
+
+def _te_and_past_rules(te_form, base, types_out):
+    """Rules for te-form, past, conditional (-tara) and -tari of one word class."""
+    past = _past(te_form)
+    return [
+        (te_form, base, TE_FORM, types_out, "te"),
+        (past, base, ANY, types_out, "past"),
+        (past + "ら", base, ANY, types_out, "conditional (-tara)"),
+        (past + "り", base, ANY, types_out, "-tari"),
+    ]
+
+
+def _godan_rules():
+    rules = []
+    for base, i_stem, a_stem, e_stem, o_stem, te_form in _GODAN_ROWS:
+        rules += [
+            (a_stem + "ない", base, ADJ_I, GODAN, "negative"),
+            (a_stem + "ず", base, ANY, GODAN, "negative (-zu)"),
+            (i_stem + "ます", base, MASU_FORM, GODAN, "polite"),
+            (i_stem + "たい", base, ADJ_I, GODAN, "-tai"),
+            (e_stem + "る", base, ICHIDAN, GODAN, "potential"),
+            (a_stem + "れる", base, ICHIDAN, GODAN, "passive"),
+            (a_stem + "せる", base, ICHIDAN, GODAN, "causative"),
+            (e_stem + "ば", base, ANY, GODAN, "conditional"),
+            (e_stem, base, ANY, GODAN, "imperative"),
+            (o_stem + "う", base, ANY, GODAN, "volitional"),
+        ]
+        rules += _te_and_past_rules(te_form, base, GODAN)
+    # 行く is the only godan verb with an irregular te-form
+    for stem in ("行", "い"):
+        rules += _te_and_past_rules(stem + "って", stem + "く", GODAN)
+    return rules
+
+
+def _ichidan_rules():
+    rules = [
+        ("ない", "る", ADJ_I, ICHIDAN, "negative"),
+        ("ず", "る", ANY, ICHIDAN, "negative (-zu)"),
+        ("ます", "る", MASU_FORM, ICHIDAN, "polite"),
+        ("たい", "る", ADJ_I, ICHIDAN, "-tai"),
+        ("られる", "る", ICHIDAN, ICHIDAN, "potential or passive"),
+        ("れる", "る", ICHIDAN, ICHIDAN, "potential (colloquial)"),
+        ("させる", "る", ICHIDAN, ICHIDAN, "causative"),
+        ("れば", "る", ANY, ICHIDAN, "conditional"),
+        ("ろ", "る", ANY, ICHIDAN, "imperative"),
+        ("よ", "る", ANY, ICHIDAN, "imperative"),
+        ("よう", "る", ANY, ICHIDAN, "volitional"),
+    ]
+    return rules + _te_and_past_rules("て", "る", ICHIDAN)
+
+
+def _suru_rules():
+    rules = [
+        ("しない", "する", ADJ_I, SURU, "negative"),
+        ("せず", "する", ANY, SURU, "negative (-zu)"),
+        ("します", "する", MASU_FORM, SURU, "polite"),
+        ("したい", "する", ADJ_I, SURU, "-tai"),
+        ("される", "する", ICHIDAN, SURU, "passive"),
+        ("させる", "する", ICHIDAN, SURU, "causative"),
+        ("すれば", "する", ANY, SURU, "conditional"),
+        ("しろ", "する", ANY, SURU, "imperative"),
+        ("せよ", "する", ANY, SURU, "imperative"),
+        ("しよう", "する", ANY, SURU, "volitional"),
+        # nouns taking する, e.g. 勉強する
+        ("する", "", SURU, SURU_NOUN, "suru verb"),
+    ]
+    return rules + _te_and_past_rules("して", "する", SURU)
+
+
+def _kuru_rules():
+    rules = []
+    for ko, ki, ku in (("こ", "き", "く"), ("来", "来", "来")):
+        base = ku + "る"
+        rules += [
+            (ko + "ない", base, ADJ_I, KURU, "negative"),
+            (ko + "ず", base, ANY, KURU, "negative (-zu)"),
+            (ki + "ます", base, MASU_FORM, KURU, "polite"),
+            (ki + "たい", base, ADJ_I, KURU, "-tai"),
+            (ko + "られる", base, ICHIDAN, KURU, "potential or passive"),
+            (ko + "させる", base, ICHIDAN, KURU, "causative"),
+            (ku + "れば", base, ANY, KURU, "conditional"),
+            (ko + "い", base, ANY, KURU, "imperative"),
+            (ko + "よう", base, ANY, KURU, "volitional"),
+        ]
+        rules += _te_and_past_rules(ki + "て", base, KURU)
+    return rules
+
+
+def _auxiliary_rules():
+    rules = [
+        ("ました", "ます", ANY, MASU_FORM, "past"),
+        ("ません", "ます", ANY, MASU_FORM, "negative"),
+        ("ませんでした", "ます", ANY, MASU_FORM, "past negative"),
+        ("ましょう", "ます", ANY, MASU_FORM, "volitional"),
+        ("まして", "ます", ANY, MASU_FORM, "te"),
+    ]
+    for te in ("て", "で"):
+        rules += [
+            (te + "いる", te, ICHIDAN, TE_FORM, "progressive"),
+            (te + "る", te, ICHIDAN, TE_FORM, "progressive (colloquial)"),
+            (te + "しまう", te, GODAN, TE_FORM, "-shimau"),
+            (te + "おく", te, GODAN, TE_FORM, "-oku"),
+        ]
+    rules += [
+        ("ちゃう", "て", GODAN, TE_FORM, "-chau"),
+        ("じゃう", "で", GODAN, TE_FORM, "-chau"),
+        ("とく", "て", GODAN, TE_FORM, "-oku (colloquial)"),
+        ("どく", "で", GODAN, TE_FORM, "-oku (colloquial)"),
+    ]
+    return rules
+
+
+def _adjective_rules():
+    rules = [
+        ("くない", "い", ADJ_I, ADJ_I, "negative"),
+        ("かった", "い", ANY, ADJ_I, "past"),
+        ("かったら", "い", ANY, ADJ_I, "conditional (-tara)"),
+        ("かったり", "い", ANY, ADJ_I, "-tari"),
+        ("ければ", "い", ANY, ADJ_I, "conditional"),
+        ("くて", "い", ANY, ADJ_I, "te"),
+        ("く", "い", ANY, ADJ_I, "adverb"),
+        ("さ", "い", ANY, ADJ_I, "noun"),
+        ("すぎる", "い", ICHIDAN, ADJ_I, "too"),
+    ]
+    # na-adjectives followed by forms of the copula
+    for copula in ("だ", "で", "な", "に", "だった", "です", "でした"):
+        rules.append((copula, "", ANY, ADJ_NA, "copula"))
+    for copula in ("じゃない", "ではない"):
+        rules.append((copula, "", ADJ_I, ADJ_NA, "copula (negative)"))
+    return rules
+
+
+def _compile_rules():
+    table = {}
+    for rule_list in (
+        _godan_rules(),
+        _ichidan_rules(),
+        _suru_rules(),
+        _kuru_rules(),
+        _auxiliary_rules(),
+        _adjective_rules(),
+    ):
+        for inflected, base, types_in, types_out, reason in rule_list:
+            table.setdefault(inflected, []).append(
+                _Rule(base, types_in, types_out, reason)
+            )
+    return {inflected: tuple(rules) for inflected, rules in table.items()}
+
+
+_RULES = _compile_rules()
+_MAX_SUFFIX_LENGTH = max(len(inflected) for inflected in _RULES)
+
+_TAG_TYPES = {
+    "vs-i": SURU,
+    "vs-s": SURU,
+    "vs": SURU_NOUN,
+    "vk": KURU,
+    "adj-i": ADJ_I,
+    "adj-ix": ADJ_I,
+    "adj-na": ADJ_NA,
+}
+
+
+def _tag_types(tag):
+    if tag.startswith("v1"):
+        return ICHIDAN
+    if tag.startswith("v5"):
+        return GODAN
+    return _TAG_TYPES.get(tag, 0)
+
+
+def deinflect(text: str) -> typing.List[Deinflection]:
+    """Returns all candidate dictionary forms of text reachable by the rules (not
+    including text itself)."""
+    candidates = [Deinflection(text, ANY, ())]
+    seen = {(text, ANY)}
+    index = 0
+    while index < len(candidates):
+        word, types, reasons = candidates[index]
+        index += 1
+        for length in range(min(len(word), _MAX_SUFFIX_LENGTH), 0, -1):
+            for rule in _RULES.get(word[-length:], ()):
+                if not types & rule.types_in:
+                    continue
+                base = word[:-length] + rule.base
+                if not base or (base, rule.types_out) in seen:
+                    continue
+                seen.add((base, rule.types_out))
+                candidates.append(
+                    Deinflection(base, rule.types_out, (rule.reason,) + reasons)
+                )
+    return candidates[1:]
+
+
+def has_word_type(entry, types: int) -> bool:
+    """Checks whether one of the parts of speech of the entry is one of types."""
+    return any(
+        _tag_types(tag) & types
+        for part_of_speech, _ in entry.senses
+        for tag in part_of_speech
+    )
+
+
+def _deinflected_entries(dictionary, candidates, entry_ids):
+    result = []
+    seen = set()
+    for word, types, reasons in candidates:
+        for entry_id in entry_ids.get(word, ()):
+            if entry_id in seen:
+                continue
+            entry = dictionary.get_entry(entry_id)
+            if has_word_type(entry, types):
+                seen.add(entry_id)
+                result.append(DeinflectedEntry(entry, word, reasons))
+    return result
+
+
+def look_up_deinflected(dictionary, text: str) -> typing.List[DeinflectedEntry]:
+    """Returns the entries of all dictionary forms of text, checked against the
+    dictionary in one batch and filtered by their part of speech. Each entry is
+    returned once, with the shortest inflection chain leading to it."""
+    candidates = deinflect(text)
+    entry_ids = dictionary.get_entry_ids_many(
+        {candidate.word for candidate in candidates}
+    )
+    return _deinflected_entries(dictionary, candidates, entry_ids)
+
+
+def look_up_deinflected_many(
+    dictionary, texts: typing.Iterable[str]
+) -> typing.Dict[str, typing.List[DeinflectedEntry]]:
+    """Returns text -> look_up_deinflected(dictionary, text) for all texts, checking
+    the dictionary forms of all texts in a single batch."""
+    candidates = {text: deinflect(text) for text in texts}
+    entry_ids = dictionary.get_entry_ids_many(
+        {
+            candidate.word
+            for text_candidates in candidates.values()
+            for candidate in text_candidates
+        }
+    )
+    return {
+        text: _deinflected_entries(dictionary, text_candidates, entry_ids)
+        for text, text_candidates in candidates.items()
+    }
@@ -0,0 +1,802 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Compact, memory-mapped on-disk format for the dictionary.
+# The file consists of a small JSON header followed by flat arrays:
+# a string table (offsets + UTF-8 data), the encoded entries
+# (offsets + uint32 data referring to the string table), their ranks
+# (see entry_rank) and the hashes of their JSON text (see dict_update),
+# sorted key indexes (key string ids, posting offsets, entry ids) for the
+# readings, their normalized spellings and the words of the glosses
+# of every language (with the rank of every posting), a bigram index
+# of the readings for approximate matches and a suffix array of the
+# readings for wildcard search.
+# Opening the file only maps it; entries are decoded on lookup.
+# For a new release of the JSON file, the encoded entries of the
+# unchanged words are copied into the new file, and only the new and
+# changed words are decoded (see update_binary_dictionary()).
+######################################################################
+
+import array
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+
+try:
+    from .dict_lookup import (
+        DictionaryEntry,
+        DictionaryLookup,
+        DICT_FILE_NAME,
+        ENTRY_CACHE_SIZE,
+    )
+    from .bounded_cache import BoundedCache
+    from .dict_cache import (
+        atomic_write,
+        current_file,
+        source_fingerprint,
+        source_matches,
+    )
+    from .dict_update import REMOVED, diff_entries, remap_postings, scan_words
+    from .entry_rank import FREQUENCY_FILE_NAME
+    from .sorted_keys import matching_prefixes, prefix_range, take_distinct
+    from .kana import normalize_kana
+    from .gloss_index import (
+        build_gloss_index,
+        find_ranked,
+        tokenize,
+        update_gloss_index,
+    )
+    from .fuzzy_index import build_gram_index, find_similar
+    from .batch_lookup import look_up_many
+    from .wildcard_index import (
+        SuffixArray,
+        build_suffix_array,
+        find_matching_keys,
+        parse_pattern,
+        update_suffix_array,
+    )
+except:
+    from dict_lookup import (
+        DictionaryEntry,
+        DictionaryLookup,
+        DICT_FILE_NAME,
+        ENTRY_CACHE_SIZE,
+    )
+    from bounded_cache import BoundedCache
+    from dict_cache import (
+        atomic_write,
+        current_file,
+        source_fingerprint,
+        source_matches,
+    )
+    from dict_update import REMOVED, diff_entries, remap_postings, scan_words
+    from entry_rank import FREQUENCY_FILE_NAME
+    from sorted_keys import matching_prefixes, prefix_range, take_distinct
+    from kana import normalize_kana
+    from gloss_index import (
+        build_gloss_index,
+        find_ranked,
+        tokenize,
+        update_gloss_index,
+    )
+    from fuzzy_index import build_gram_index, find_similar
+    from batch_lookup import look_up_many
+    from wildcard_index import (
+        SuffixArray,
+        build_suffix_array,
+        find_matching_keys,
+        parse_pattern,
+        update_suffix_array,
+    )
+
+logger = logging.getLogger(__name__)
+
+BINARY_FILE_NAME = "%s/%s" % (os.path.dirname(__file__), "jmdict-all-3.5.0.json.bin")
+
+MAGIC = b"MANGANKI"
+FORMAT_VERSION = 9
+_HEADER_LENGTH = struct.Struct("<I")
+_ALIGNMENT = 8
+
+
+class _StringTable:
+    """Collects unique strings while writing; each string gets a consecutive id."""
+
+    def __init__(self):
+        self._ids = {}
+        self._strings = []
+
+    def add(self, text: str) -> int:
+        string_id = self._ids.get(text)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._ids[text] = string_id
+            self._strings.append(text)
+        return string_id
+
+    def to_arrays(self):
+        offsets = array.array("I", [0])
+        data = bytearray()
+        for text in self._strings:
+            data += text.encode("utf-8")
+            offsets.append(len(data))
+        return offsets, data
+
+
+def _encode_entry(entry: DictionaryEntry, strings: _StringTable, data: array.array):
+    data.append(strings.add(entry.unique_id))
+    data.append(len(entry.kanji_readings))
+    data.extend(strings.add(reading) for reading in entry.kanji_readings)
+    data.append(len(entry.kana_readings))
+    data.extend(strings.add(reading) for reading in entry.kana_readings)
+    data.append(len(entry.senses))
+    for part_of_speech, glosses in entry.senses:
+        data.append(len(part_of_speech))
+        data.extend(strings.add(tag) for tag in part_of_speech)
+        data.append(len(glosses))
+        data.extend(strings.add(text) for text in glosses)
+
+
+def _index_sections(name, strings, keys, get_entry_ids, get_ranks=None):
+    """Returns the sections of an index from the given keys to entry ids: string ids
+    of the keys sorted by their UTF-8 encoding, offsets into the postings, and the
+    postings (entry ids) themselves, plus their ranks if get_ranks is given."""
+    index_keys = array.array("I")
+    index_offsets = array.array("I", [0])
+    index_postings = array.array("I")
+    index_ranks = array.array("I")
+    for _, key in sorted((key.encode("utf-8"), key) for key in keys):
+        index_keys.append(strings.add(key))
+        index_postings.extend(get_entry_ids(key))
+        index_offsets.append(len(index_postings))
+        if get_ranks is not None:
+            index_ranks.extend(get_ranks(key))
+    sections = [
+        (name + "_keys", index_keys),
+        (name + "_offsets", index_offsets),
+        (name + "_postings", index_postings),
+    ]
+    if get_ranks is not None:
+        sections.append((name + "_ranks", index_ranks))
+    return sections
+
+
+def _gloss_index_sections(language, index, strings):
+    return _index_sections(
+        "gloss_" + language,
+        strings,
+        index.keys(),
+        lambda word: index[word][0],
+        lambda word: index[word][1],
+    )
+
+
+def write_binary_dictionary(dictionary, file_name=BINARY_FILE_NAME):
+    """Writes the entries and indexes of a DictionaryLookup into file_name, in the
+    format read by BinaryDictionary."""
+    strings = _StringTable()
+    entry_offsets = array.array("I", [0])
+    entry_data = array.array("I")
+    entry_ranks = array.array("I")
+    for entry_id, entry in enumerate(dictionary.get_entries()):
+        _encode_entry(entry, strings, entry_data)
+        entry_offsets.append(len(entry_data))
+        entry_ranks.append(dictionary.get_entry_rank(entry_id))
+    _write_dictionary(
+        file_name,
+        strings,
+        [
+            ("entry_offsets", entry_offsets),
+            ("entry_data", entry_data),
+            ("entry_ranks", entry_ranks),
+            ("entry_hashes", dictionary.get_entry_hashes() or array.array("Q")),
+        ],
+        (dictionary.get_keys(), dictionary.get_entry_ids),
+        (dictionary.get_normalized_keys(), dictionary.get_variant_entry_ids),
+        (
+            (language, build_gloss_index(dictionary.get_entries(), language))
+            for language in sorted(dictionary.get_languages())
+        ),
+        {
+            "languages": sorted(dictionary.get_languages()),
+            "source": dictionary.get_source(),
+            "frequency_source": dictionary.get_frequency_source(),
+        },
+    )
+
+
+def _write_dictionary(
+    file_name,
+    strings,
+    entry_sections,
+    readings,
+    normalized,
+    gloss_indexes,
+    metadata,
+    suffix_array=None,
+):
+    """Writes the encoded entries, with the index sections built from readings and
+    normalized ((keys, key -> entry ids) each) and the (language, gloss index) pairs
+    gloss_indexes. The suffix array of the readings is built unless given."""
+    index_sections = _index_sections("index", strings, *readings)
+    index_sections += _index_sections("normalized", strings, *normalized)
+    # one language at a time, as the index of every language takes far more memory
+    # than its sections
+    for language, index in gloss_indexes:
+        index_sections += _gloss_index_sections(language, index, strings)
+        del index
+    keys = readings[0]
+    # postings are positions in the reading index, i.e. in the sorted readings
+    gram_index = build_gram_index(sorted(keys, key=lambda key: key.encode("utf-8")))
+    index_sections += _index_sections(
+        "grams", strings, gram_index.keys(), gram_index.__getitem__
+    )
+    if suffix_array is None:
+        # with byte offsets into the UTF-8 encoded readings
+        suffix_array = build_suffix_array(sorted(key.encode("utf-8") for key in keys))
+    index_sections += [
+        ("suffix_positions", suffix_array[0]),
+        ("suffix_offsets", suffix_array[1]),
+    ]
+    string_offsets, string_data = strings.to_arrays()
+    sections = (
+        [("string_offsets", string_offsets), ("string_data", string_data)]
+        + entry_sections
+        + index_sections
+    )
+    _write_sections(file_name, sections, metadata)
+
+
+def _write_sections(file_name, sections, metadata):
+    payloads = []
+    directory = {}
+    position = 0
+    for name, values in sections:
+        payload = values.tobytes() if isinstance(values, array.array) else bytes(values)
+        typecode = values.typecode if isinstance(values, array.array) else "B"
+        directory[name] = [position, len(payload), typecode]
+        padding = -len(payload) % _ALIGNMENT
+        payloads.append(payload + b"\0" * padding)
+        position += len(payload) + padding
+    header = dict(metadata)
+    header["version"] = FORMAT_VERSION
+    header["byteorder"] = sys.byteorder
+    header["sections"] = directory
+    header["data_length"] = position
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (
+        -(len(MAGIC) + _HEADER_LENGTH.size + len(header_bytes)) % _ALIGNMENT
+    )
+    with atomic_write(file_name) as temp_name:
+        with open(temp_name, "wb") as binary_file:
+            binary_file.write(MAGIC)
+            binary_file.write(_HEADER_LENGTH.pack(len(header_bytes)))
+            binary_file.write(header_bytes)
+            for payload in payloads:
+                binary_file.write(payload)
+
+
+def update_binary_dictionary(
+    dictionary,
+    source_file_name=DICT_FILE_NAME,
+    source=None,
+    file_name=BINARY_FILE_NAME,
+):
+    """Writes the content of the BinaryDictionary, updated to the current content of
+    source_file_name (see dict_update), into file_name; source is the
+    DictionarySource of the file (None for JMdict). Only new and changed words are
+    decoded from the JSON file; the other entries are copied in their encoded form,
+    and the indexes are patched. The file is the same as the one written for a
+    dictionary built from scratch.
+    Returns False if the dictionary has to be built from scratch instead, e.g.
+    because the frequency list has changed, which affects all ranks."""
+    entry_hashes = dictionary.get_entry_hashes()
+    if entry_hashes is None or not source_matches(
+        dictionary.get_frequency_source(), FREQUENCY_FILE_NAME
+    ):
+        return False
+    spans = scan_words(source_file_name)
+    if spans is None:
+        return False
+    diff = diff_entries(entry_hashes, spans)
+    if not diff.in_order:
+        return False
+    added = DictionaryLookup(source=source)
+    if not added.add_words_from_file(
+        source_file_name, [spans[entry_id] for entry_id in diff.added_ids]
+    ):
+        return False
+    dictionary._write_updated(file_name, source_file_name, spans, diff, added)
+    return True
+
+
+def _string_positions(record):
+    """Returns the positions of the string ids in an entry encoded by
+    _encode_entry()."""
+    positions = [0]
+    position = 1
+    # kanji and kana readings
+    for _ in range(2):
+        count = record[position]
+        positions.extend(range(position + 1, position + 1 + count))
+        position += 1 + count
+    sense_count = record[position]
+    position += 1
+    # part-of-speech tags and glosses of every sense
+    for _ in range(2 * sense_count):
+        count = record[position]
+        positions.extend(range(position + 1, position + 1 + count))
+        position += 1 + count
+    return positions
+
+
+def _add_postings(index, postings, ranks):
+    """Adds the (key, entry id) pairs postings to the key -> entry ids index and
+    orders the changed postings by rank, as in a dictionary built from scratch."""
+    changed = set()
+    for key, entry_id in postings:
+        index.setdefault(key, []).append(entry_id)
+        changed.add(key)
+    for key in changed:
+        index[key].sort(key=lambda entry_id: (ranks[entry_id], entry_id))
+    return index
+
+
+class _SortedIndex:
+    """Index written by _index_sections(). Acts as read-only sequence of its sorted
+    keys as UTF-8 bytes, so that bisect can search the mapped file directly."""
+
+    def __init__(self, dictionary, sections, name):
+        self._dictionary = dictionary
+        self._keys = dictionary._section(sections, name + "_keys")
+        self._offsets = dictionary._section(sections, name + "_offsets")
+        self._postings = dictionary._section(sections, name + "_postings")
+        self._ranks = None
+        if name + "_ranks" in sections:
+            self._ranks = dictionary._section(sections, name + "_ranks")
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __getitem__(self, position):
+        return self._dictionary._string_bytes(self._keys[position])
+
+    def postings(self, position):
+        return self._postings[self._offsets[position] : self._offsets[position + 1]]
+
+    def to_dict(self):
+        """Returns key -> entry ids, or key -> (entry ids, ranks) for an index with
+        ranks, as arrays."""
+        offsets = self._offsets.tolist()
+        postings = array.array("I", self._postings.tobytes())
+        ranks = None
+        if self._ranks is not None:
+            ranks = array.array("I", self._ranks.tobytes())
+        result = {}
+        for key, start, end in zip(self._keys, offsets, offsets[1:]):
+            key = self._dictionary._string(key)
+            if ranks is None:
+                result[key] = postings[start:end]
+            else:
+                result[key] = postings[start:end], ranks[start:end]
+        return result
+
+    def _find(self, text):
+        key = text.encode("utf-8")
+        position = bisect.bisect_left(self, key)
+        if position == len(self) or self[position] != key:
+            return None
+        return position
+
+    def get(self, text):
+        """Returns the entry ids stored for the key text."""
+        position = self._find(text)
+        return [] if position is None else list(self.postings(position))
+
+    def get_ranked(self, text):
+        """Returns (entry ids, ranks) stored for the key text, or None."""
+        position = self._find(text)
+        if position is None:
+            return None
+        start, end = self._offsets[position], self._offsets[position + 1]
+        return self._postings[start:end], self._ranks[start:end]
+
+
+class BinaryDictionary:
+    """Read-only dictionary backed by a memory-mapped file written by
+    write_binary_dictionary(). Provides the same look_up()/get_languages() interface
+    as DictionaryLookup; only entries that are looked up get decoded, and recently
+    used ones are kept in a bounded cache."""
+
+    def __init__(self, file_name=BINARY_FILE_NAME):
+        self._file = open(file_name, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._views = []
+            header = self._read_header()
+            self._languages = set(header["languages"])
+            self._source = header["source"]
+            self._frequency_source = header["frequency_source"]
+            sections = header["sections"]
+            self._string_offsets = self._section(sections, "string_offsets")
+            self._string_data = self._section(sections, "string_data")
+            self._entry_offsets = self._section(sections, "entry_offsets")
+            self._entry_data = self._section(sections, "entry_data")
+            self._entry_ranks = self._section(sections, "entry_ranks")
+            self._entry_hashes = self._section(sections, "entry_hashes")
+            self._keys = _SortedIndex(self, sections, "index")
+            self._normalized_keys = _SortedIndex(self, sections, "normalized")
+            self._grams = _SortedIndex(self, sections, "grams")
+            self._suffix_sections = (
+                self._section(sections, "suffix_positions"),
+                self._section(sections, "suffix_offsets"),
+            )
+            self._suffixes = SuffixArray(self._keys, *self._suffix_sections)
+            self._gloss_indexes = {
+                language: _SortedIndex(self, sections, "gloss_" + language)
+                for language in self._languages
+            }
+        except Exception:
+            self.close()
+            raise
+        self._tags = {}
+        self._entry_cache = BoundedCache(ENTRY_CACHE_SIZE)
+
+    def _read_header(self):
+        if self._map[: len(MAGIC)] != MAGIC:
+            raise ValueError("Not a MangAnki dictionary file.")
+        start = len(MAGIC) + _HEADER_LENGTH.size
+        (header_length,) = _HEADER_LENGTH.unpack_from(self._map, len(MAGIC))
+        header = json.loads(self._map[start : start + header_length].decode("utf-8"))
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError(
+                "Unsupported dictionary file version %s." % header["version"]
+            )
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError("Dictionary file was written on a different platform.")
+        self._data_start = start + header_length
+        if self._data_start + header["data_length"] != len(self._map):
+            raise ValueError("Dictionary file has the wrong size.")
+        return header
+
+    def _section(self, sections, name):
+        offset, length, typecode = sections[name]
+        start = self._data_start + offset
+        if start + length > len(self._map):
+            raise ValueError("Dictionary file is truncated.")
+        view = memoryview(self._map)[start : start + length]
+        self._views.append(view)
+        if typecode != "B":
+            view = view.cast(typecode)
+            self._views.append(view)
+        return view
+
+    def close(self):
+        for view in reversed(getattr(self, "_views", [])):
+            view.release()
+        self._views = []
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __getstate__(self):
+        raise TypeError("BinaryDictionary cannot be pickled; re-open the file instead.")
+
+    def _string_bytes(self, string_id):
+        return bytes(
+            self._string_data[
+                self._string_offsets[string_id] : self._string_offsets[string_id + 1]
+            ]
+        )
+
+    def _string(self, string_id):
+        return str(
+            self._string_data[
+                self._string_offsets[string_id] : self._string_offsets[string_id + 1]
+            ],
+            "utf-8",
+        )
+
+    def _tag(self, string_id):
+        """Decodes language codes and part-of-speech tags, which are shared by many
+        entries, only once."""
+        tag = self._tags.get(string_id)
+        if tag is None:
+            tag = sys.intern(self._string(string_id))
+            self._tags[string_id] = tag
+        return tag
+
+    def _decode_entry(self, entry_id):
+        data = self._entry_data
+        position = self._entry_offsets[entry_id]
+        unique_id = self._string(data[position])
+        position += 1
+        count = data[position]
+        kanji_readings = [
+            self._string(string_id)
+            for string_id in data[position + 1 : position + 1 + count]
+        ]
+        position += 1 + count
+        count = data[position]
+        kana_readings = [
+            self._string(string_id)
+            for string_id in data[position + 1 : position + 1 + count]
+        ]
+        position += 1 + count
+        senses = []
+        for _ in range(data[position]):
+            count = data[position + 1]
+            part_of_speech = tuple(
+                self._tag(string_id)
+                for string_id in data[position + 2 : position + 2 + count]
+            )
+            position += 2 + count
+            count = data[position]
+            glosses = []
+            for index in range(position + 1, position + 1 + count, 2):
+                glosses.append(self._tag(data[index]))
+                glosses.append(self._string(data[index + 1]))
+            senses.append((part_of_speech, tuple(glosses)))
+            position += count
+        return DictionaryEntry(
+            unique_id=unique_id,
+            kanji_readings=kanji_readings,
+            kana_readings=kana_readings,
+            senses=senses,
+        )
+
+    def get_languages(self):
+        return self._languages
+
+    def load_languages(self, languages=None):
+        """All glosses are read from the file on lookup, nothing to load."""
+        return True
+
+    def get_source(self):
+        """Returns the fingerprint of the JSON file the dictionary was built from."""
+        return self._source
+
+    def get_frequency_source(self):
+        """Returns the fingerprint of the frequency list the ranks are based on."""
+        return self._frequency_source
+
+    def get_entry_rank(self, entry_id):
+        """Returns the rank of the entry (see entry_rank); lower is better."""
+        return self._entry_ranks[entry_id]
+
+    def get_entry_hashes(self):
+        """Returns entry id -> hash of the word's JSON text (see dict_update), or None
+        if unknown."""
+        if len(self._entry_hashes) != len(self._entry_ranks):
+            return None
+        return self._entry_hashes
+
+    def _copy_entry(self, entry_id, strings, string_ids, data):
+        """Appends the encoded entry to data, with its strings added to strings;
+        string_ids maps the string ids of this file to those of strings."""
+        record = self._entry_data[
+            self._entry_offsets[entry_id] : self._entry_offsets[entry_id + 1]
+        ].tolist()
+        for position in _string_positions(record):
+            string_id = string_ids.get(record[position])
+            if string_id is None:
+                string_id = strings.add(self._string(record[position]))
+                string_ids[record[position]] = string_id
+            record[position] = string_id
+        data.extend(record)
+
+    def _write_updated(self, file_name, source_file_name, spans, diff, added):
+        """Writes the dictionary updated by the EntryDiff diff to the words at spans,
+        the new and changed ones of which are in the DictionaryLookup added, see
+        update_binary_dictionary()."""
+        # entries of added are numbered in the order of their new ids
+        added_ids = diff.added_ids
+        added_entries = list(added.get_entries())
+        old_ids = array.array("i", [REMOVED]) * len(spans)
+        for old_id, new_id in enumerate(diff.new_ids):
+            if new_id != REMOVED:
+                old_ids[new_id] = old_id
+        strings = _StringTable()
+        string_ids = {}
+        entry_offsets = array.array("I", [0])
+        entry_data = array.array("I")
+        entry_ranks = array.array("I")
+        numbers = iter(range(len(added_ids)))
+        for old_id in old_ids:
+            if old_id == REMOVED:
+                number = next(numbers)
+                _encode_entry(added_entries[number], strings, entry_data)
+                entry_ranks.append(added.get_entry_rank(number))
+            else:
+                self._copy_entry(old_id, strings, string_ids, entry_data)
+                entry_ranks.append(self._entry_ranks[old_id])
+            entry_offsets.append(len(entry_data))
+        added_readings = []
+        added_variants = []
+        for reading in added.get_keys():
+            entry_ids = [added_ids[number] for number in added.get_entry_ids(reading)]
+            added_readings += ((reading, entry_id) for entry_id in entry_ids)
+            normalized = normalize_kana(reading)
+            if normalized != reading:
+                added_variants += ((normalized, entry_id) for entry_id in entry_ids)
+        readings = _add_postings(
+            remap_postings(self._keys.to_dict(), diff.new_ids),
+            added_readings,
+            entry_ranks,
+        )
+        variants = _add_postings(
+            remap_postings(self._normalized_keys.to_dict(), diff.new_ids),
+            added_variants,
+            entry_ranks,
+        )
+        languages = self._languages | added.get_languages()
+        added_pairs = list(zip(added_ids, added_entries))
+        gloss_indexes = (
+            (
+                language,
+                update_gloss_index(
+                    (
+                        self._gloss_indexes[language].to_dict()
+                        if language in self._gloss_indexes
+                        else {}
+                    ),
+                    diff.new_ids,
+                    added_pairs,
+                    language,
+                ),
+            )
+            for language in sorted(languages)
+        )
+        # with byte offsets into the UTF-8 encoded readings, as written
+        old_keys = [self._keys[position] for position in range(len(self._keys))]
+        keys = sorted(key.encode("utf-8") for key in readings)
+        suffix_array = [
+            array.array(section.format, section.tobytes())
+            for section in self._suffix_sections
+        ]
+        if keys != old_keys:
+            suffix_array = update_suffix_array(old_keys, keys, suffix_array)
+        _write_dictionary(
+            file_name,
+            strings,
+            [
+                ("entry_offsets", entry_offsets),
+                ("entry_data", entry_data),
+                ("entry_ranks", entry_ranks),
+                ("entry_hashes", array.array("Q", (span.digest for span in spans))),
+            ],
+            (readings.keys(), readings.__getitem__),
+            (variants.keys(), variants.__getitem__),
+            gloss_indexes,
+            {
+                "languages": sorted(languages),
+                "source": source_fingerprint(source_file_name),
+                "frequency_source": added.get_frequency_source(),
+            },
+            suffix_array,
+        )
+
+    def get_entry(self, entry_id):
+        entry = self._entry_cache.get(entry_id)
+        if entry is None:
+            entry = self._decode_entry(entry_id)
+            self._entry_cache.put(entry_id, entry)
+        return entry
+
+    def get_entry_ids(self, text):
+        return self._keys.get(text)
+
+    def get_normalized_entry_ids(self, text):
+        """Returns the ids of the entries with a reading that has the same normalized
+        spelling (see normalize_kana()) as text."""
+        normalized = normalize_kana(text)
+        return take_distinct(
+            (self._keys.get(normalized), self._normalized_keys.get(normalized)),
+            sys.maxsize,
+        )
+
+    def look_up_normalized(self, text):
+        """Like look_up(), but ignoring differences between katakana and hiragana,
+        small and normal sized kana and long vowel marks."""
+        return [
+            self.get_entry(entry_id) for entry_id in self.get_normalized_entry_ids(text)
+        ]
+
+    def get_entry_ids_many(self, texts):
+        """Returns text -> get_entry_ids(text) for all texts with entries."""
+        result = {}
+        for text in texts:
+            entry_ids = self.get_entry_ids(text)
+            if entry_ids:
+                result[text] = entry_ids
+        return result
+
+    def look_up_translation(self, text, language, limit):
+        """Returns up to limit entries having all words of text in their glosses in
+        language, best matches first."""
+        index = self._gloss_indexes.get(language)
+        if index is None:
+            return []
+        postings = [index.get_ranked(word) for word in dict.fromkeys(tokenize(text))]
+        if None in postings:
+            return []
+        return [self.get_entry(entry_id) for entry_id in find_ranked(postings, limit)]
+
+    def look_up_similar(self, text, limit):
+        """Returns up to limit entries with a reading within a small edit distance of
+        text (see fuzzy_index), closest first. Meant as fallback for texts that
+        look_up() finds nothing for."""
+        positions = find_similar(
+            text,
+            self._grams.get,
+            lambda position: self._keys[position].decode("utf-8"),
+            limit,
+        )
+        entry_ids = take_distinct(
+            (self._keys.postings(position) for position in positions), limit
+        )
+        return [self.get_entry(entry_id) for entry_id in entry_ids]
+
+    def look_up_pattern(self, text, limit):
+        """Returns up to limit entries with a reading matching the wildcard pattern
+        text (see wildcard_index), ordered by reading."""
+        pattern = parse_pattern(text)
+        if pattern is None:
+            return []
+        positions = find_matching_keys(
+            pattern, self._keys, self._suffixes, str.encode, bytes.decode
+        )
+        entry_ids = take_distinct(
+            (self._keys.postings(position) for position in positions), limit
+        )
+        return [self.get_entry(entry_id) for entry_id in entry_ids]
+
+    def look_up(self, text):
+        return [self.get_entry(entry_id) for entry_id in self.get_entry_ids(text)]
+
+    def look_up_many(self, texts):
+        """Returns text -> entries for many texts at once, see batch_lookup."""
+        return look_up_many(self, texts)
+
+    def look_up_prefix(self, text, limit):
+        """Returns up to limit entries with a reading starting with text, ordered by
+        reading, so exact matches come first."""
+        if not text:
+            return []
+        start, end = prefix_range(self._keys, text.encode("utf-8"))
+        entry_ids = take_distinct(
+            (self._keys.postings(position) for position in range(start, end)), limit
+        )
+        return [self.get_entry(entry_id) for entry_id in entry_ids]
+
+    def match_prefixes(self, text, start=0):
+        """Returns (end, entry_ids) for every reading that text has at position
+        start, i.e. for every text[start:end] look_up() knows, longest first."""
+        prefixes = (
+            text[start:end].encode("utf-8") for end in range(start + 1, len(text) + 1)
+        )
+        matches = [
+            (start + index + 1, list(self._keys.postings(position)))
+            for index, position in matching_prefixes(self._keys, prefixes)
+        ]
+        matches.reverse()
+        return matches
+
+    @staticmethod
+    def open(file_name=BINARY_FILE_NAME):
+        """Returns the mapped dictionary stored in file_name. If the file is missing,
+        was written by another format version or is damaged, None is returned."""
+        try:
+            return BinaryDictionary(current_file(file_name))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Could not open binary dictionary %s: %s", file_name, e)
+            return None
@@ -0,0 +1,210 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Parallel dictionary build: the "words" array of the JSON file is
+# cut into shards at word boundaries, every shard is converted by a
+# separate Python process, and the results are merged in file order.
+# Worker processes run this file as a script, so they neither need
+# Anki nor Qt (Anki's own executable cannot be used for them).
+######################################################################
+
+import concurrent.futures
+import io
+import json
+import logging
+import os
+import pickle
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+try:
+    from .json_stream import iter_json_array
+except:
+    from json_stream import iter_json_array
+
+logger = logging.getLogger(__name__)
+
+# shards are pickled with a protocol every supported Python version can read
+SHARD_PICKLE_PROTOCOL = 4
+MIN_PARALLEL_FILE_SIZE = 16 << 20
+SHARDS_PER_PROCESS = 2
+
+WORDS_ARRAY_START = re.compile(rb'"words"\s*:\s*\[')
+# inside JSON strings, quotes are escaped, so this only matches the start of an
+# object whose first key is "id", i.e. a word
+WORD_START = re.compile(rb'\{\s*"id"\s*:')
+_SEARCH_WINDOW = 1 << 20
+
+
+def default_process_count():
+    """Number of worker processes for a build; one core is left for Anki's GUI."""
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def find_python_interpreter():
+    """Returns the path of a Python interpreter that can run helper scripts, or None.
+    Inside Anki, sys.executable is the Anki binary itself."""
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+    for name in ("python3", "python"):
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def helper_process_arguments():
+    """Keyword arguments for subprocess calls of helper scripts: Anki's Python
+    environment variables are not passed on, and no console window is opened."""
+    environment = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in ("PYTHONHOME", "PYTHONPATH")
+    }
+    arguments = {"env": environment}
+    if os.name == "nt":
+        arguments["creationflags"] = subprocess.CREATE_NO_WINDOW
+    return arguments
+
+
+def _find(pattern, f, start):
+    """Returns the file offset of the first match of pattern at or after start."""
+    f.seek(start)
+    while True:
+        window = f.read(_SEARCH_WINDOW)
+        match = pattern.search(window)
+        if match:
+            return start + match.start(), start + match.end()
+        if len(window) < _SEARCH_WINDOW:
+            return None
+        # keep an overlap so that matches crossing the window border are found
+        start += len(window) - 64
+        f.seek(start)
+
+
+def split_words_array(file_name, shard_count):
+    """Returns the byte offsets at which the words of the JSON file are cut into
+    (at most) shard_count shards; every offset is the start of a word. Returns None
+    if the words array could not be located."""
+    with open(file_name, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        array_start = _find(WORDS_ARRAY_START, f, 0)
+        if array_start is None:
+            return None
+        first_word = _find(WORD_START, f, array_start[1])
+        if first_word is None:
+            return None
+        boundaries = [first_word[0]]
+        step = (size - first_word[0]) // shard_count
+        for shard in range(1, shard_count):
+            word = _find(WORD_START, f, first_word[0] + shard * step)
+            if word is not None and word[0] > boundaries[-1]:
+                boundaries.append(word[0])
+    return boundaries
+
+
+def iter_shard_words(file_name, start, end):
+    """Yields the words stored between the byte offsets start and end (None for the
+    end of the words array) of the JSON file."""
+    with open(file_name, "rb") as f:
+        f.seek(start)
+        text = (f.read(end - start) if end is not None else f.read()).decode("utf-8")
+    if end is not None:
+        # drop the comma separating this shard from the next one
+        text = text.rstrip()[:-1] + "]}"
+    yield from iter_json_array(io.StringIO('{"words": [' + text), "words")
+
+
+def _run_worker(interpreter, file_name, start, end, languages, output_name):
+    completed = subprocess.run(
+        [
+            interpreter,
+            os.path.abspath(__file__),
+            file_name,
+            str(start),
+            str(end if end is not None else -1),
+            json.dumps(sorted(languages) if languages is not None else None),
+            output_name,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        **helper_process_arguments(),
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.decode("utf-8", "replace").strip())
+
+
+def build_shards(file_name, processes, languages=None, on_progress=None):
+    """Converts the words of the JSON file in up to `processes` worker processes,
+    keeping only glosses in the given languages (all if None). on_progress is called
+    with the fraction of shards done whenever a worker has finished.
+    Returns the shard results (see DictionaryLookup.export_shard()) in file order,
+    each loaded only when iterated, or None if a parallel build is not possible or
+    failed; the caller then has to parse the file itself."""
+    interpreter = find_python_interpreter()
+    if interpreter is None or processes < 2:
+        return None
+    try:
+        if os.path.getsize(file_name) < MIN_PARALLEL_FILE_SIZE:
+            return None
+        boundaries = split_words_array(file_name, processes * SHARDS_PER_PROCESS)
+    except OSError:
+        return None
+    if not boundaries:
+        return None
+    temp_dir = tempfile.mkdtemp(prefix="manganki-")
+    output_names = [
+        os.path.join(temp_dir, "shard%d.pickle" % index)
+        for index in range(len(boundaries))
+    ]
+    ends = boundaries[1:] + [None]
+    try:
+        with concurrent.futures.ThreadPoolExecutor(processes) as executor:
+            futures = [
+                executor.submit(
+                    _run_worker, interpreter, file_name, start, end, languages, name
+                )
+                for start, end, name in zip(boundaries, ends, output_names)
+            ]
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                future.result()
+                if on_progress is not None:
+                    on_progress(done / len(futures))
+    except (OSError, RuntimeError) as e:
+        logger.warning("Parallel dictionary build failed: %s", e)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return None
+    return _iter_shard_results(temp_dir, output_names)
+
+
+def _iter_shard_results(temp_dir, output_names):
+    try:
+        for name in output_names:
+            with open(name, "rb") as f:
+                shard = pickle.load(f)
+            os.remove(name)
+            yield shard
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def main():
+    from dict_lookup import DictionaryLookup
+
+    file_name, start, end, languages, output_name = sys.argv[1:6]
+    end = int(end)
+    dictionary = DictionaryLookup(languages=json.loads(languages))
+    dictionary.load_frequency_list()
+    for word in iter_shard_words(file_name, int(start), end if end >= 0 else None):
+        dictionary.add_word(word)
+    with open(output_name, "wb") as f:
+        pickle.dump(dictionary.export_shard(), f, protocol=SHARD_PICKLE_PROTOCOL)
+
+
+if __name__ == "__main__":
+    main()
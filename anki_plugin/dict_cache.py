@@ -0,0 +1,112 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Helpers shared by the dictionary caches: fingerprints of the JSON
+# source file (to detect stale caches) and atomic replacement of
+# cache files (so that an interrupted write never leaves a broken
+# cache behind).
+######################################################################
+
+import contextlib
+import hashlib
+import os
+
+try:
+    from .entry_rank import FREQUENCY_FILE_NAME
+except:
+    from entry_rank import FREQUENCY_FILE_NAME
+
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def _file_hash(file_name):
+    digest = hashlib.sha1()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(file_name):
+    """Returns size, modification time and content hash of file_name, or None if the
+    file cannot be read."""
+    try:
+        stat = os.stat(file_name)
+        return {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha1": _file_hash(file_name),
+        }
+    except OSError:
+        return None
+
+
+def source_matches(fingerprint, file_name):
+    """Checks whether a cache built from a file with the given fingerprint is still
+    up to date with file_name. The content hash is only computed if size or
+    modification time differ. A missing source file cannot invalidate a cache."""
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return True
+    if not fingerprint:
+        return False
+    if (
+        fingerprint.get("size") == stat.st_size
+        and fingerprint.get("mtime_ns") == stat.st_mtime_ns
+    ):
+        return True
+    if fingerprint.get("size") != stat.st_size:
+        return False
+    try:
+        return fingerprint.get("sha1") == _file_hash(file_name)
+    except OSError:
+        return True
+
+
+def is_outdated(dictionary, source_file_name):
+    """Checks whether a stored dictionary was built from another version of
+    source_file_name or of the frequency list (see entry_rank)."""
+    if not source_matches(dictionary.get_source(), source_file_name):
+        return True
+    return not source_matches(dictionary.get_frequency_source(), FREQUENCY_FILE_NAME)
+
+
+def _pending_name(file_name):
+    return file_name + ".new"
+
+
+def current_file(file_name):
+    """Returns the path under which the cache file_name should be opened. A cache
+    written while the previous one was still in use (which Windows does not allow to
+    replace) is moved into place here, before anything has opened it."""
+    pending = _pending_name(file_name)
+    if os.path.exists(pending):
+        try:
+            os.replace(pending, file_name)
+        except OSError:
+            return pending
+    return file_name
+
+
+@contextlib.contextmanager
+def atomic_write(file_name):
+    """Context manager yielding a temporary path to write the new content of
+    file_name to. Once the block has finished without error, the temporary file is
+    flushed to disk and renamed to file_name; otherwise it is removed."""
+    temp_name = file_name + ".tmp"
+    try:
+        yield temp_name
+        with open(temp_name, "rb+") as f:
+            os.fsync(f.fileno())
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_name)
+        raise
+    try:
+        os.replace(temp_name, file_name)
+    except OSError:
+        # the current cache is still opened; it is replaced on the next start
+        os.replace(temp_name, _pending_name(file_name))
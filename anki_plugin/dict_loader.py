@@ -0,0 +1,252 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Selection and loading of the dictionary backend. Every backend
+# offers look_up(text), get_languages() and load_languages(); their
+# stored data is created from the JSON file on first use. Further
+# dictionary files found next to JMdict are merged in (see
+# dict_merged).
+######################################################################
+
+import functools
+import logging
+import threading
+
+try:
+    from .dict_lookup import DictionaryLookup, DICT_FILE_NAME
+    from .dict_binary import (
+        BinaryDictionary,
+        update_binary_dictionary,
+        write_binary_dictionary,
+    )
+    from .dict_sqlite import SqliteDictionary, build_sqlite_dictionary
+    from .dict_cache import is_outdated, source_matches
+    from .dict_build import default_process_count
+    from .dict_merged import MergedDictionary, SecondaryDictionary
+    from .dict_sources import SECONDARY_SOURCES
+    from .load_timing import TimedPhase
+except:
+    from dict_lookup import DictionaryLookup, DICT_FILE_NAME
+    from dict_binary import (
+        BinaryDictionary,
+        update_binary_dictionary,
+        write_binary_dictionary,
+    )
+    from dict_sqlite import SqliteDictionary, build_sqlite_dictionary
+    from dict_cache import is_outdated, source_matches
+    from dict_build import default_process_count
+    from dict_merged import MergedDictionary, SecondaryDictionary
+    from dict_sources import SECONDARY_SOURCES
+    from load_timing import TimedPhase
+
+logger = logging.getLogger(__name__)
+
+BACKEND_BINARY = "binary"
+BACKEND_SQLITE = "sqlite"
+BACKEND_MEMORY = "memory"
+BACKEND_LAZY = "lazy"
+
+BACKENDS = {
+    BACKEND_BINARY: "Memory-mapped file (default)",
+    BACKEND_SQLITE: "SQLite database",
+    BACKEND_MEMORY: "Fully in memory",
+    BACKEND_LAZY: "In memory, entries read on demand",
+}
+DEFAULT_BACKEND = BACKEND_BINARY
+
+
+def _reading_progress(on_progress):
+    """Turns the fractions reported while reading the JSON file into messages."""
+    if on_progress is None:
+        return None
+    return lambda fraction: on_progress(
+        "Reading the dictionary file: %d%%" % (100 * fraction)
+    )
+
+
+def _report(on_progress, message):
+    if on_progress is not None:
+        on_progress(message)
+
+
+def _parse_uncached(languages, on_progress=None):
+    dictionary = DictionaryLookup(languages=languages)
+    dictionary.parse_file(
+        processes=default_process_count(),
+        on_progress=_reading_progress(on_progress),
+    )
+    dictionary.build_search_indexes()
+    return dictionary
+
+
+def _open_binary(languages):
+    # glosses stay on disk, so every language is available
+    with TimedPhase("open_binary"):
+        return BinaryDictionary.open()
+
+
+def _build_binary(languages, outdated=None, on_progress=None):
+    if outdated is not None:
+        _report(on_progress, "Updating the dictionary cache...")
+        with TimedPhase("update_binary_dictionary"):
+            updated = update_binary_dictionary(outdated)
+        dictionary = _open_binary(languages) if updated else None
+        if dictionary is not None:
+            return dictionary
+    dictionary = DictionaryLookup()
+    if not dictionary.parse_file(
+        processes=default_process_count(),
+        on_progress=_reading_progress(on_progress),
+    ):
+        # keep an existing cache rather than replacing it by an empty one
+        return dictionary
+    _report(on_progress, "Writing the dictionary cache...")
+    with TimedPhase("write_binary_dictionary"):
+        write_binary_dictionary(dictionary)  # for next time
+    # use the mapped file right away, so the parsed objects can be freed
+    return _open_binary(languages) or dictionary
+
+
+def _open_sqlite(languages):
+    with TimedPhase("open_sqlite"):
+        return SqliteDictionary.open()
+
+
+def _build_sqlite(languages, outdated=None, on_progress=None):
+    # the database is always built from scratch
+    try:
+        with TimedPhase("build_sqlite"):
+            build_sqlite_dictionary(on_progress=_reading_progress(on_progress))
+    except (OSError, ValueError) as e:
+        logger.warning("Could not build SQLite dictionary: %s", e)
+    dictionary = _open_sqlite(languages)
+    if dictionary is None:
+        logger.warning("Falling back to the in-memory dictionary.")
+        return _parse_uncached(languages, on_progress)
+    return dictionary
+
+
+def _open_pickled(languages, lazy):
+    dictionary = DictionaryLookup.de_pickle()
+    if dictionary is None or dictionary.is_lazy() != lazy:
+        return None
+    if lazy and not source_matches(dictionary.get_source(), DICT_FILE_NAME):
+        # entries are read from the JSON file at their old positions
+        return None
+    # the cache may have been written for other preferred languages
+    loaded = dictionary.get_loaded_languages()
+    dictionary.load_languages(languages)
+    dictionary.build_search_indexes()
+    if dictionary.get_loaded_languages() != loaded:
+        # with them, so that the next start does not read the JSON file again
+        dictionary.pickle()
+    return dictionary
+
+
+def _build_pickled(languages, outdated=None, on_progress=None, lazy=False):
+    if outdated is None and lazy:
+        # an outdated lazy cache is not opened, but it can still be updated
+        outdated = DictionaryLookup.de_pickle()
+    dictionary = None
+    if outdated is not None and outdated.is_lazy() == lazy:
+        _report(on_progress, "Updating the dictionary cache...")
+        dictionary = outdated.update_from_file()
+    if dictionary is not None:
+        dictionary.load_languages(languages)
+    else:
+        dictionary = DictionaryLookup(lazy=lazy, languages=languages)
+        if not dictionary.parse_file(
+            processes=default_process_count(),
+            on_progress=_reading_progress(on_progress),
+        ):
+            return dictionary
+    _report(on_progress, "Building the search indexes...")
+    # here rather than on the first lookups, and stored with the dictionary
+    dictionary.build_search_indexes()
+    _report(on_progress, "Writing the dictionary cache...")
+    dictionary.pickle()  # for next time
+    return dictionary
+
+
+_BACKEND_FUNCTIONS = {
+    BACKEND_BINARY: (_open_binary, _build_binary),
+    BACKEND_SQLITE: (_open_sqlite, _build_sqlite),
+    BACKEND_MEMORY: (
+        functools.partial(_open_pickled, lazy=False),
+        functools.partial(_build_pickled, lazy=False),
+    ),
+    BACKEND_LAZY: (
+        functools.partial(_open_pickled, lazy=True),
+        functools.partial(_build_pickled, lazy=True),
+    ),
+}
+
+
+def load_dictionary(
+    backend=DEFAULT_BACKEND,
+    languages=None,
+    on_rebuilt=None,
+    secondary_sources=SECONDARY_SOURCES,
+    on_progress=None,
+):
+    """Returns the dictionary for the given backend name (see BACKENDS), building its
+    stored data from the JSON dictionary file if it is missing, damaged or of an
+    older format.
+    Backends holding the glosses in memory only load those of the given languages
+    (all if None); others can be added by load_languages() later on.
+    If the stored data is intact but the JSON file or the frequency list (see
+    entry_rank) has changed since it was built, the outdated dictionary is returned
+    and a new one is built on a background thread and passed to on_rebuilt once
+    done. Without on_rebuilt, the rebuild happens right away. Except for SQLite,
+    the new one is derived from the outdated one if possible (see dict_update),
+    which only has to decode the changed words.
+    The dictionaries of those secondary_sources (see dict_sources) whose files
+    exist are merged in; they are only opened on their first lookup.
+    on_progress is called with a message whenever loading enters a new stage, and
+    repeatedly while the JSON file is read; the stages of a rebuild on a background
+    thread are reported there, too. The time taken by the stages is measured, see
+    load_timing."""
+    with TimedPhase("load_dictionary", backend=backend):
+        return _load_dictionary(
+            backend, languages, on_rebuilt, secondary_sources, on_progress
+        )
+
+
+def _load_dictionary(backend, languages, on_rebuilt, secondary_sources, on_progress):
+    secondaries = [SecondaryDictionary(source) for source in secondary_sources]
+    secondaries = [secondary for secondary in secondaries if secondary.is_available()]
+    if not secondaries:
+        return _load_primary(backend, languages, on_rebuilt, on_progress)
+
+    def on_primary_rebuilt(dictionary):
+        on_rebuilt(MergedDictionary(dictionary, secondaries))
+
+    return MergedDictionary(
+        _load_primary(
+            backend, languages, on_rebuilt and on_primary_rebuilt, on_progress
+        ),
+        secondaries,
+    )
+
+
+def _load_primary(backend, languages, on_rebuilt, on_progress):
+    open_dictionary, build_dictionary = _BACKEND_FUNCTIONS.get(
+        backend, _BACKEND_FUNCTIONS[DEFAULT_BACKEND]
+    )
+    _report(on_progress, "Opening the dictionary...")
+    dictionary = open_dictionary(languages)
+    if dictionary is None:
+        return build_dictionary(languages, on_progress=on_progress)
+    if is_outdated(dictionary, DICT_FILE_NAME):
+        logger.info("Dictionary file has changed, updating the dictionary cache.")
+        if on_rebuilt is None:
+            return build_dictionary(languages, dictionary, on_progress)
+        threading.Thread(
+            target=lambda: on_rebuilt(
+                build_dictionary(languages, dictionary, on_progress)
+            ),
+            daemon=True,
+        ).start()
+    return dictionary
@@ -6,36 +6,186 @@
 # Interface to JMDICT dictionary file
 ######################################################################
 
-import dataclasses
-import typing
+import array
+import copy
+import heapq
 import json
+import typing
 import os
+import logging
 import pickle
+import sys
+import threading
+
+try:
+    from .json_stream import iter_json_array, report_progress
+    from .load_timing import TimedPhase, timed_iteration
+    from .bounded_cache import BoundedCache
+    from .dict_cache import (
+        atomic_write,
+        current_file,
+        source_fingerprint,
+        source_matches,
+    )
+    from .dict_build import build_shards
+    from .sorted_keys import matching_prefixes, prefix_range, take_distinct
+    from .kana import normalize_kana
+    from .gloss_index import (
+        build_gloss_index,
+        build_gloss_indexes,
+        find_ranked,
+        tokenize,
+        update_gloss_index,
+    )
+    from .fuzzy_index import build_gram_index, find_similar
+    from .batch_lookup import look_up_many
+    from .wildcard_index import (
+        SuffixArray,
+        build_suffix_array,
+        find_matching_keys,
+        parse_pattern,
+        update_suffix_array,
+    )
+    from .entry_rank import FREQUENCY_FILE_NAME, load_frequency_list, word_rank
+    from .dict_update import (
+        REMOVED,
+        diff_entries,
+        read_word,
+        remap_postings,
+        scan_words,
+    )
+except:
+    from json_stream import iter_json_array, report_progress
+    from load_timing import TimedPhase, timed_iteration
+    from bounded_cache import BoundedCache
+    from dict_cache import (
+        atomic_write,
+        current_file,
+        source_fingerprint,
+        source_matches,
+    )
+    from dict_build import build_shards
+    from sorted_keys import matching_prefixes, prefix_range, take_distinct
+    from kana import normalize_kana
+    from gloss_index import (
+        build_gloss_index,
+        build_gloss_indexes,
+        find_ranked,
+        tokenize,
+        update_gloss_index,
+    )
+    from fuzzy_index import build_gram_index, find_similar
+    from batch_lookup import look_up_many
+    from wildcard_index import (
+        SuffixArray,
+        build_suffix_array,
+        find_matching_keys,
+        parse_pattern,
+        update_suffix_array,
+    )
+    from entry_rank import FREQUENCY_FILE_NAME, load_frequency_list, word_rank
+    from dict_update import (
+        REMOVED,
+        diff_entries,
+        read_word,
+        remap_postings,
+        scan_words,
+    )
+
+logger = logging.getLogger(__name__)
 
 DICT_FILE_NAME = "%s/%s" % (os.path.dirname(__file__), "jmdict-all-3.5.0.json")
 PICKLE_FILE_NAME = "%s/%s" % (os.path.dirname(__file__), "jmdict-all-3.5.0.json.pickle")
+ENTRY_CACHE_SIZE = 2000
+PICKLE_MAGIC = b"MANGANKI-PICKLE\n"
+# increase whenever DictionaryLookup or DictionaryEntry change their attributes
+PICKLE_FORMAT_VERSION = 12
+
+
+def _format_translation(text, part_of_speech):
+    if part_of_speech:
+        return "%s [%s]" % (text, ", ".join(part_of_speech))
+    return text
 
 
-@dataclasses.dataclass
 class DictionaryEntry:
     """Single dictionary entry, containing translations and readings, and the ID from
-    JDict."""
+    JDict. Translations are stored per sense as (part_of_speech, glosses), where
+    part_of_speech is a tuple of interned JMdict tags and glosses is a flat tuple
+    (language, text, language, text, ...) with interned language codes; the
+    part-of-speech suffix is only formatted when a translation is displayed."""
 
-    translations: typing.Dict[str, typing.List[str]] = dataclasses.field(
-        default_factory=dict
-    )
-    """Language prefix -> translations"""
-    unique_id: str = ""
-    kanji_readings: typing.List[str] = dataclasses.field(default_factory=list)
-    kana_readings: typing.List[str] = dataclasses.field(default_factory=list)
+    __slots__ = ("unique_id", "kanji_readings", "kana_readings", "senses")
+
+    def __init__(
+        self,
+        translations: typing.Optional[typing.Dict[str, typing.List[str]]] = None,
+        unique_id: str = "",
+        kanji_readings: typing.Sequence[str] = (),
+        kana_readings: typing.Sequence[str] = (),
+        senses: typing.Sequence[typing.Tuple[tuple, tuple]] = (),
+    ):
+        self.unique_id = unique_id
+        self.kanji_readings = tuple(kanji_readings)
+        self.kana_readings = tuple(kana_readings)
+        self.senses = tuple(senses)
+        if translations:
+            self.translations = translations
+
+    def __eq__(self, other):
+        if not isinstance(other, DictionaryEntry):
+            return NotImplemented
+        return (
+            self.unique_id == other.unique_id
+            and self.kanji_readings == other.kanji_readings
+            and self.kana_readings == other.kana_readings
+            and self.senses == other.senses
+        )
+
+    def __repr__(self):
+        return "DictionaryEntry(unique_id=%r, kanji_readings=%r, kana_readings=%r)" % (
+            self.unique_id,
+            self.kanji_readings,
+            self.kana_readings,
+        )
+
+    @property
+    def translations(self) -> typing.Dict[str, typing.List[str]]:
+        """Language prefix -> translations"""
+        result = {}
+        for part_of_speech, glosses in self.senses:
+            for index in range(0, len(glosses), 2):
+                result.setdefault(glosses[index], []).append(
+                    _format_translation(glosses[index + 1], part_of_speech)
+                )
+        return result
+
+    @translations.setter
+    def translations(self, translations: typing.Dict[str, typing.List[str]]):
+        self.senses = tuple(
+            ((), (sys.intern(language), text))
+            for language, texts in translations.items()
+            for text in texts
+        )
+
+    def _translation_list(self, language):
+        return [
+            _format_translation(glosses[index + 1], part_of_speech)
+            for part_of_speech, glosses in self.senses
+            for index in range(0, len(glosses), 2)
+            if glosses[index] == language
+        ]
+
+    def has_language(self, language):
+        return any(language in glosses[::2] for _, glosses in self.senses)
 
     def stringify(self, preferred_language: str = "eng"):
         result = ", ".join(self.kana_readings + self.kanji_readings)
         result += ": "
-        if preferred_language in self.translations:
-            result += ", ".join(self.translations[preferred_language])
+        if self.has_language(preferred_language):
+            result += ", ".join(self._translation_list(preferred_language))
         else:
-            result += ", ".join(self.translations["eng"])
+            result += ", ".join(self._translation_list("eng"))
         return result
 
     def get_expression(self):
@@ -50,10 +200,10 @@ class DictionaryEntry:
         return ""
 
     def get_translation(self, preferred_language: str = "eng"):
-        if preferred_language in self.translations:
-            return ", ".join(self.translations[preferred_language])
-        elif "eng" in self.translations:
-            return ", ".join(self.translations["eng"])
+        if self.has_language(preferred_language):
+            return ", ".join(self._translation_list(preferred_language))
+        elif self.has_language("eng"):
+            return ", ".join(self._translation_list("eng"))
         else:
             return "<no matching translation>"
 
@@ -70,78 +220,774 @@ class DictionaryEntry:
 class DictionaryLookup:
     """Parses JSON file containing dictionary items, and provides a method look_up(text)
     for getting matching DictionaryEntry's for text. Can also be serialized via pickle
-    for faster lookup"""
+    for faster lookup.
+    In lazy mode, only the reading -> entry id indexes and the location of each word
+    in the JSON file are kept; entries are decoded from the file on first access and
+    kept in a bounded cache.
+    The entry ids of every reading are ordered by the rank of the entries (see
+    entry_rank), so lookups return the most common words first.
+    If languages is given, only glosses in these languages are kept; glosses of
+    further languages can be added later by load_languages().
+    Files other than JMdict are read according to source (see dict_sources).
+    A dictionary can be brought up to date with a new release of its file by
+    update_from_file(), which only decodes the words that have changed."""
 
-    def __init__(self):
-        self._data = None
+    def __init__(
+        self,
+        lazy: bool = False,
+        languages: typing.Optional[typing.Iterable] = None,
+        source=None,
+    ):
+        self._array_name = "words" if source is None else source.array_name
+        self._convert = None if source is None else source.convert
+        self._index_kana = True if source is None else source.index_kana
+        self._entries = None if lazy else []
         self._kanji_to_entry = {}
         self._kana_to_entry = {}
+        self._sorted_keys = None
+        self._normalized_to_entry = None
+        # language -> inverted index of the glosses, see build_search_indexes()
+        self._gloss_indexes = {}
+        # bigram index for look_up_similar(), see build_search_indexes()
+        self._gram_index = None
+        # (key positions, offsets) of the suffixes of the sorted readings
+        self._suffix_array = None
         self._language_abbreviations = set()
+        self._loaded_languages = (
+            None if languages is None else {sys.intern(lang) for lang in languages}
+        )
+        self._interned_tags = {}
+        self._file_name = None
+        self._source = None
+        self._entry_offsets = array.array("Q") if lazy else None
+        self._entry_lengths = array.array("I") if lazy else None
+        self._entry_cache = BoundedCache(ENTRY_CACHE_SIZE)
+        # guards _entry_cache and _loaded_languages in lazy mode, as
+        # load_languages() may run on another thread than the lookups
+        self._entry_lock = threading.Lock()
+        # entry id -> rank, see entry_rank
+        self._entry_ranks = array.array("I")
+        # only needed while parsing
+        self._frequencies = {}
+        self._frequency_source = None
+        # entry id -> hash of the word's JSON text (see dict_update), or None if
+        # the words could not be located in the file
+        self._entry_hashes = None
 
-    def parse_file(self):
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_entry_cache"] = None
+        state["_entry_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._entry_cache = BoundedCache(ENTRY_CACHE_SIZE)
+        self._entry_lock = threading.Lock()
+
+    def is_lazy(self):
+        return self._entries is None
+
+    def parse_file(self, file_name=DICT_FILE_NAME, processes=1, on_progress=None):
+        """Reads the words of the JSON dictionary file one at a time and adds them to
+        the indexes; the document tree itself is never kept in memory. Returns False
+        if the file could not be read.
+        With processes > 1, the words are converted in that many worker processes
+        (see dict_build), if possible; lazy dictionaries are always read here.
+        on_progress is called now and then with the fraction of the file done."""
+        with TimedPhase(
+            "parse_file",
+            file=os.path.basename(file_name),
+            processes=processes,
+            lazy=self.is_lazy(),
+        ):
+            return self._parse_file(file_name, processes, on_progress)
+
+    def _parse_file(self, file_name, processes, on_progress):
+        self._file_name = file_name
+        self._source = source_fingerprint(file_name)
+        self.load_frequency_list()
+        # worker processes only read JMdict words
+        if processes > 1 and not self.is_lazy() and self._convert is None:
+            shards = build_shards(
+                file_name, processes, self._loaded_languages, on_progress
+            )
+            if shards is not None:
+                for shard in shards:
+                    self.import_shard(shard)
+                self._build_derived_indexes()
+                self._frequencies = {}
+                self._entry_hashes = self._read_entry_hashes(file_name)
+                return True
         try:
-            with open(DICT_FILE_NAME, encoding="utf-8") as f:
-                self._data = json.load(f)
+            with open(file_name, encoding="utf-8", newline="") as f:
+                if self.is_lazy():
+                    for word, offset, length in report_progress(
+                        timed_iteration(
+                            iter_json_array(f, self._array_name, with_spans=True),
+                            "read_json",
+                            "add_words",
+                        ),
+                        f,
+                        on_progress,
+                    ):
+                        self.add_word(self._convert_word(word), (offset, length))
+                else:
+                    for word in report_progress(
+                        timed_iteration(
+                            iter_json_array(f, self._array_name),
+                            "read_json",
+                            "add_words",
+                        ),
+                        f,
+                        on_progress,
+                    ):
+                        self.add_word(self._convert_word(word))
         except OSError:
-            print("Could not open Dictionary file %s." % DICT_FILE_NAME)
-            self._data = {}
-        self.create_entries()
+            logger.warning("Could not open Dictionary file %s.", file_name)
+            return False
+        except ValueError as e:
+            logger.warning("Could not parse Dictionary file %s: %s", file_name, e)
+            return False
+        finally:
+            self._frequencies = {}
+        self._build_derived_indexes()
+        self._entry_hashes = self._read_entry_hashes(file_name)
+        return True
+
+    def _read_entry_hashes(self, file_name):
+        # only the words of JMdict-like files can be located without decoding
+        spans = scan_words(file_name) if self._array_name == "words" else None
+        if spans is None or len(spans) != len(self._entry_ranks):
+            return None
+        return array.array("Q", (span.digest for span in spans))
+
+    def load_frequency_list(self, file_name=FREQUENCY_FILE_NAME):
+        """Reads the frequency list used for ranking the words added afterwards."""
+        self._frequencies = load_frequency_list(file_name)
+        self._frequency_source = source_fingerprint(file_name)
+
+    def get_frequency_source(self):
+        """Returns the fingerprint of the frequency list the ranks are based on, or
+        None if there was none."""
+        return self._frequency_source
 
     def get_languages(self):
+        """Returns all languages of the dictionary file, loaded or not."""
         return self._language_abbreviations
 
-    def create_entries(self):
-        for entry in self._data["words"]:
-            kana_readings = []
-            kanji_readings = []
-            for reading in entry["kanji"]:
-                if "rK" in reading["tags"] or "io" in reading["tags"]:
-                    # skip rare readings
-                    continue
-                kanji_readings.append(reading["text"])
-            for reading in entry["kana"]:
-                if "rK" in reading["tags"] or "io" in reading["tags"]:
-                    # skip rare readings
-                    continue
-                kana_readings.append(reading["text"])
-            dict_entry = DictionaryEntry()
-            dict_entry.unique_id = entry["id"]
-            dict_entry.kana_readings = kana_readings
-            dict_entry.kanji_readings = kanji_readings
+    def get_loaded_languages(self):
+        """Returns the languages whose glosses are kept, or None for all."""
+        return self._loaded_languages
+
+    def load_languages(self, languages=None):
+        """Makes sure the glosses of the given languages (all if None) are available,
+        reading them from the dictionary file if they were left out so far. Returns
+        False if they could not be read."""
+        if self._loaded_languages is None:
+            return True
+        if languages is None:
+            wanted = None
+            missing = self._language_abbreviations - self._loaded_languages
+        else:
+            missing = (
+                set(languages) & self._language_abbreviations
+            ) - self._loaded_languages
+            if not missing:
+                return True
+            wanted = self._loaded_languages | {sys.intern(lang) for lang in missing}
+        if self.is_lazy():
+            # entries are decoded from the file anyway; none decoded with the
+            # languages so far may be cached afterwards
+            with self._entry_lock:
+                self._loaded_languages = wanted
+                self._entry_cache.clear()
+            self._update_gloss_indexes(missing)
+            return True
+        if not source_matches(self._source, self._file_name):
+            logger.warning("Dictionary file has changed, cannot add further languages.")
+            return False
+        loaded = self._loaded_languages
+        self._loaded_languages = wanted
+        try:
+            with open(self._file_name, encoding="utf-8", newline="") as f:
+                for entry, word in zip(
+                    self._entries, iter_json_array(f, self._array_name)
+                ):
+                    entry.senses = self._create_senses(self._convert_word(word))
+        except (OSError, ValueError) as e:
+            logger.warning(
+                "Could not read further languages from %s: %s", self._file_name, e
+            )
+            self._loaded_languages = loaded
+            return False
+        self._update_gloss_indexes(missing)
+        return True
+
+    def _update_gloss_indexes(self, languages):
+        """Builds the gloss indexes of newly loaded languages if there are gloss
+        indexes already (see build_search_indexes()); those of the other languages
+        stay valid. Indexes are replaced only once the new ones are ready, as
+        lookups may run meanwhile."""
+        if self._gloss_indexes:
+            self._gloss_indexes.update(
+                build_gloss_indexes(self.get_entries(), sorted(languages))
+            )
+
+    def get_source(self):
+        """Returns the fingerprint of the JSON file the dictionary was built from."""
+        return self._source
+
+    def get_entries(self):
+        """Returns all entries; entry ids are the positions in this sequence. In lazy
+        mode, the entries are decoded one by one while iterating."""
+        if self.is_lazy():
+            return self._read_entries()
+        return self._entries
+
+    def get_keys(self):
+        """Returns all readings (kanji and kana) that look_up() knows."""
+        return self._kanji_to_entry.keys() | self._kana_to_entry.keys()
+
+    def get_entry_rank(self, entry_id):
+        """Returns the rank of the entry (see entry_rank); lower is better."""
+        return self._entry_ranks[entry_id]
+
+    def _rank_key(self, entry_id):
+        return self._entry_ranks[entry_id], entry_id
+
+    def _sort_postings(self):
+        for index in (self._kanji_to_entry, self._kana_to_entry):
+            for entry_ids in index.values():
+                if len(entry_ids) > 1:
+                    entry_ids.sort(key=self._rank_key)
+
+    def _get_sorted_keys(self):
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self.get_keys())
+        return self._sorted_keys
+
+    def _get_normalized_index(self):
+        """Returns normalized spelling -> entry ids for all readings whose normalized
+        spelling differs from the reading itself."""
+        if self._normalized_to_entry is None:
+            index = {}
+            for key in self._get_sorted_keys():
+                normalized = normalize_kana(key)
+                if normalized != key:
+                    index.setdefault(normalized, []).extend(self.get_entry_ids(key))
+            for entry_ids in index.values():
+                entry_ids.sort(key=self._rank_key)
+            self._normalized_to_entry = index
+        return self._normalized_to_entry
+
+    def _invalidate_derived_indexes(self):
+        self._sorted_keys = None
+        self._normalized_to_entry = None
+        self._gloss_indexes.clear()
+        self._gram_index = None
+        self._suffix_array = None
+
+    def _build_derived_indexes(self):
+        # built once after parsing, so that they are stored in the pickled cache
+        with TimedPhase("build_derived_indexes"):
+            self._sort_postings()
+            self._get_sorted_keys()
+            self._get_normalized_index()
+            self.get_suffix_array()
+
+    def _convert_word(self, word):
+        return word if self._convert is None else self._convert(word)
+
+    @staticmethod
+    def _get_readings(entry, kind):
+        return [
+            reading["text"]
+            for reading in entry[kind]
+            # skip rare readings
+            if "rK" not in reading["tags"] and "io" not in reading["tags"]
+        ]
+
+    def _create_senses(self, entry):
+        senses = []
+        for sense in entry["sense"]:
+            glosses = []
+            for glob in sense["gloss"]:
+                language = sys.intern(glob["lang"])
+                self._language_abbreviations.add(language)
+                if self._loaded_languages is None or language in self._loaded_languages:
+                    glosses.append(language)
+                    glosses.append(glob["text"])
+            # senses are kept even without glosses, so that glosses loaded later
+            # end up in the right place
+            senses.append((self._intern_tags(sense["partOfSpeech"]), tuple(glosses)))
+        return tuple(senses)
+
+    def create_entry(self, entry):
+        """Creates the DictionaryEntry for a single JMdict word."""
+        return DictionaryEntry(
+            unique_id=entry["id"],
+            kanji_readings=self._get_readings(entry, "kanji"),
+            kana_readings=self._get_readings(entry, "kana"),
+            senses=self._create_senses(entry),
+        )
+
+    def add_word(self, entry, span=None):
+        """Indexes a single JMdict word. Except in lazy mode, its DictionaryEntry is
+        created right away; in lazy mode, span gives (offset, length) of the word's
+        JSON text in the dictionary file, from where it is decoded on demand.
+        The entry ids of the readings are ordered by rank only once all words have
+        been added, by _build_derived_indexes()."""
+        if self.is_lazy():
+            entry_id = len(self._entry_offsets)
+            self._entry_offsets.append(span[0])
+            self._entry_lengths.append(span[1])
+        else:
+            entry_id = len(self._entries)
+            self._entries.append(None)
+        self._entry_ranks.append(0)
+        self._set_word(entry_id, entry)
+
+    def _set_word(self, entry_id, entry):
+        """Stores the entry (except in lazy mode) and rank of a JMdict word under the
+        given entry id and appends the id to the postings of its readings."""
+        if self.is_lazy():
             for sense in entry["sense"]:
                 for glob in sense["gloss"]:
-                    language = glob["lang"]
-                    self._language_abbreviations.add(language)
-                    translation = glob["text"]
-                    if sense["partOfSpeech"]:
-                        translation = "%s [%s]" % (
-                            translation,
-                            ", ".join(sense["partOfSpeech"]),
+                    self._language_abbreviations.add(sys.intern(glob["lang"]))
+            kanji_readings = self._get_readings(entry, "kanji")
+            kana_readings = self._get_readings(entry, "kana")
+        else:
+            dict_entry = self.create_entry(entry)
+            self._entries[entry_id] = dict_entry
+            kanji_readings = dict_entry.kanji_readings
+            kana_readings = dict_entry.kana_readings
+        self._entry_ranks[entry_id] = word_rank(
+            entry, kanji_readings + kana_readings, self._frequencies
+        )
+        self._invalidate_derived_indexes()
+        for reading in kana_readings if self._index_kana else ():
+            self._kana_to_entry.setdefault(reading, []).append(entry_id)
+        for reading in kanji_readings:
+            self._kanji_to_entry.setdefault(reading, []).append(entry_id)
+
+    def export_shard(self):
+        """Returns entries, indexes and languages as plain Python data, for passing
+        the result of a build in a worker process to the main process."""
+        return {
+            "entries": [
+                (
+                    entry.unique_id,
+                    entry.kanji_readings,
+                    entry.kana_readings,
+                    entry.senses,
+                )
+                for entry in self._entries
+            ],
+            "kanji_to_entry": self._kanji_to_entry,
+            "kana_to_entry": self._kana_to_entry,
+            "ranks": self._entry_ranks.tolist(),
+            "languages": sorted(self._language_abbreviations),
+        }
+
+    def import_shard(self, shard):
+        """Appends the entries of a shard built by export_shard() and merges its
+        indexes, shifting its entry ids behind the existing entries."""
+        first_id = len(self._entries)
+        self._invalidate_derived_indexes()
+        for unique_id, kanji_readings, kana_readings, senses in shard["entries"]:
+            self._entries.append(
+                DictionaryEntry(
+                    unique_id=unique_id,
+                    kanji_readings=kanji_readings,
+                    kana_readings=kana_readings,
+                    senses=[
+                        (
+                            self._intern_tags(part_of_speech),
+                            tuple(
+                                sys.intern(text) if index % 2 == 0 else text
+                                for index, text in enumerate(glosses)
+                            ),
                         )
-                    dict_entry.translations.setdefault(language, []).append(translation)
-            for reading in kana_readings:
-                self._kana_to_entry.setdefault(reading, []).append(dict_entry)
-            for reading in kanji_readings:
-                self._kanji_to_entry.setdefault(reading, []).append(dict_entry)
+                        for part_of_speech, glosses in senses
+                    ],
+                )
+            )
+        for index, shard_index in (
+            (self._kanji_to_entry, shard["kanji_to_entry"]),
+            (self._kana_to_entry, shard["kana_to_entry"]),
+        ):
+            for reading, entry_ids in shard_index.items():
+                index.setdefault(reading, []).extend(
+                    entry_id + first_id for entry_id in entry_ids
+                )
+        self._entry_ranks.extend(shard["ranks"])
+        self._language_abbreviations.update(
+            sys.intern(language) for language in shard["languages"]
+        )
 
-    def look_up(self, text):
-        result = []
-        if text in self._kanji_to_entry:
-            result.extend(self._kanji_to_entry[text])
-        if text in self._kana_to_entry:
-            result.extend(self._kana_to_entry[text])
+    def add_words_from_file(self, file_name, spans):
+        """Adds the words at the given WordSpan's of the JSON file file_name (see
+        dict_update), ranked by the frequency list, e.g. the words that are new in a
+        release of the file. Returns False if they could not be read."""
+        self._file_name = file_name
+        self.load_frequency_list()
+        try:
+            with open(file_name, "rb") as f:
+                for span in spans:
+                    self.add_word(
+                        self._convert_word(read_word(f, span)),
+                        (span.offset, span.length),
+                    )
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read words from %s: %s", file_name, e)
+            return False
+        finally:
+            self._frequencies = {}
+        return True
+
+    def get_entry_hashes(self):
+        """Returns entry id -> hash of the word's JSON text (see dict_update), or None
+        if unknown."""
+        return self._entry_hashes
+
+    def update_from_file(self, file_name=DICT_FILE_NAME):
+        """Returns a copy of the dictionary updated to the current content of the
+        JSON file file_name (see dict_update): only new and changed words are
+        decoded; all indexes are patched rather than built again. The dictionary
+        itself is left untouched, so it can be used meanwhile.
+        Returns None if it cannot be updated and has to be built from scratch, e.g.
+        because the frequency list has changed, which affects all ranks."""
+        with TimedPhase("update_from_file", file=os.path.basename(file_name)):
+            return self._update_from_file(file_name)
+
+    def _update_from_file(self, file_name):
+        if self._entry_hashes is None or not source_matches(
+            self._frequency_source, FREQUENCY_FILE_NAME
+        ):
+            return None
+        spans = scan_words(file_name)
+        if spans is None:
+            return None
+        diff = diff_entries(self._entry_hashes, spans)
+        if not diff.in_order:
+            return None
+        # shares the entries and data that are not changed below
+        updated = copy.copy(self)
+        updated._file_name = file_name
+        updated._source = source_fingerprint(file_name)
+        updated._entry_hashes = array.array("Q", (span.digest for span in spans))
+        updated._language_abbreviations = set(self._language_abbreviations)
+        updated._gloss_indexes = {}
+        updated._invalidate_derived_indexes()
+        updated._kanji_to_entry = remap_postings(self._kanji_to_entry, diff.new_ids)
+        updated._kana_to_entry = remap_postings(self._kana_to_entry, diff.new_ids)
+        updated._entry_ranks = array.array("I", [0]) * len(spans)
+        if self.is_lazy():
+            updated._entry_offsets = array.array("Q", (span.offset for span in spans))
+            updated._entry_lengths = array.array("I", (span.length for span in spans))
+        else:
+            updated._entries = [None] * len(spans)
+        for old_id, new_id in enumerate(diff.new_ids):
+            if new_id != REMOVED:
+                updated._entry_ranks[new_id] = self._entry_ranks[old_id]
+                if not self.is_lazy():
+                    updated._entries[new_id] = self._entries[old_id]
+        updated._frequencies = load_frequency_list(FREQUENCY_FILE_NAME)
+        try:
+            with open(file_name, "rb") as f:
+                for entry_id in diff.added_ids:
+                    updated._set_word(
+                        entry_id, self._convert_word(read_word(f, spans[entry_id]))
+                    )
+        except (OSError, ValueError) as e:
+            logger.warning("Could not update from Dictionary file %s: %s", file_name, e)
+            return None
+        finally:
+            updated._frequencies = {}
+        updated._update_derived_indexes(self, diff)
+        return updated
+
+    def _update_derived_indexes(self, old, diff):
+        """Derives the indexes of an updated dictionary from those of old."""
+        added_entries = [
+            (entry_id, self.get_entry(entry_id)) for entry_id in diff.added_ids
+        ]
+        old_keys = old._sorted_keys
+        old_suffix_array = old._suffix_array
+        keys = self._get_sorted_keys()
+        if keys == old_keys:
+            self._sorted_keys = old_keys
+            self._suffix_array = old_suffix_array
+            self._gram_index = old._gram_index
+        elif old_keys is not None and old_suffix_array is not None:
+            self._suffix_array = update_suffix_array(old_keys, keys, old_suffix_array)
+        if old._normalized_to_entry is not None:
+            index = remap_postings(old._normalized_to_entry, diff.new_ids)
+            changed = set()
+            for entry_id, entry in added_entries:
+                readings = entry.kanji_readings
+                if self._index_kana:
+                    readings += entry.kana_readings
+                for reading in readings:
+                    normalized = normalize_kana(reading)
+                    if normalized != reading:
+                        index.setdefault(normalized, []).append(entry_id)
+                        changed.add(normalized)
+            for normalized in changed:
+                index[normalized].sort(key=self._rank_key)
+            self._normalized_to_entry = index
+        self._build_derived_indexes()
+        # old may be in use on another thread, which can add gloss indexes
+        for language, index in list(old._gloss_indexes.items()):
+            self._gloss_indexes[language] = update_gloss_index(
+                index, diff.new_ids, added_entries, language
+            )
+
+    def _intern_tags(self, tags):
+        """Returns a shared tuple for the given list of tags."""
+        key = tuple(tags)
+        interned = self._interned_tags.get(key)
+        if interned is None:
+            interned = tuple(sys.intern(tag) for tag in tags)
+            self._interned_tags[key] = interned
+        return interned
+
+    def _read_entry(self, entry_id):
+        """Decodes a single word from the JSON file (lazy mode)."""
+        with open(self._file_name, "rb") as f:
+            return self._decode_entry(f, entry_id)
+
+    def _read_entries(self):
+        """Decodes all words from the JSON file, in entry id order (lazy mode)."""
+        with open(self._file_name, "rb") as f:
+            for entry_id in range(len(self._entry_offsets)):
+                yield self._decode_entry(f, entry_id)
+
+    def _decode_entry(self, f, entry_id):
+        f.seek(self._entry_offsets[entry_id])
+        word = json.loads(f.read(self._entry_lengths[entry_id]))
+        return self.create_entry(self._convert_word(word))
+
+    def get_entry(self, entry_id):
+        if not self.is_lazy():
+            return self._entries[entry_id]
+        with self._entry_lock:
+            entry = self._entry_cache.get(entry_id)
+            if entry is None:
+                entry = self._read_entry(entry_id)
+                self._entry_cache.put(entry_id, entry)
+        return entry
+
+    def get_entry_ids(self, text):
+        """Returns the ids of the entries look_up(text) would return, best ranked
+        first."""
+        kanji_ids = self._kanji_to_entry.get(text)
+        kana_ids = self._kana_to_entry.get(text)
+        if kanji_ids and kana_ids:
+            # both are ordered already
+            return list(heapq.merge(kanji_ids, kana_ids, key=self._rank_key))
+        return list(kanji_ids or kana_ids or ())
+
+    def get_entry_ids_many(self, texts):
+        """Returns text -> get_entry_ids(text) for all texts with entries."""
+        result = {}
+        for text in texts:
+            entry_ids = self.get_entry_ids(text)
+            if entry_ids:
+                result[text] = entry_ids
         return result
 
+    def get_normalized_keys(self):
+        """Returns the normalized spellings that differ from their readings."""
+        return self._get_normalized_index().keys()
+
+    def get_variant_entry_ids(self, normalized):
+        """Returns the ids of the entries with a reading other than normalized that
+        has the normalized spelling normalized."""
+        return self._get_normalized_index().get(normalized, [])
+
+    def get_normalized_entry_ids(self, text):
+        """Returns the ids of the entries with a reading that has the same normalized
+        spelling (see normalize_kana()) as text."""
+        normalized = normalize_kana(text)
+        return take_distinct(
+            (self.get_entry_ids(normalized), self.get_variant_entry_ids(normalized)),
+            sys.maxsize,
+        )
+
+    def look_up_normalized(self, text):
+        """Like look_up(), but ignoring differences between katakana and hiragana,
+        small and normal sized kana and long vowel marks."""
+        return [
+            self.get_entry(entry_id) for entry_id in self.get_normalized_entry_ids(text)
+        ]
+
+    def build_search_indexes(self):
+        """Builds the indexes of look_up_translation() for the loaded languages and
+        of look_up_similar() right away rather than on their first use, which would
+        hold up that lookup; they are stored in the pickled cache as well. In lazy
+        mode, this decodes every entry once."""
+        with TimedPhase("build_search_indexes", lazy=self.is_lazy()):
+            self.get_gram_index()
+            self._build_gloss_indexes()
+
+    def _build_gloss_indexes(self):
+        languages = self._language_abbreviations
+        if self._loaded_languages is not None:
+            languages = languages & self._loaded_languages
+        missing = sorted(languages - self._gloss_indexes.keys())
+        if missing:
+            self._gloss_indexes.update(build_gloss_indexes(self.get_entries(), missing))
+
+    def _get_gloss_index(self, language):
+        index = self._gloss_indexes.get(language)
+        if index is None:
+            index = build_gloss_index(self.get_entries(), language)
+            self._gloss_indexes[language] = index
+        return index
+
+    def get_gloss_words(self, language):
+        """Returns all words occurring in the glosses in language."""
+        return self._get_gloss_index(language).keys()
+
+    def get_gloss_postings(self, language, word):
+        """Returns (entry ids, ranks) of the entries with word in a gloss in
+        language, best ranked first, or None."""
+        return self._get_gloss_index(language).get(word)
+
+    def look_up_translation(self, text, language, limit):
+        """Returns up to limit entries having all words of text in their glosses in
+        language, best matches first."""
+        postings = [
+            self.get_gloss_postings(language, word)
+            for word in dict.fromkeys(tokenize(text))
+        ]
+        if None in postings:
+            return []
+        return [self.get_entry(entry_id) for entry_id in find_ranked(postings, limit)]
+
+    def get_gram_index(self):
+        """Returns bigram -> positions in the sorted readings (see fuzzy_index)."""
+        if self._gram_index is None:
+            self._gram_index = build_gram_index(self._get_sorted_keys())
+        return self._gram_index
+
+    def look_up_similar(self, text, limit):
+        """Returns up to limit entries with a reading within a small edit distance of
+        text (see fuzzy_index), closest first. Meant as fallback for texts that
+        look_up() finds nothing for."""
+        keys = self._get_sorted_keys()
+        index = self.get_gram_index()
+        positions = find_similar(
+            text, lambda gram: index.get(gram, ()), keys.__getitem__, limit
+        )
+        entry_ids = take_distinct(
+            (self.get_entry_ids(keys[position]) for position in positions), limit
+        )
+        return [self.get_entry(entry_id) for entry_id in entry_ids]
+
+    def get_suffix_array(self):
+        """Returns the suffix array of the sorted readings, see wildcard_index."""
+        if self._suffix_array is None:
+            self._suffix_array = build_suffix_array(self._get_sorted_keys())
+        return self._suffix_array
+
+    def look_up_pattern(self, text, limit):
+        """Returns up to limit entries with a reading matching the wildcard pattern
+        text (see wildcard_index), ordered by reading."""
+        pattern = parse_pattern(text)
+        if pattern is None:
+            return []
+        keys = self._get_sorted_keys()
+        positions = find_matching_keys(
+            pattern, keys, SuffixArray(keys, *self.get_suffix_array())
+        )
+        entry_ids = take_distinct(
+            (self.get_entry_ids(keys[position]) for position in positions), limit
+        )
+        return [self.get_entry(entry_id) for entry_id in entry_ids]
+
+    def look_up(self, text):
+        return [self.get_entry(entry_id) for entry_id in self.get_entry_ids(text)]
+
+    def look_up_many(self, texts):
+        """Returns text -> entries for many texts at once, see batch_lookup."""
+        return look_up_many(self, texts)
+
+    def look_up_prefix(self, text, limit):
+        """Returns up to limit entries with a reading starting with text, ordered by
+        reading, so exact matches come first."""
+        if not text:
+            return []
+        keys = self._get_sorted_keys()
+        start, end = prefix_range(keys, text)
+        entry_ids = take_distinct(
+            (self.get_entry_ids(keys[position]) for position in range(start, end)),
+            limit,
+        )
+        return [self.get_entry(entry_id) for entry_id in entry_ids]
+
+    def match_prefixes(self, text, start=0):
+        """Returns (end, entry_ids) for every reading that text has at position
+        start, i.e. for every text[start:end] look_up() knows, longest first."""
+        keys = self._get_sorted_keys()
+        prefixes = (text[start:end] for end in range(start + 1, len(text) + 1))
+        matches = [
+            (start + index + 1, self.get_entry_ids(keys[position]))
+            for index, position in matching_prefixes(keys, prefixes)
+        ]
+        matches.reverse()
+        return matches
+
     def pickle(self):
-        with open(PICKLE_FILE_NAME, "wb") as pickle_file:
-            pickle.dump(self, pickle_file)
+        """Stores the dictionary in PICKLE_FILE_NAME, preceded by a header with the
+        format version and the fingerprint of the source file. The file is written
+        to a temporary file first and then renamed, so it is never left half
+        written."""
+        header = {"version": PICKLE_FORMAT_VERSION, "source": self._source}
+        with TimedPhase("pickle"), atomic_write(PICKLE_FILE_NAME) as temp_name:
+            with open(temp_name, "wb") as pickle_file:
+                pickle_file.write(PICKLE_MAGIC)
+                pickle.dump(header, pickle_file)
+                pickle.dump(self, pickle_file)
 
     @staticmethod
     def de_pickle():
         """Returns the de-pickled dictionary structure stored in pickle_filename. If
-        loading failed, None is returned."""
+        the file is missing, was written by another format version or cannot be read,
+        None is returned. Whether it still matches the JSON file has to be checked
+        by the caller via get_source()."""
+        with TimedPhase("de_pickle"):
+            return DictionaryLookup._de_pickle()
+
+    @staticmethod
+    def _de_pickle():
         try:
-            with open(PICKLE_FILE_NAME, "rb") as pickle_file:
-                return pickle.load(pickle_file)
-        except Exception as e:
+            with open(current_file(PICKLE_FILE_NAME), "rb") as pickle_file:
+                if pickle_file.read(len(PICKLE_MAGIC)) != PICKLE_MAGIC:
+                    logger.warning("Ignoring dictionary cache in an unknown format.")
+                    return None
+                header = pickle.load(pickle_file)
+                if header.get("version") != PICKLE_FORMAT_VERSION:
+                    logger.warning(
+                        "Ignoring dictionary cache of format %s.", header.get("version")
+                    )
+                    return None
+                dictionary = pickle.load(pickle_file)
+        except FileNotFoundError:
+            return None
+        except (
+            OSError,
+            EOFError,
+            pickle.UnpicklingError,
+            AttributeError,
+            ImportError,
+            TypeError,
+            ValueError,
+        ) as e:
+            logger.warning("Could not read dictionary cache: %s", e)
+            return None
+        if not isinstance(dictionary, DictionaryLookup):
             return None
+        return dictionary
@@ -0,0 +1,241 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Several dictionaries queried as one: JMdict in the chosen backend,
+# followed by further sources such as names and kanji (see
+# dict_sources). Each further source is stored in a memory-mapped
+# file of its own (see dict_binary), which is only opened on its
+# first lookup, and built on a background thread if needed, so that
+# it adds nothing to the startup. The upper bits of merged entry ids
+# tell the dictionary an entry belongs to.
+######################################################################
+
+import logging
+import os
+import threading
+
+try:
+    from .dict_lookup import DictionaryLookup
+    from .dict_binary import (
+        BinaryDictionary,
+        update_binary_dictionary,
+        write_binary_dictionary,
+    )
+    from .dict_cache import is_outdated
+    from .batch_lookup import look_up_many
+except:
+    from dict_lookup import DictionaryLookup
+    from dict_binary import (
+        BinaryDictionary,
+        update_binary_dictionary,
+        write_binary_dictionary,
+    )
+    from dict_cache import is_outdated
+    from batch_lookup import look_up_many
+
+logger = logging.getLogger(__name__)
+
+_ID_BITS = 32
+_ID_MASK = (1 << _ID_BITS) - 1
+
+
+class SecondaryDictionary:
+    """Dictionary of a DictionarySource, stored next to its JSON file. get() opens
+    it on first use; if the stored file is missing or outdated, it is (re)built or
+    updated (see dict_update) on a background thread, and get() returns None (or
+    the outdated dictionary) until then."""
+
+    def __init__(self, source):
+        self._source = source
+        self._file_name = source.file_name + ".bin"
+        self._dictionary = None
+        self._opened = False
+        self._lock = threading.Lock()
+
+    def get_dictionary_source(self):
+        return self._source
+
+    def is_available(self):
+        """Checks whether the source file or a stored dictionary exists."""
+        return os.path.exists(self._source.file_name) or os.path.exists(self._file_name)
+
+    def get(self):
+        if self._opened:
+            return self._dictionary
+        with self._lock:
+            if self._opened:
+                return self._dictionary
+            self._dictionary = BinaryDictionary.open(self._file_name)
+            if (
+                self._dictionary is None
+                or is_outdated(self._dictionary, self._source.file_name)
+            ) and os.path.exists(self._source.file_name):
+                threading.Thread(target=self._build, daemon=True).start()
+            self._opened = True
+        return self._dictionary
+
+    def _build(self):
+        if self._dictionary is not None and self._update():
+            return
+        dictionary = DictionaryLookup(source=self._source)
+        if not dictionary.parse_file(self._source.file_name):
+            return
+        try:
+            write_binary_dictionary(dictionary, self._file_name)
+        except OSError as e:
+            logger.warning("Could not store %s: %s", self._source.description, e)
+            self._dictionary = dictionary
+            return
+        self._dictionary = BinaryDictionary.open(self._file_name) or dictionary
+
+    def _update(self):
+        try:
+            if not update_binary_dictionary(
+                self._dictionary,
+                self._source.file_name,
+                self._source,
+                self._file_name,
+            ):
+                return False
+        except OSError as e:
+            logger.warning("Could not update %s: %s", self._source.description, e)
+            return False
+        updated = BinaryDictionary.open(self._file_name)
+        if updated is None:
+            return False
+        self._dictionary = updated
+        return True
+
+
+class MergedDictionary:
+    """Queries a dictionary of any backend and further SecondaryDictionary's as one,
+    listing the entries of the first dictionary first. Provides the same interface
+    as the backends; languages and sources are those of the first dictionary."""
+
+    def __init__(self, primary, secondaries):
+        self._primary = primary
+        self._secondaries = list(secondaries)
+
+    def get_primary(self):
+        return self._primary
+
+    def get_secondaries(self):
+        return self._secondaries
+
+    def _dictionaries(self):
+        """Yields (number, dictionary) for all dictionaries ready for lookups."""
+        yield 0, self._primary
+        for number, secondary in enumerate(self._secondaries, 1):
+            dictionary = secondary.get()
+            if dictionary is not None:
+                yield number, dictionary
+
+    def _split_id(self, entry_id):
+        number = entry_id >> _ID_BITS
+        if number == 0:
+            return self._primary, entry_id
+        return self._secondaries[number - 1].get(), entry_id & _ID_MASK
+
+    @staticmethod
+    def _merged_ids(number, entry_ids):
+        if number == 0:
+            return list(entry_ids)
+        offset = number << _ID_BITS
+        return [offset | entry_id for entry_id in entry_ids]
+
+    def _collect(self, look_up, limit):
+        result = []
+        for _, dictionary in self._dictionaries():
+            if len(result) >= limit:
+                break
+            result += look_up(dictionary, limit - len(result))
+        return result
+
+    def get_languages(self):
+        return self._primary.get_languages()
+
+    def load_languages(self, languages=None):
+        return self._primary.load_languages(languages)
+
+    def get_source(self):
+        return self._primary.get_source()
+
+    def get_frequency_source(self):
+        return self._primary.get_frequency_source()
+
+    def get_entry(self, entry_id):
+        dictionary, entry_id = self._split_id(entry_id)
+        return dictionary.get_entry(entry_id)
+
+    def get_entry_rank(self, entry_id):
+        dictionary, entry_id = self._split_id(entry_id)
+        return dictionary.get_entry_rank(entry_id)
+
+    def get_entry_ids(self, text):
+        result = []
+        for number, dictionary in self._dictionaries():
+            result += self._merged_ids(number, dictionary.get_entry_ids(text))
+        return result
+
+    def get_entry_ids_many(self, texts):
+        texts = list(texts)
+        result = {}
+        for number, dictionary in self._dictionaries():
+            for text, entry_ids in dictionary.get_entry_ids_many(texts).items():
+                result.setdefault(text, []).extend(self._merged_ids(number, entry_ids))
+        return result
+
+    def get_normalized_entry_ids(self, text):
+        result = []
+        for number, dictionary in self._dictionaries():
+            result += self._merged_ids(
+                number, dictionary.get_normalized_entry_ids(text)
+            )
+        return result
+
+    def look_up(self, text):
+        result = []
+        for _, dictionary in self._dictionaries():
+            result += dictionary.look_up(text)
+        return result
+
+    def look_up_normalized(self, text):
+        result = []
+        for _, dictionary in self._dictionaries():
+            result += dictionary.look_up_normalized(text)
+        return result
+
+    def look_up_many(self, texts):
+        return look_up_many(self, texts)
+
+    def look_up_prefix(self, text, limit):
+        return self._collect(
+            lambda dictionary, limit: dictionary.look_up_prefix(text, limit), limit
+        )
+
+    def look_up_translation(self, text, language, limit):
+        return self._collect(
+            lambda dictionary, limit: dictionary.look_up_translation(
+                text, language, limit
+            ),
+            limit,
+        )
+
+    def look_up_similar(self, text, limit):
+        return self._collect(
+            lambda dictionary, limit: dictionary.look_up_similar(text, limit), limit
+        )
+
+    def look_up_pattern(self, text, limit):
+        return self._collect(
+            lambda dictionary, limit: dictionary.look_up_pattern(text, limit), limit
+        )
+
+    def match_prefixes(self, text, start=0):
+        ends = {}
+        for number, dictionary in self._dictionaries():
+            for end, entry_ids in dictionary.match_prefixes(text, start):
+                ends.setdefault(end, []).extend(self._merged_ids(number, entry_ids))
+        return sorted(ends.items(), reverse=True)
@@ -0,0 +1,534 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Optional dictionary service: a separate process holding the loaded
+# dictionary and answering lookups over a local connection (a Unix
+# socket, or a named pipe on Windows), so that the dictionary is not
+# loaded into Anki itself and outlives Anki restarts. The add-on
+# connects to a running service found in SERVICE_FILE_NAME, or starts
+# one. Messages are marshal'ed tuples of plain values; entries are
+# sent as (unique_id, kanji_readings, kana_readings, senses). Only
+# clients knowing the key stored in SERVICE_FILE_NAME (readable by
+# the user only) can connect. If the service goes away, the add-on
+# starts a new one, or loads the dictionary itself if that fails.
+######################################################################
+
+import json
+import logging
+import marshal
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+try:
+    from .dict_lookup import DictionaryEntry
+    from .dict_build import find_python_interpreter, helper_process_arguments
+    from .dict_loader import load_dictionary
+except:
+    from dict_lookup import DictionaryEntry
+    from dict_build import find_python_interpreter, helper_process_arguments
+    from dict_loader import load_dictionary
+
+logger = logging.getLogger(__name__)
+
+SERVICE_FILE_NAME = "%s/%s" % (os.path.dirname(__file__), "dict_service.json")
+# increase whenever the messages change, older services are then replaced
+SERVICE_VERSION = 1
+# the service exits when no client has been connected for that long
+IDLE_TIMEOUT = 4 * 60 * 60
+# seconds to wait for a started service to accept connections
+START_TIMEOUT = 30
+_POLL_INTERVAL = 0.2
+
+# methods answered with a list of entries; further ones are listed in _METHODS
+_ENTRY_LIST_METHODS = {
+    "look_up",
+    "look_up_normalized",
+    "look_up_prefix",
+    "look_up_translation",
+    "look_up_similar",
+    "look_up_pattern",
+}
+_METHODS = _ENTRY_LIST_METHODS | {
+    "get_entry",
+    "get_entry_rank",
+    "get_entry_ids",
+    "get_entry_ids_many",
+    "get_normalized_entry_ids",
+    "look_up_many",
+    "match_prefixes",
+    "get_languages",
+    "load_languages",
+    "get_source",
+    "get_frequency_source",
+}
+
+
+def _encode_entry(entry):
+    if entry is None:
+        return None
+    return (entry.unique_id, entry.kanji_readings, entry.kana_readings, entry.senses)
+
+
+def _decode_entry(data):
+    if data is None:
+        return None
+    unique_id, kanji_readings, kana_readings, senses = data
+    return DictionaryEntry(
+        unique_id=unique_id,
+        kanji_readings=kanji_readings,
+        kana_readings=kana_readings,
+        senses=[
+            (
+                tuple(sys.intern(tag) for tag in part_of_speech),
+                tuple(
+                    sys.intern(text) if index % 2 == 0 else text
+                    for index, text in enumerate(glosses)
+                ),
+            )
+            for part_of_speech, glosses in senses
+        ],
+    )
+
+
+def _encode_result(method, result):
+    if method in _ENTRY_LIST_METHODS:
+        return [_encode_entry(entry) for entry in result]
+    if method == "get_entry":
+        return _encode_entry(result)
+    if method == "look_up_many":
+        return {
+            text: [_encode_entry(entry) for entry in entries]
+            for text, entries in result.items()
+        }
+    return result
+
+
+def _decode_result(method, result):
+    if method in _ENTRY_LIST_METHODS:
+        return [_decode_entry(data) for data in result]
+    if method == "get_entry":
+        return _decode_entry(result)
+    if method == "look_up_many":
+        return {
+            text: [_decode_entry(data) for data in entries]
+            for text, entries in result.items()
+        }
+    return result
+
+
+def _read_state():
+    try:
+        with open(SERVICE_FILE_NAME, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != SERVICE_VERSION:
+        return None
+    return state
+
+
+def _write_state(state):
+    temp_name = SERVICE_FILE_NAME + ".tmp"
+    # the key must not be readable by other users
+    with open(
+        os.open(temp_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600),
+        "w",
+        encoding="utf-8",
+    ) as f:
+        json.dump(state, f)
+    os.replace(temp_name, SERVICE_FILE_NAME)
+
+
+def _connect(state):
+    try:
+        return Client(state["address"], authkey=bytes.fromhex(state["authkey"]))
+    except (
+        OSError,
+        EOFError,
+        ValueError,
+        KeyError,
+        TypeError,
+        AuthenticationError,
+    ) as e:
+        logger.info("Could not connect to the dictionary service: %s", e)
+        return None
+
+
+def _call(connection, method, *args):
+    connection.send_bytes(marshal.dumps((method, args)))
+    ok, result = marshal.loads(connection.recv_bytes())
+    if not ok:
+        raise RuntimeError("Dictionary service failed on %s: %s" % (method, result))
+    return _decode_result(method, result)
+
+
+def _start_service(backend, languages):
+    """Starts a service process detached from Anki; returns it, or None."""
+    interpreter = find_python_interpreter()
+    if interpreter is None:
+        logger.warning("No Python interpreter found to run the dictionary service.")
+        return None
+    arguments = helper_process_arguments()
+    if os.name == "nt":
+        arguments["creationflags"] |= subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        arguments["start_new_session"] = True
+    try:
+        return subprocess.Popen(
+            [
+                interpreter,
+                os.path.abspath(__file__),
+                backend,
+                json.dumps(sorted(languages) if languages is not None else None),
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            **arguments,
+        )
+    except OSError as e:
+        logger.warning("Could not start the dictionary service: %s", e)
+        return None
+
+
+def _wait_for_service(process):
+    """Returns the state of the started process once it accepts connections."""
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline and process.poll() is None:
+        state = _read_state()
+        if state is not None and state.get("pid") == process.pid:
+            return state
+        time.sleep(_POLL_INTERVAL)
+    logger.warning("The dictionary service did not start.")
+    return None
+
+
+def connect_dictionary_service(
+    backend, languages=None, on_progress=None, on_rebuilt=None
+):
+    """Returns a RemoteDictionary for the dictionary of the given backend held by
+    the service, starting the service if none of that backend is running, or
+    None if that fails. Blocks until the service has loaded its dictionary,
+    passing its loading stages to on_progress (see dict_loader). If the service
+    is lost later on, the dictionary replacing it is passed to on_rebuilt, see
+    RemoteDictionary."""
+    state = _read_state()
+    connection = _connect(state) if state is not None else None
+    if connection is not None and state.get("backend") != backend:
+        # the service of another backend is of no further use; it exits once its
+        # other clients are gone
+        try:
+            connection.send_bytes(marshal.dumps(("shutdown", ())))
+        except OSError:
+            pass
+        connection.close()
+        connection = None
+    if connection is None:
+        if on_progress is not None:
+            on_progress("Starting the dictionary service...")
+        process = _start_service(backend, languages)
+        state = process and _wait_for_service(process)
+        connection = state and _connect(state)
+        if not connection:
+            return None
+    try:
+        while True:
+            message = _call(connection, "progress")
+            if message is None:
+                break
+            if on_progress is not None:
+                on_progress(message)
+            time.sleep(_POLL_INTERVAL)
+        _call(connection, "load_languages", languages)
+    except (OSError, EOFError, ValueError, RuntimeError) as e:
+        logger.warning("Dictionary service failed: %s", e)
+        connection.close()
+        return None
+    return RemoteDictionary(
+        connection, state, backend, languages, on_progress, on_rebuilt
+    )
+
+
+class RemoteDictionary:
+    """Dictionary held by the dictionary service, with the same interface as the
+    backends. If the connection is lost, the service is connected again. If that
+    fails, a new service is started on a background thread, or the dictionary is
+    loaded in this process if that fails, too; the new dictionary is passed to
+    on_rebuilt, and the stages to on_progress. Lookups find nothing meanwhile."""
+
+    def __init__(
+        self, connection, state, backend, languages, on_progress=None, on_rebuilt=None
+    ):
+        self._connection = connection
+        self._state = state
+        self._backend = backend
+        # the languages to load into the dictionary replacing this one
+        self._languages = set(languages) if languages is not None else None
+        self._on_progress = on_progress
+        self._on_rebuilt = on_rebuilt
+        self._lock = threading.Lock()
+        self._lost = False
+
+    def _call(self, method, empty, *args):
+        with self._lock:
+            if self._lost:
+                return empty
+            for attempt in range(2):
+                if self._connection is None:
+                    self._connection = _connect(self._state)
+                    if self._connection is None:
+                        break
+                try:
+                    return _call(self._connection, method, *args)
+                except (OSError, EOFError, ValueError, RuntimeError) as e:
+                    logger.warning("Dictionary service failed: %s", e)
+                    self._connection.close()
+                    self._connection = None
+            self._lost = True
+            threading.Thread(target=self._replace, daemon=True).start()
+            return empty
+
+    def _report(self, message):
+        if self._on_progress is not None:
+            self._on_progress(message)
+
+    def _replace(self):
+        """Passes a dictionary replacing the lost service to on_rebuilt."""
+        self._report("Dictionary service lost, restarting it...")
+        try:
+            dictionary = connect_dictionary_service(
+                self._backend, self._languages, self._on_progress, self._on_rebuilt
+            )
+            if dictionary is None:
+                logger.warning(
+                    "Dictionary service not available, loading the dictionary here."
+                )
+                self._report("Dictionary service not available, loading it here...")
+                dictionary = load_dictionary(
+                    self._backend,
+                    languages=self._languages,
+                    on_rebuilt=self._on_rebuilt,
+                    on_progress=self._on_progress,
+                )
+        except Exception as e:
+            logger.warning("Could not load the dictionary: %s", e)
+            self._report("The dictionary could not be loaded.")
+            return
+        if self._on_rebuilt is not None:
+            self._on_rebuilt(dictionary)
+
+    def get_languages(self):
+        return self._call("get_languages", set())
+
+    def load_languages(self, languages=None):
+        if self._languages is not None:
+            self._languages = (
+                None if languages is None else self._languages | set(languages)
+            )
+        return self._call("load_languages", False, languages)
+
+    def get_source(self):
+        return self._call("get_source", None)
+
+    def get_frequency_source(self):
+        return self._call("get_frequency_source", None)
+
+    def get_entry(self, entry_id):
+        return self._call("get_entry", None, entry_id)
+
+    def get_entry_rank(self, entry_id):
+        return self._call("get_entry_rank", 0, entry_id)
+
+    def get_entry_ids(self, text):
+        return self._call("get_entry_ids", [], text)
+
+    def get_entry_ids_many(self, texts):
+        return self._call("get_entry_ids_many", {}, list(texts))
+
+    def get_normalized_entry_ids(self, text):
+        return self._call("get_normalized_entry_ids", [], text)
+
+    def look_up(self, text):
+        return self._call("look_up", [], text)
+
+    def look_up_normalized(self, text):
+        return self._call("look_up_normalized", [], text)
+
+    def look_up_many(self, texts):
+        texts = list(texts)
+        return self._call("look_up_many", dict.fromkeys(texts, []), texts)
+
+    def look_up_prefix(self, text, limit):
+        return self._call("look_up_prefix", [], text, limit)
+
+    def look_up_translation(self, text, language, limit):
+        return self._call("look_up_translation", [], text, language, limit)
+
+    def look_up_similar(self, text, limit):
+        return self._call("look_up_similar", [], text, limit)
+
+    def look_up_pattern(self, text, limit):
+        return self._call("look_up_pattern", [], text, limit)
+
+    def match_prefixes(self, text, start=0):
+        return self._call("match_prefixes", [], text, start)
+
+
+class DictionaryService:
+    """Loads the dictionary and answers the requests of any number of clients, one
+    thread per connection."""
+
+    def __init__(self, backend, languages, listener):
+        self._backend = backend
+        self._languages = languages
+        self._listener = listener
+        self._dictionary = None
+        self._progress = "Loading the dictionary..."
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        self._clients = 0
+        self._last_used = time.monotonic()
+        # set once a client asked the service to exit; it does so when the other
+        # clients are gone
+        self._retired = False
+
+    def load(self):
+        try:
+            dictionary = load_dictionary(
+                self._backend,
+                languages=self._languages,
+                on_rebuilt=self._set_dictionary,
+                on_progress=self._set_progress,
+            )
+            self._set_dictionary(dictionary)
+        except Exception as e:
+            # clients lose their connection and load the dictionary themselves
+            logger.warning("Could not load the dictionary: %s", e)
+            self.shut_down()
+        self._loaded.set()
+
+    def shut_down(self):
+        _remove_state()
+        self._listener.close()
+        os._exit(0)
+
+    def _set_progress(self, message):
+        self._progress = message
+
+    def _set_dictionary(self, dictionary):
+        with self._lock:
+            # languages requested since loading started
+            dictionary.load_languages(self._languages)
+            self._dictionary = dictionary
+
+    def _answer(self, method, args):
+        if method == "progress":
+            return None if self._loaded.is_set() else self._progress
+        if method not in _METHODS:
+            raise ValueError("unknown method %s" % method)
+        self._loaded.wait()
+        with self._lock:
+            if method == "load_languages":
+                languages = args[0] if args else None
+                if self._languages is not None:
+                    self._languages = (
+                        None if languages is None else self._languages | set(languages)
+                    )
+            result = getattr(self._dictionary, method)(*args)
+        return _encode_result(method, result)
+
+    def serve(self, connection):
+        with self._lock:
+            self._clients += 1
+        try:
+            while True:
+                try:
+                    method, args = marshal.loads(connection.recv_bytes())
+                except (OSError, EOFError, ValueError):
+                    break
+                if method == "shutdown":
+                    self._retired = True
+                    break
+                try:
+                    response = (True, self._answer(method, args))
+                except Exception as e:
+                    response = (False, str(e))
+                connection.send_bytes(marshal.dumps(response))
+        finally:
+            connection.close()
+            with self._lock:
+                self._clients -= 1
+                self._last_used = time.monotonic()
+                done = self._retired and self._clients == 0
+            if done:
+                self.shut_down()
+
+    def exit_when_idle(self):
+        while True:
+            time.sleep(60)
+            with self._lock:
+                idle = (
+                    self._clients == 0
+                    and time.monotonic() - self._last_used > IDLE_TIMEOUT
+                )
+            if idle:
+                self.shut_down()
+
+
+def _remove_state():
+    state = _read_state()
+    if state is not None and state.get("pid") == os.getpid():
+        try:
+            os.remove(SERVICE_FILE_NAME)
+        except OSError:
+            pass
+
+
+def _service_address():
+    if os.name == "nt":
+        # a named pipe of arbitrary name
+        return None
+    return os.path.join(
+        tempfile.gettempdir(), "manganki-dictionary-%d.sock" % os.getpid()
+    )
+
+
+def main():
+    backend, languages = sys.argv[1:3]
+    languages = json.loads(languages)
+    authkey = os.urandom(32)
+    listener = Listener(_service_address(), authkey=authkey)
+    service = DictionaryService(
+        backend, set(languages) if languages is not None else None, listener
+    )
+    _write_state(
+        {
+            "version": SERVICE_VERSION,
+            "pid": os.getpid(),
+            "backend": backend,
+            "address": listener.address,
+            "authkey": authkey.hex(),
+        }
+    )
+    threading.Thread(target=service.load, daemon=True).start()
+    threading.Thread(target=service.exit_when_idle, daemon=True).start()
+    while True:
+        try:
+            connection = listener.accept()
+        except (OSError, EOFError, AuthenticationError) as e:
+            # e.g. a client with a wrong key
+            logger.warning("Rejected dictionary service client: %s", e)
+            continue
+        threading.Thread(target=service.serve, args=(connection,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    main()
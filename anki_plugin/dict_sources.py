@@ -0,0 +1,104 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Further dictionary files in jmdict-simplified format, used next to
+# JMdict: JMnedict (names) and KANJIDIC (single kanji). Their items
+# are converted into JMdict words, so that DictionaryLookup can read
+# them and every backend can store them.
+######################################################################
+
+import os
+import typing
+
+
+class DictionarySource(typing.NamedTuple):
+    name: str
+    description: str
+    file_name: str
+    # name of the array of items in the top-level object of the JSON file
+    array_name: str
+    # converts an item into a JMdict word
+    convert: typing.Callable[[dict], dict]
+    # whether the kana readings are looked up, too
+    index_kana: bool
+
+
+# KANJIDIC uses ISO 639-1 language codes, JMdict ISO 639-2
+_KANJIDIC_LANGUAGES = {"en": "eng", "fr": "fre", "es": "spa", "pt": "por"}
+
+
+def jmnedict_word(word: dict) -> dict:
+    """Converts a JMnedict word; its name types become the part of speech."""
+    return {
+        "id": word["id"],
+        "kanji": word["kanji"],
+        "kana": word["kana"],
+        "sense": [
+            {
+                "partOfSpeech": translation["type"],
+                "gloss": [
+                    {"lang": gloss["lang"], "text": gloss["text"]}
+                    for gloss in translation["translation"]
+                ],
+            }
+            for translation in word["translation"]
+        ],
+    }
+
+
+def kanjidic_word(character: dict) -> dict:
+    """Converts a KANJIDIC character. Its on and kun readings become kana readings,
+    its meanings the glosses of a single sense."""
+    groups = (character.get("readingMeaning") or {}).get("groups", [])
+    readings = [
+        reading["value"]
+        for group in groups
+        for reading in group["readings"]
+        if reading["type"] in ("ja_on", "ja_kun")
+    ]
+    frequency = (character.get("misc") or {}).get("frequency")
+    return {
+        "id": character["literal"],
+        "kanji": [
+            {"text": character["literal"], "common": frequency is not None, "tags": []}
+        ],
+        "kana": [{"text": reading, "tags": []} for reading in dict.fromkeys(readings)],
+        "sense": [
+            {
+                "partOfSpeech": ["kanji"],
+                "gloss": [
+                    {
+                        "lang": _KANJIDIC_LANGUAGES.get(
+                            meaning["lang"], meaning["lang"]
+                        ),
+                        "text": meaning["value"],
+                    }
+                    for group in groups
+                    for meaning in group["meanings"]
+                ],
+            }
+        ],
+    }
+
+
+JMNEDICT = DictionarySource(
+    "jmnedict",
+    "Names (JMnedict)",
+    "%s/%s" % (os.path.dirname(__file__), "jmnedict-all-3.5.0.json"),
+    "words",
+    jmnedict_word,
+    True,
+)
+KANJIDIC = DictionarySource(
+    "kanjidic",
+    "Kanji (KANJIDIC)",
+    "%s/%s" % (os.path.dirname(__file__), "kanjidic2-all-3.5.0.json"),
+    "characters",
+    kanjidic_word,
+    # readings of single kanji would bury the words having them
+    False,
+)
+# in the order their entries are listed after those of JMdict
+SECONDARY_SOURCES = [JMNEDICT, KANJIDIC]
@@ -0,0 +1,516 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# SQLite backend for the dictionary: the JSON file is converted once
+# into a local database with indexed readings and an inverted index
+# of the words of the glosses, ranked like that of the other backends
+# (see gloss_index); lookups are answered by indexed queries. Readings
+# carry the rank of their entry (see entry_rank), so that the index
+# returns the entries of a reading best ranked first.
+######################################################################
+
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import sys
+
+try:
+    from .dict_lookup import (
+        DictionaryEntry,
+        DictionaryLookup,
+        DICT_FILE_NAME,
+        ENTRY_CACHE_SIZE,
+    )
+    from .json_stream import iter_json_array, report_progress
+    from .bounded_cache import BoundedCache
+    from .dict_cache import atomic_write, current_file, source_fingerprint
+    from .sorted_keys import prefix_successor, take_distinct
+    from .kana import normalize_kana
+    from .gloss_index import entry_word_ranks, tokenize
+    from .fuzzy_index import MAX_CHECKED_KEYS, closest, key_grams, prepare_query
+    from .batch_lookup import look_up_many
+    from .wildcard_index import parse_pattern
+    from .entry_rank import FREQUENCY_FILE_NAME, load_frequency_list, word_rank
+except:
+    from dict_lookup import (
+        DictionaryEntry,
+        DictionaryLookup,
+        DICT_FILE_NAME,
+        ENTRY_CACHE_SIZE,
+    )
+    from json_stream import iter_json_array, report_progress
+    from bounded_cache import BoundedCache
+    from dict_cache import atomic_write, current_file, source_fingerprint
+    from sorted_keys import prefix_successor, take_distinct
+    from kana import normalize_kana
+    from gloss_index import entry_word_ranks, tokenize
+    from fuzzy_index import MAX_CHECKED_KEYS, closest, key_grams, prepare_query
+    from batch_lookup import look_up_many
+    from wildcard_index import parse_pattern
+    from entry_rank import FREQUENCY_FILE_NAME, load_frequency_list, word_rank
+
+logger = logging.getLogger(__name__)
+
+SQLITE_FILE_NAME = "%s/%s" % (os.path.dirname(__file__), "jmdict-all-3.5.0.json.sqlite")
+
+# increase whenever the schema changes
+FORMAT_VERSION = 7
+
+KANJI_READING = 0
+KANA_READING = 1
+
+# SQLite versions before 3.32 allow at most 999 parameters per statement
+_MAX_QUERY_PARAMETERS = 500
+
+_SCHEMA = """
+CREATE TABLE entries (
+    id INTEGER PRIMARY KEY,
+    unique_id TEXT NOT NULL,
+    rank INTEGER NOT NULL
+);
+CREATE TABLE readings (
+    reading TEXT NOT NULL,
+    entry_id INTEGER NOT NULL,
+    -- rank of the entry
+    rank INTEGER NOT NULL,
+    kind INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    -- normalized spelling (see normalize_kana()), if it differs from reading
+    normalized TEXT
+);
+CREATE TABLE senses (
+    entry_id INTEGER NOT NULL,
+    sense INTEGER NOT NULL,
+    part_of_speech TEXT NOT NULL
+);
+CREATE TABLE glosses (
+    id INTEGER PRIMARY KEY,
+    entry_id INTEGER NOT NULL,
+    sense INTEGER NOT NULL,
+    lang TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+-- inverted index of the glosses, see gloss_index
+CREATE TABLE gloss_words (
+    lang TEXT NOT NULL,
+    word TEXT NOT NULL,
+    entry_id INTEGER NOT NULL,
+    rank INTEGER NOT NULL
+);
+-- bigrams of the normalized readings, see fuzzy_index
+CREATE TABLE reading_grams (gram TEXT NOT NULL, reading TEXT NOT NULL);
+-- suffixes of the readings but the readings themselves, see wildcard_index
+CREATE TABLE reading_suffixes (suffix TEXT NOT NULL, reading TEXT NOT NULL);
+CREATE TABLE languages (lang TEXT PRIMARY KEY);
+CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+_INDEXES = """
+CREATE INDEX readings_by_reading ON readings (reading, rank, entry_id);
+CREATE INDEX readings_by_entry ON readings (entry_id);
+CREATE INDEX readings_by_normalized ON readings (normalized, rank, entry_id)
+    WHERE normalized IS NOT NULL;
+CREATE INDEX senses_by_entry ON senses (entry_id);
+CREATE INDEX glosses_by_entry ON glosses (entry_id);
+CREATE INDEX gloss_words_by_word ON gloss_words (lang, word, rank, entry_id);
+CREATE INDEX reading_grams_by_gram ON reading_grams (gram, reading);
+CREATE INDEX reading_suffixes_by_suffix ON reading_suffixes (suffix, reading);
+"""
+
+
+def _normalized_or_none(reading):
+    normalized = normalize_kana(reading)
+    return normalized if normalized != reading else None
+
+
+def build_sqlite_dictionary(
+    file_name=SQLITE_FILE_NAME, source_file_name=DICT_FILE_NAME, on_progress=None
+):
+    """Converts the JSON dictionary file into a SQLite database stored in file_name.
+    Words are streamed from the JSON file, so only one word is in memory at a time.
+    The database is built in a temporary file that replaces file_name when done.
+    on_progress is called now and then with the fraction of the JSON file read."""
+    with atomic_write(file_name) as temp_name:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        _build_database(temp_name, source_file_name, on_progress)
+
+
+def _build_database(file_name, source_file_name, on_progress):
+    source = source_fingerprint(source_file_name)
+    frequency_source = source_fingerprint(FREQUENCY_FILE_NAME)
+    frequencies = load_frequency_list(FREQUENCY_FILE_NAME)
+    converter = DictionaryLookup()
+    connection = sqlite3.connect(file_name)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(_SCHEMA)
+        with open(source_file_name, encoding="utf-8") as f:
+            for entry_id, word in enumerate(
+                report_progress(iter_json_array(f, "words"), f, on_progress)
+            ):
+                entry = converter.create_entry(word)
+                rank = word_rank(
+                    word, entry.kanji_readings + entry.kana_readings, frequencies
+                )
+                connection.execute(
+                    "INSERT INTO entries VALUES (?, ?, ?)",
+                    (entry_id, entry.unique_id, rank),
+                )
+                connection.executemany(
+                    "INSERT INTO readings VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            reading,
+                            entry_id,
+                            rank,
+                            kind,
+                            position,
+                            _normalized_or_none(reading),
+                        )
+                        for kind, readings in (
+                            (KANJI_READING, entry.kanji_readings),
+                            (KANA_READING, entry.kana_readings),
+                        )
+                        for position, reading in enumerate(readings)
+                    ],
+                )
+                for sense, (part_of_speech, glosses) in enumerate(entry.senses):
+                    connection.execute(
+                        "INSERT INTO senses VALUES (?, ?, ?)",
+                        (entry_id, sense, "\t".join(part_of_speech)),
+                    )
+                    connection.executemany(
+                        "INSERT INTO glosses (entry_id, sense, lang, text) "
+                        "VALUES (?, ?, ?, ?)",
+                        [
+                            (entry_id, sense, glosses[index], glosses[index + 1])
+                            for index in range(0, len(glosses), 2)
+                        ],
+                    )
+                connection.executemany(
+                    "INSERT INTO gloss_words VALUES (?, ?, ?, ?)",
+                    [
+                        (language, word, entry_id, rank)
+                        for language in {
+                            glosses[index]
+                            for _, glosses in entry.senses
+                            for index in range(0, len(glosses), 2)
+                        }
+                        for word, rank in entry_word_ranks(entry, language).items()
+                    ],
+                )
+        connection.executemany(
+            "INSERT INTO reading_grams VALUES (?, ?)",
+            [
+                (gram, reading)
+                for (reading,) in connection.execute(
+                    "SELECT DISTINCT reading FROM readings"
+                ).fetchall()
+                for gram in key_grams(normalize_kana(reading))
+            ],
+        )
+        connection.executemany(
+            "INSERT INTO reading_suffixes VALUES (?, ?)",
+            [
+                (reading[offset:], reading)
+                for (reading,) in connection.execute(
+                    "SELECT DISTINCT reading FROM readings"
+                ).fetchall()
+                for offset in range(1, len(reading))
+            ],
+        )
+        connection.executemany(
+            "INSERT INTO languages VALUES (?)",
+            [(language,) for language in converter.get_languages()],
+        )
+        connection.executemany(
+            "INSERT INTO metadata VALUES (?, ?)",
+            [
+                ("version", str(FORMAT_VERSION)),
+                ("source", json.dumps(source)),
+                ("frequency_source", json.dumps(frequency_source)),
+            ],
+        )
+        connection.executescript(_INDEXES)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+class SqliteDictionary:
+    """Dictionary backed by a database written by build_sqlite_dictionary(). Provides
+    the same look_up()/get_languages() interface as DictionaryLookup; nothing but a
+    bounded cache of recently used entries is kept in memory."""
+
+    def __init__(self, file_name=SQLITE_FILE_NAME):
+        # opened during loading, but used from the GUI thread afterwards; the URI
+        # escapes characters such as ? and # in the path
+        self._connection = sqlite3.connect(
+            pathlib.Path(file_name).resolve().as_uri() + "?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+        try:
+            metadata = dict(self._connection.execute("SELECT key, value FROM metadata"))
+            if metadata.get("version") != str(FORMAT_VERSION):
+                raise ValueError(
+                    "Unsupported dictionary database version %s."
+                    % metadata.get("version")
+                )
+            self._source = json.loads(metadata["source"])
+            self._frequency_source = json.loads(metadata["frequency_source"])
+            self._languages = {
+                row[0] for row in self._connection.execute("SELECT lang FROM languages")
+            }
+            (self._max_reading_length,) = self._connection.execute(
+                "SELECT IFNULL(MAX(LENGTH(reading)), 0) FROM readings"
+            ).fetchone()
+        except Exception:
+            self._connection.close()
+            raise
+        self._entry_cache = BoundedCache(ENTRY_CACHE_SIZE)
+
+    def close(self):
+        self._connection.close()
+
+    def get_languages(self):
+        return self._languages
+
+    def load_languages(self, languages=None):
+        """All glosses are read from the file on lookup, nothing to load."""
+        return True
+
+    def get_source(self):
+        """Returns the fingerprint of the JSON file the dictionary was built from."""
+        return self._source
+
+    def get_frequency_source(self):
+        """Returns the fingerprint of the frequency list the ranks are based on."""
+        return self._frequency_source
+
+    def get_entry_rank(self, entry_id):
+        """Returns the rank of the entry (see entry_rank); lower is better."""
+        (rank,) = self._connection.execute(
+            "SELECT rank FROM entries WHERE id = ?", (entry_id,)
+        ).fetchone()
+        return rank
+
+    def _read_entry(self, entry_id):
+        (unique_id,) = self._connection.execute(
+            "SELECT unique_id FROM entries WHERE id = ?", (entry_id,)
+        ).fetchone()
+        readings = ([], [])
+        for reading, kind in self._connection.execute(
+            "SELECT reading, kind FROM readings WHERE entry_id = ? "
+            "ORDER BY kind, position",
+            (entry_id,),
+        ):
+            readings[kind].append(reading)
+        glosses = {}
+        for sense, language, text in self._connection.execute(
+            "SELECT sense, lang, text FROM glosses WHERE entry_id = ? ORDER BY id",
+            (entry_id,),
+        ):
+            glosses.setdefault(sense, []).extend((language, text))
+        senses = [
+            (
+                tuple(part_of_speech.split("\t")) if part_of_speech else (),
+                tuple(glosses.get(sense, ())),
+            )
+            for sense, part_of_speech in self._connection.execute(
+                "SELECT sense, part_of_speech FROM senses WHERE entry_id = ? "
+                "ORDER BY sense",
+                (entry_id,),
+            )
+        ]
+        return DictionaryEntry(
+            unique_id=unique_id,
+            kanji_readings=readings[KANJI_READING],
+            kana_readings=readings[KANA_READING],
+            senses=senses,
+        )
+
+    def get_entry(self, entry_id):
+        entry = self._entry_cache.get(entry_id)
+        if entry is None:
+            entry = self._read_entry(entry_id)
+            self._entry_cache.put(entry_id, entry)
+        return entry
+
+    def get_entry_ids(self, text):
+        return [
+            row[0]
+            for row in self._connection.execute(
+                "SELECT entry_id FROM readings WHERE reading = ? "
+                "ORDER BY rank, entry_id",
+                (text,),
+            )
+        ]
+
+    def get_normalized_entry_ids(self, text):
+        """Returns the ids of the entries with a reading that has the same normalized
+        spelling (see normalize_kana()) as text."""
+        normalized = normalize_kana(text)
+        variants = self._connection.execute(
+            "SELECT entry_id FROM readings WHERE normalized = ? "
+            "ORDER BY rank, entry_id",
+            (normalized,),
+        )
+        return take_distinct(
+            (self.get_entry_ids(normalized), (row[0] for row in variants)),
+            sys.maxsize,
+        )
+
+    def look_up_normalized(self, text):
+        """Like look_up(), but ignoring differences between katakana and hiragana,
+        small and normal sized kana and long vowel marks."""
+        return [
+            self.get_entry(entry_id) for entry_id in self.get_normalized_entry_ids(text)
+        ]
+
+    def get_entry_ids_many(self, texts):
+        """Returns text -> get_entry_ids(text) for all texts with entries, queried
+        in batches."""
+        texts = list(texts)
+        result = {}
+        for start in range(0, len(texts), _MAX_QUERY_PARAMETERS):
+            batch = texts[start : start + _MAX_QUERY_PARAMETERS]
+            for reading, entry_id in self._connection.execute(
+                "SELECT reading, entry_id FROM readings WHERE reading IN (%s) "
+                "ORDER BY rank, entry_id" % ", ".join("?" * len(batch)),
+                batch,
+            ):
+                result.setdefault(reading, []).append(entry_id)
+        return result
+
+    def look_up_translation(self, text, language, limit):
+        """Returns up to limit entries having all words of text in their glosses in
+        language, best matches first."""
+        words = list(dict.fromkeys(tokenize(text)))
+        if not words:
+            return []
+        rows = self._connection.execute(
+            "SELECT entry_id FROM gloss_words WHERE lang = ? AND word IN (%s) "
+            "GROUP BY entry_id HAVING COUNT(*) = ? ORDER BY MAX(rank), entry_id "
+            "LIMIT ?" % ", ".join("?" * len(words)),
+            [language] + words + [len(words), limit],
+        )
+        return [self.get_entry(entry_id) for (entry_id,) in rows.fetchall()]
+
+    def look_up_similar(self, text, limit):
+        """Returns up to limit entries with a reading within a small edit distance of
+        text (see fuzzy_index), closest first. Meant as fallback for texts that
+        look_up() finds nothing for."""
+        query = prepare_query(text)
+        if query is None:
+            return []
+        grams = list(query.grams)
+        rows = self._connection.execute(
+            "SELECT reading FROM reading_grams WHERE gram IN (%s) GROUP BY reading "
+            "HAVING COUNT(*) >= ? ORDER BY COUNT(*) DESC, reading LIMIT ?"
+            % ", ".join("?" * len(grams)),
+            grams + [query.min_shared_grams, MAX_CHECKED_KEYS],
+        )
+        # readings are ordered like the sorted readings of the other backends
+        readings = closest(
+            query,
+            ((reading.encode("utf-8"), reading) for (reading,) in rows.fetchall()),
+            limit,
+        )
+        readings = [reading.decode("utf-8") for reading in readings]
+        entry_ids = self.get_entry_ids_many(readings)
+        entry_ids = take_distinct(
+            (entry_ids.get(reading, ()) for reading in readings), limit
+        )
+        return [self.get_entry(entry_id) for entry_id in entry_ids]
+
+    def look_up_pattern(self, text, limit):
+        """Returns up to limit entries with a reading matching the wildcard pattern
+        text (see wildcard_index), ordered by reading."""
+        pattern = parse_pattern(text)
+        if pattern is None:
+            return []
+        if len(pattern.prefix) >= len(pattern.literal):
+            successor = prefix_successor(pattern.prefix)
+            rows = self._connection.execute(
+                "SELECT DISTINCT reading FROM readings WHERE reading >= ? AND "
+                "(? IS NULL OR reading < ?) ORDER BY reading",
+                (pattern.prefix, successor, successor),
+            )
+        else:
+            successor = prefix_successor(pattern.literal)
+            rows = self._connection.execute(
+                "SELECT reading FROM readings WHERE reading >= ?1 AND "
+                "(?2 IS NULL OR reading < ?2) UNION "
+                "SELECT reading FROM reading_suffixes WHERE suffix >= ?1 AND "
+                "(?2 IS NULL OR suffix < ?2) ORDER BY reading",
+                (pattern.literal, successor),
+            )
+        readings = [
+            reading
+            for (reading,) in rows.fetchall()
+            if pattern.regex.fullmatch(reading)
+        ]
+        entry_ids = take_distinct(
+            (self.get_entry_ids(reading) for reading in readings), limit
+        )
+        return [self.get_entry(entry_id) for entry_id in entry_ids]
+
+    def look_up(self, text):
+        return [self.get_entry(entry_id) for entry_id in self.get_entry_ids(text)]
+
+    def look_up_many(self, texts):
+        """Returns text -> entries for many texts at once, see batch_lookup."""
+        return look_up_many(self, texts)
+
+    def look_up_prefix(self, text, limit):
+        """Returns up to limit entries with a reading starting with text, ordered by
+        reading, so exact matches come first."""
+        if not text:
+            return []
+        # readings are compared bytewise, which matches the order of prefix_range()
+        successor = prefix_successor(text)
+        rows = self._connection.execute(
+            "SELECT entry_id FROM readings WHERE reading >= ? AND (? IS NULL OR "
+            "reading < ?) ORDER BY reading, rank, entry_id",
+            (text, successor, successor),
+        )
+        entry_ids = take_distinct(rows, limit)
+        return [self.get_entry(entry_id) for entry_id in entry_ids]
+
+    def match_prefixes(self, text, start=0):
+        """Returns (end, entry_ids) for every reading that text has at position
+        start, i.e. for every text[start:end] look_up() knows, longest first."""
+        prefixes = [
+            text[start:end]
+            for end in range(
+                start + 1, min(len(text), start + self._max_reading_length) + 1
+            )
+        ]
+        entry_ids = self.get_entry_ids_many(prefixes)
+        return [
+            (start + len(reading), ids)
+            for reading, ids in sorted(
+                entry_ids.items(), key=lambda item: len(item[0]), reverse=True
+            )
+        ]
+
+    @staticmethod
+    def open(file_name=SQLITE_FILE_NAME):
+        """Returns the dictionary stored in the database file_name. If the file is
+        missing, was written by another format version or is damaged, None is
+        returned."""
+        file_name = current_file(file_name)
+        if not os.path.exists(file_name):
+            return None
+        try:
+            return SqliteDictionary(file_name)
+        except (sqlite3.Error, ValueError, KeyError) as e:
+            logger.warning("Could not open SQLite dictionary %s: %s", file_name, e)
+            return None
@@ -0,0 +1,122 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Incremental update of a dictionary cache to a new release of the
+# JSON file. The words are located in the file without decoding them
+# and identified by a hash of their JSON text, which includes their
+# JMdict id. Entries whose hash is found again are kept and only get
+# their new entry ids; only words with an unknown hash (added or
+# changed ones) are decoded, and entries whose hash is gone (removed
+# or changed ones) are dropped from the indexes.
+######################################################################
+
+import array
+import hashlib
+import json
+import mmap
+import typing
+
+try:
+    from .dict_build import WORDS_ARRAY_START, WORD_START
+except:
+    from dict_build import WORDS_ARRAY_START, WORD_START
+
+# new id of a dropped entry
+REMOVED = -1
+
+
+class WordSpan(typing.NamedTuple):
+    # location of the word's JSON text in the file, in bytes
+    offset: int
+    length: int
+    # see word_hash()
+    digest: int
+
+
+class EntryDiff(typing.NamedTuple):
+    # old entry id -> new entry id, or REMOVED
+    new_ids: array.array
+    # new ids of the entries that have to be created from their words
+    added_ids: typing.List[int]
+    # whether the kept entries are in the same order as before
+    in_order: bool
+
+
+def word_hash(text: bytes) -> int:
+    """Returns the 64-bit hash of the JSON text of a word."""
+    return int.from_bytes(hashlib.blake2b(text, digest_size=8).digest(), "little")
+
+
+def _span(text: bytes, offset: int) -> WordSpan:
+    return WordSpan(offset, len(text), word_hash(text))
+
+
+def scan_words(file_name) -> typing.Optional[typing.List[WordSpan]]:
+    """Returns the WordSpan of every word in the "words" array of the JSON file, in
+    file order, or None if the file cannot be read or the words cannot be told
+    apart without decoding them."""
+    try:
+        with open(file_name, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            array_start = WORDS_ARRAY_START.search(data)
+            if array_start is None:
+                return None
+            starts = [
+                match.start() for match in WORD_START.finditer(data, array_start.end())
+            ]
+            spans = []
+            for start, end in zip(starts, starts[1:]):
+                text = data[start:end].rstrip()
+                if not text.endswith(b","):
+                    # the match was no word of the array, but a nested object
+                    return None
+                spans.append(_span(text[:-1].rstrip(), start))
+            if starts:
+                # the last word is followed by the end of the array
+                tail = data[starts[-1] :].decode("utf-8")
+                end = json.JSONDecoder().raw_decode(tail)[1]
+                spans.append(_span(tail[:end].encode("utf-8"), starts[-1]))
+    except (OSError, ValueError):
+        return None
+    return spans
+
+
+def read_word(f, span: WordSpan):
+    """Decodes the word at span from the JSON file opened in binary mode."""
+    f.seek(span.offset)
+    return json.loads(f.read(span.length))
+
+
+def diff_entries(old_hashes: typing.Sequence[int], spans: typing.List[WordSpan]):
+    """Returns the EntryDiff between entries with old_hashes and the words at spans;
+    entry ids are positions in both."""
+    old_ids = {digest: entry_id for entry_id, digest in enumerate(old_hashes)}
+    new_ids = array.array("i", [REMOVED]) * len(old_hashes)
+    added_ids = []
+    last_old_id = -1
+    in_order = True
+    for new_id, span in enumerate(spans):
+        old_id = old_ids.pop(span.digest, None)
+        if old_id is None:
+            added_ids.append(new_id)
+            continue
+        new_ids[old_id] = new_id
+        in_order = in_order and old_id > last_old_id
+        last_old_id = old_id
+    return EntryDiff(new_ids, added_ids, in_order)
+
+
+def remap_postings(index: typing.Dict[str, list], new_ids: array.array):
+    """Returns a copy of the key -> entry ids index with the ids replaced by new_ids;
+    keys left without entries are dropped."""
+    result = {}
+    for key, entry_ids in index.items():
+        mapped = [new_ids[entry_id] for entry_id in entry_ids]
+        if REMOVED in mapped:
+            mapped = [entry_id for entry_id in mapped if entry_id != REMOVED]
+        if mapped:
+            result[key] = mapped
+    return result
@@ -0,0 +1,56 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Ranking of dictionary entries by how common they are, so that the
+# entries of a reading can be stored best first. JMdict marks words
+# from its priority lists (news, ichi, spec, gai) as "common"; an
+# optional frequency list (one word per line, most frequent first)
+# orders the entries further.
+######################################################################
+
+import logging
+import os
+import typing
+
+logger = logging.getLogger(__name__)
+
+FREQUENCY_FILE_NAME = "%s/%s" % (os.path.dirname(__file__), "frequency.txt")
+
+# position of words missing in the frequency list
+_UNLISTED = (1 << 24) - 1
+_UNCOMMON = 1 << 24
+
+
+def load_frequency_list(file_name=FREQUENCY_FILE_NAME) -> typing.Dict[str, int]:
+    """Returns word -> position in the frequency list file_name, or an empty dict if
+    there is none. Only the first tab-separated column of a line is used, so lists
+    with counts work as well; empty lines and lines starting with # are skipped."""
+    frequencies = {}
+    try:
+        with open(file_name, encoding="utf-8-sig") as f:
+            for line in f:
+                word = line.split("\t", 1)[0].strip()
+                if word and not word.startswith("#"):
+                    frequencies.setdefault(word, min(len(frequencies), _UNLISTED))
+    except FileNotFoundError:
+        return {}
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning("Could not read frequency list %s: %s", file_name, e)
+        return {}
+    return frequencies
+
+
+def word_rank(word, readings: typing.Sequence[str], frequencies) -> int:
+    """Returns the rank of a JMdict word with the given (kept) readings; lower is
+    better. Common words come first, then words by their best position in the
+    frequency list."""
+    common = any(
+        reading.get("common") for kind in ("kanji", "kana") for reading in word[kind]
+    )
+    position = min(
+        (frequencies.get(reading, _UNLISTED) for reading in readings),
+        default=_UNLISTED,
+    )
+    return (0 if common else _UNCOMMON) + position
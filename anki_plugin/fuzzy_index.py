@@ -0,0 +1,134 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Approximate matching of readings, for misread kana or kanji. The
+# readings are indexed by the bigrams of their normalized spelling
+# (see kana.normalize_kana); a query only computes edit distances
+# for readings sharing enough bigrams with it, as each edit changes
+# at most two bigrams.
+######################################################################
+
+import array
+import collections
+import itertools
+import typing
+
+try:
+    from .kana import is_kana, normalize_kana
+except:
+    from kana import is_kana, normalize_kana
+
+# shorter texts match too many readings by chance
+MIN_QUERY_LENGTH = 3
+# kanji tell more apart, and most kanji compounds have two characters
+MIN_KANJI_QUERY_LENGTH = 2
+# longer texts are rather phrases than misspelled words
+MAX_QUERY_LENGTH = 12
+# at most that many readings get their edit distance computed per query
+MAX_CHECKED_KEYS = 2000
+
+_START = "\x02"
+_END = "\x03"
+
+
+def key_grams(normalized: str) -> typing.Set[str]:
+    """Returns the bigrams of a normalized reading, including its start and end."""
+    padded = _START + normalized + _END
+    return {padded[index : index + 2] for index in range(len(padded) - 1)}
+
+
+def build_gram_index(keys: typing.Sequence[str]):
+    """Returns bigram -> positions in keys of the keys having it."""
+    index = {}
+    for position, key in enumerate(keys):
+        for gram in key_grams(normalize_kana(key)):
+            index.setdefault(gram, array.array("I")).append(position)
+    return index
+
+
+def edit_distance(first: str, second: str, limit: int) -> int:
+    """Returns the Levenshtein distance of the strings, or limit + 1 if it exceeds
+    limit."""
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for row, char in enumerate(first, 1):
+        current = [row]
+        for column, other in enumerate(second, 1):
+            current.append(
+                min(
+                    previous[column] + 1,
+                    current[column - 1] + 1,
+                    previous[column - 1] + (char != other),
+                )
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+class FuzzyQuery(typing.NamedTuple):
+    normalized: str
+    grams: typing.Set[str]
+    distance_limit: int
+    # readings sharing fewer bigrams are too far away
+    min_shared_grams: int
+
+
+def prepare_query(text: str) -> typing.Optional[FuzzyQuery]:
+    """Returns the query for approximate matches of text, or None if text is too
+    short or too long for them."""
+    normalized = normalize_kana(text)
+    min_length = MIN_QUERY_LENGTH if is_kana(normalized) else MIN_KANJI_QUERY_LENGTH
+    if not min_length <= len(normalized) <= MAX_QUERY_LENGTH:
+        return None
+    grams = key_grams(normalized)
+    distance_limit = 1 if len(normalized) <= 5 else 2
+    return FuzzyQuery(
+        normalized, grams, distance_limit, max(1, len(grams) - 2 * distance_limit)
+    )
+
+
+def closest(query: FuzzyQuery, candidates: typing.Iterable, limit: int) -> list:
+    """Takes (order, reading) pairs of candidate readings, most promising first, and
+    returns the order values of up to limit readings within the distance limit of
+    the query, closest first and by order for the same distance."""
+    matches = []
+    for order, key in itertools.islice(candidates, MAX_CHECKED_KEYS):
+        distance = edit_distance(
+            normalize_kana(key), query.normalized, query.distance_limit
+        )
+        if distance <= query.distance_limit:
+            matches.append((distance, order))
+    matches.sort()
+    return [order for _, order in matches[:limit]]
+
+
+def find_similar(
+    text: str,
+    get_postings: typing.Callable[[str], typing.Sequence[int]],
+    get_key: typing.Callable[[int], str],
+    limit: int,
+) -> typing.List[int]:
+    """Returns up to limit key positions of the readings within a small edit distance
+    of text (after normalization), closest first. get_postings returns the key
+    positions for a bigram (see build_gram_index()), get_key the reading at a
+    key position."""
+    query = prepare_query(text)
+    if query is None:
+        return []
+    counts = collections.Counter(
+        itertools.chain.from_iterable(get_postings(gram) for gram in query.grams)
+    )
+    candidates = [
+        position
+        for position, count in counts.items()
+        if count >= query.min_shared_grams
+    ]
+    candidates.sort(key=lambda position: (-counts[position], position))
+    return closest(
+        query, ((position, get_key(position)) for position in candidates), limit
+    )
@@ -0,0 +1,126 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Inverted index from the words of the glosses (translations) of one
+# language to the entries, for looking up Japanese words by their
+# translation. Postings are ranked when the index is built: an entry
+# ranks higher for a word if the word occurs in a short gloss of an
+# early sense, so "umbrella" finds 傘 before 日傘をさす.
+######################################################################
+
+import array
+import re
+import typing
+import unicodedata
+
+_WORD = re.compile(r"[^\W_]+")
+_MAX_SENSE = 1023
+
+
+def tokenize(text: str) -> typing.List[str]:
+    """Returns the words of text, case-folded and without diacritics."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _WORD.findall(text)
+
+
+def gloss_rank(word_count: int, sense: int) -> int:
+    """Rank of a word occurring in a gloss of word_count words in the given sense of
+    an entry; lower is better."""
+    return word_count * (_MAX_SENSE + 1) + min(sense, _MAX_SENSE)
+
+
+def entry_word_ranks(entry, language: str) -> typing.Dict[str, int]:
+    """Returns word -> best rank for all words of the entry's glosses in language."""
+    ranks = {}
+    for sense, (_, glosses) in enumerate(entry.senses):
+        for index in range(0, len(glosses), 2):
+            if glosses[index] != language:
+                continue
+            words = tokenize(glosses[index + 1])
+            rank = gloss_rank(len(words), sense)
+            for word in words:
+                if rank < ranks.get(word, rank + 1):
+                    ranks[word] = rank
+    return ranks
+
+
+def build_gloss_index(entries: typing.Iterable, language: str):
+    """Returns word -> (entry ids, ranks) for the glosses in language of the entries
+    (entry ids being positions in entries), as two arrays ordered by rank."""
+    return update_gloss_index({}, (), enumerate(entries), language)
+
+
+def build_gloss_indexes(entries: typing.Iterable, languages: typing.Iterable):
+    """Returns language -> build_gloss_index(entries, language) for all languages,
+    going through the entries only once."""
+    postings = {language: {} for language in languages}
+    for entry_id, entry in enumerate(entries):
+        for language, words in postings.items():
+            for word, rank in entry_word_ranks(entry, language).items():
+                words.setdefault(word, []).append((rank, entry_id))
+    return {
+        language: {
+            word: _ranked_postings(word_postings)
+            for word, word_postings in words.items()
+        }
+        for language, words in postings.items()
+    }
+
+
+def update_gloss_index(index, new_ids, added_entries: typing.Iterable, language: str):
+    """Returns the index of build_gloss_index() for an updated dictionary: the entry
+    ids of index are replaced by new_ids (negative for removed entries; kept entries
+    have to stay in order), and the (entry id, entry) pairs added_entries are
+    added."""
+    added = {}
+    for entry_id, entry in added_entries:
+        for word, rank in entry_word_ranks(entry, language).items():
+            added.setdefault(word, []).append((rank, entry_id))
+    result = {}
+    for word, (entry_ids, ranks) in index.items():
+        mapped = list(map(new_ids.__getitem__, entry_ids))
+        word_added = added.pop(word, None)
+        if word_added is None and min(mapped, default=0) >= 0:
+            # the order of the postings is kept, so are their ranks
+            result[word] = (array.array("I", mapped), ranks)
+            continue
+        postings = [
+            (rank, entry_id) for rank, entry_id in zip(ranks, mapped) if entry_id >= 0
+        ]
+        if postings or word_added:
+            result[word] = _ranked_postings(postings + (word_added or []))
+    for word, postings in added.items():
+        result[word] = _ranked_postings(postings)
+    return result
+
+
+def _ranked_postings(postings):
+    postings.sort()
+    return (
+        array.array("I", (entry_id for _, entry_id in postings)),
+        array.array("I", (rank for rank, _ in postings)),
+    )
+
+
+def find_ranked(postings: typing.List[typing.Tuple], limit: int) -> typing.List[int]:
+    """Combines the (entry ids, ranks) postings of all words of a query: returns up
+    to limit ids of the entries having all words, ordered by their worst rank
+    among the words."""
+    if not postings:
+        return []
+    if len(postings) == 1:
+        return list(postings[0][0][:limit])
+    postings = sorted(postings, key=lambda item: len(item[0]))
+    ranks = dict(zip(*postings[0]))
+    for entry_ids, word_ranks in postings[1:]:
+        ranks = {
+            entry_id: max(rank, ranks[entry_id])
+            for entry_id, rank in zip(entry_ids, word_ranks)
+            if entry_id in ranks
+        }
+        if not ranks:
+            return []
+    return sorted(ranks, key=lambda entry_id: (ranks[entry_id], entry_id))[:limit]
@@ -0,0 +1,156 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Incremental JSON reading: walks the items of one array inside the
+# top-level object of a (large) JSON file without building the whole
+# document tree in memory.
+######################################################################
+
+import json
+import os
+import re
+import typing
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_VALUE_END = re.compile(r"[ \t\n\r,:\]}]")
+CHUNK_SIZE = 1 << 20
+# items between two progress reports of report_progress()
+PROGRESS_INTERVAL = 4096
+
+
+class _Reader:
+    """Character buffer over a text file that is refilled on demand."""
+
+    def __init__(self, text_file: typing.TextIO, chunk_size: int, track_bytes: bool):
+        self._file = text_file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._track_bytes = track_bytes
+        # character position in _buf whose UTF-8 offset in the file is known
+        self._mark = 0
+        self._mark_byte = 0
+
+    def _fill(self):
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        if self._track_bytes:
+            self.byte_offset()
+            self._mark = 0
+        self._buf = self._buf[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def byte_offset(self):
+        """Returns the offset (in bytes of the UTF-8 file) of the current position."""
+        self._mark_byte += len(self._buf[self._mark : self._pos].encode("utf-8"))
+        self._mark = self._pos
+        return self._mark_byte
+
+    def next_char(self):
+        """Skips whitespace and returns the next character without consuming it
+        ("" at the end of the file)."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, characters):
+        char = self.next_char()
+        if not char or char not in characters:
+            raise ValueError(
+                "Malformed JSON: expected one of %r, found %r." % (characters, char)
+            )
+        self._pos += 1
+        return char
+
+    def value(self):
+        """Decodes and consumes the next JSON value."""
+        self.next_char()
+        while True:
+            try:
+                result, end = self._decoder.raw_decode(self._buf, self._pos)
+                # a value cut off at the end of the buffer (e.g. a number) may
+                # continue in the next chunk
+                if self._eof or _VALUE_END.match(self._buf, end):
+                    self._pos = end
+                    return result
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+
+def iter_json_array(
+    text_file: typing.TextIO,
+    array_key: str,
+    header: typing.Optional[dict] = None,
+    chunk_size: int = CHUNK_SIZE,
+    with_spans: bool = False,
+):
+    """Yields the items of the array stored under array_key in the top-level object
+    of text_file, one at a time. Other top-level values are decoded and, if header is
+    given, stored in it.
+    With with_spans, (item, byte_offset, byte_length) tuples are yielded instead, giving
+    the location of the item's JSON text in the file; text_file then has to be a
+    UTF-8 file opened with newline="", so that offsets are not shifted."""
+    reader = _Reader(text_file, chunk_size, with_spans)
+    reader.expect("{")
+    if reader.next_char() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == array_key:
+            reader.expect("[")
+            if reader.next_char() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    if with_spans:
+                        reader.next_char()
+                        start = reader.byte_offset()
+                        item = reader.value()
+                        yield item, start, reader.byte_offset() - start
+                    else:
+                        yield reader.value()
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            value = reader.value()
+            if header is not None:
+                header[key] = value
+        if reader.expect(",}") == "}":
+            return
+
+
+def read_fraction(text_file: typing.TextIO) -> float:
+    """Returns the fraction of the file that has been read so far."""
+    size = os.fstat(text_file.fileno()).st_size
+    return min(1.0, text_file.buffer.tell() / size) if size else 1.0
+
+
+def report_progress(
+    items: typing.Iterable,
+    text_file: typing.TextIO,
+    on_progress: typing.Optional[typing.Callable[[float], None]],
+):
+    """Yields the items read from text_file, passing read_fraction() to on_progress
+    after every PROGRESS_INTERVAL items (if on_progress is given)."""
+    if on_progress is None:
+        yield from items
+        return
+    for count, item in enumerate(items, 1):
+        yield item
+        if count % PROGRESS_INTERVAL == 0:
+            on_progress(read_fraction(text_file))
@@ -0,0 +1,66 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Folding of Japanese spelling variants for lookups: katakana and
+# hiragana, small and normal sized kana, and the long vowel mark are
+# mapped to a single normalized hiragana spelling.
+######################################################################
+
+import unicodedata
+
+_KATAKANA_START = ord("ァ")
+_KATAKANA_END = ord("ヶ")
+_KATAKANA_TO_HIRAGANA = ord("ぁ") - ord("ァ")
+
+_SMALL_KANA = "ぁぃぅぇぉゃゅょゎゕゖ"
+_NORMAL_KANA = "あいうえおやゆよわかけ"
+
+_FOLDING = {
+    code: code + _KATAKANA_TO_HIRAGANA
+    for code in range(_KATAKANA_START, _KATAKANA_END + 1)
+}
+# small katakana directly become normal sized hiragana
+_FOLDING.update(
+    (ord(small) - _KATAKANA_TO_HIRAGANA, ord(normal))
+    for small, normal in zip(_SMALL_KANA, _NORMAL_KANA)
+)
+_FOLDING.update(
+    (ord(small), ord(normal)) for small, normal in zip(_SMALL_KANA, _NORMAL_KANA)
+)
+
+LONG_VOWEL_MARK = "ー"
+_VOWELS = {}
+for _vowel, _row in (
+    ("あ", "あかがさざただなはばぱまやらわ"),
+    ("い", "いきぎしじちぢにひびぴみりゐ"),
+    ("う", "うくぐすずつづぬふぶぷむゆるゔ"),
+    ("え", "えけげせぜてでねへべぺめれゑ"),
+    ("お", "おこごそぞとどのほぼぽもよろを"),
+):
+    _VOWELS.update((kana, _vowel) for kana in _row)
+
+
+def normalize_kana(text: str) -> str:
+    """Returns the normalized spelling of text: half-width and full-width forms are
+    unified, katakana become hiragana, small kana become normal sized ones, and a
+    long vowel mark is replaced by the vowel of the kana before it. Kanji and other
+    characters are kept."""
+    text = unicodedata.normalize("NFKC", text).translate(_FOLDING)
+    if LONG_VOWEL_MARK not in text:
+        return text
+    result = []
+    for char in text:
+        if char == LONG_VOWEL_MARK and result:
+            char = _VOWELS.get(result[-1], char)
+        result.append(char)
+    return "".join(result)
+
+
+def is_kana(text: str) -> bool:
+    """Checks whether text consists of kana (and long vowel marks) only, in any of
+    their forms."""
+    return all(
+        "ぁ" <= char <= "ゖ" or char == LONG_VOWEL_MARK for char in normalize_kana(text)
+    )
@@ -0,0 +1,149 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Timing of the startup and dictionary loading phases: wall time, CPU
+# time of the whole process and its peak resident set size (RSS) so
+# far are logged at INFO level when a phase ends. If the environment
+# variable MANGANKI_TIMING_REPORT names a file, every phase is also
+# appended to it as a line of JSON, to compare machines and releases.
+# Nothing is measured unless one of the two is enabled.
+######################################################################
+
+import json
+import logging
+import os
+import platform
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+REPORT_VARIABLE = "MANGANKI_TIMING_REPORT"
+# identifies the phases of one process in the report
+_RUN = "%d-%d" % (os.getpid(), time.time())
+_report_lock = threading.Lock()
+
+
+def _report_file_name():
+    return os.environ.get(REPORT_VARIABLE)
+
+
+def is_enabled():
+    return bool(_report_file_name()) or logger.isEnabledFor(logging.INFO)
+
+
+def peak_rss():
+    """Returns the peak resident set size of the process in bytes, or None if it is
+    not known."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+def _format_size(size):
+    if size is None:
+        return "unknown"
+    return "%.1f MB" % (size / (1 << 20))
+
+
+def record_phase(phase, wall, cpu, **details):
+    """Logs a finished phase and appends it to the report, if any."""
+    rss = peak_rss()
+    logger.info(
+        "%s: %.3f s wall, %.3f s CPU, peak RSS %s%s",
+        phase,
+        wall,
+        cpu,
+        _format_size(rss),
+        "".join(" %s=%s" % item for item in details.items()),
+    )
+    file_name = _report_file_name()
+    if not file_name:
+        return
+    line = json.dumps(
+        {
+            "run": _RUN,
+            "phase": phase,
+            "wall": round(wall, 6),
+            "cpu": round(cpu, 6),
+            "peak_rss": rss,
+            "time": time.time(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "details": details,
+        },
+        default=str,
+    )
+    with _report_lock:
+        try:
+            with open(file_name, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning("Could not write timing report %s: %s", file_name, e)
+
+
+class TimedPhase:
+    """Measures a phase from its creation until finish(), or the block it is used as
+    context manager for. details are reported with it (e.g. the backend)."""
+
+    def __init__(self, phase, **details):
+        self._phase = phase
+        self._details = details
+        self._enabled = is_enabled()
+        if self._enabled:
+            self._wall = time.perf_counter()
+            self._cpu = time.process_time()
+
+    def finish(self, **details):
+        if self._enabled:
+            self._enabled = False
+            record_phase(
+                self._phase,
+                time.perf_counter() - self._wall,
+                time.process_time() - self._cpu,
+                **{**self._details, **details},
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish(**({"failed": exc_type.__name__} if exc_type else {}))
+
+
+def timed_iteration(items, phase, consumer_phase):
+    """Yields the items, reporting the time spent producing them as phase and the
+    time spent by the consumer between them as consumer_phase once exhausted; e.g.
+    reading JSON words versus creating entries from them."""
+    if not is_enabled():
+        yield from items
+        return
+    produced = [0.0, 0.0]
+    consumed = [0.0, 0.0]
+    iterator = iter(items)
+    try:
+        while True:
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            produced_wall, produced_cpu = time.perf_counter(), time.process_time()
+            produced[0] += produced_wall - wall
+            produced[1] += produced_cpu - cpu
+            yield item
+            consumed[0] += time.perf_counter() - produced_wall
+            consumed[1] += time.process_time() - produced_cpu
+    finally:
+        record_phase(phase, *produced)
+        record_phase(consumer_phase, *consumed)
@@ -0,0 +1,54 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Memo of the candidate entries found for an expression, together
+# with their texts as shown in the list of found entries, so that
+# retyping an expression (e.g. after backspacing) neither looks it up
+# nor formats its entries again.
+######################################################################
+
+import typing
+
+try:
+    from .bounded_cache import BoundedCache
+except:
+    from bounded_cache import BoundedCache
+
+LOOKUP_CACHE_SIZE = 256
+
+
+class CachedLookup(typing.NamedTuple):
+    entries: list
+    # entry.stringify() of the entries, for the given language
+    texts: list
+
+
+class LookupCache:
+    """Maps (expression, language) to the CachedLookup found for it, keeping the
+    max_size most recently used ones. Counts hits and misses of get()."""
+
+    def __init__(self, max_size: int = LOOKUP_CACHE_SIZE):
+        self._items = BoundedCache(max_size)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, text: str, language: str) -> typing.Optional[CachedLookup]:
+        lookup = self._items.get((text, language))
+        if lookup is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return lookup
+
+    def put(self, text: str, language: str, lookup: CachedLookup):
+        self._items.put((text, language), lookup)
+
+    def clear(self):
+        """Drops all results, e.g. when the dictionary has been replaced; the
+        counters are kept."""
+        self._items.clear()
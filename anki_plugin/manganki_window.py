@@ -6,6 +6,7 @@
 # Main window containing all controls.
 ######################################################################
 
+import csv
 import webbrowser
 from aqt.qt import *
 from PyQt6.QtWidgets import QMainWindow, QWidget, QSizePolicy
@@ -18,9 +19,10 @@ try:
     from .anki_transfer import transfer_given_infos
     from .app_logic import AppState, AppLogic
     from .info_window import InfoWindow
-    from .splash_screen import SplashScreen
     from .playsound import playsound
     from .settings_window import SettingsWindow
+    from .load_timing import TimedPhase
+    from .memory_report import start_tracing, is_profiling_requested
 except:
     from clipboard_image_widget import ClipboardImageWidget
     from app_logic import AppState, AppLogic
@@ -28,24 +30,53 @@ except:
     from anki_transfer import transfer_given_infos
     from app_logic import AppState, AppLogic
     from info_window import InfoWindow
-    from splash_screen import SplashScreen
     from playsound import playsound
     from settings_window import SettingsWindow
+    from load_timing import TimedPhase
+    from memory_report import start_tracing, is_profiling_requested
+
+
+# shown when nothing is found; shared, so that update_listbox() recognizes it
+_NO_TEXTS = ()
 
 
 class PreparationWorker(QThread):
-    """Load dictionary asynchronously"""
+    """Load dictionary asynchronously; the signals are delivered on the GUI
+    thread."""
 
-    finished = pyqtSignal()
+    progress = pyqtSignal(str)
+    # emitted with the loaded dictionary, and again with a rebuilt one
+    dictionary_loaded = pyqtSignal(object)
 
     def __init__(self, app_logic: AppLogic):
         super().__init__()
         self._app_logic = app_logic
 
     def run(self):
-        self._app_logic.do_initial_loading_tasks()
-        self._app_logic.read_stored_program_state()
-        self.finished.emit()
+        dictionary = self._app_logic.load_dictionary(
+            on_progress=self.progress.emit, on_rebuilt=self.dictionary_loaded.emit
+        )
+        self.dictionary_loaded.emit(dictionary)
+
+
+class LanguageWorker(QThread):
+    """Read the glosses needed for a newly preferred translation language into the
+    dictionary asynchronously (see AppLogic.load_languages()); the signal is
+    delivered on the GUI thread."""
+
+    languages_loaded = pyqtSignal(object)
+
+    def __init__(self, app_logic: AppLogic):
+        super().__init__()
+        self._app_logic = app_logic
+        self._dictionary = None
+
+    def load(self, dictionary):
+        self._dictionary = dictionary
+        self.start()
+
+    def run(self):
+        self.languages_loaded.emit(self._app_logic.load_languages(self._dictionary))
 
 
 class MangAnkiWindow(QMainWindow):
@@ -53,10 +84,16 @@ class MangAnkiWindow(QMainWindow):
 
     def __init__(self):
         super().__init__()
+        # with MANGANKI_MEMORY_PROFILE set, allocations of the loading are traced
+        start_tracing()
+        window_shown = TimedPhase("window_shown")
+        # until the first dictionary is set, rebuilt ones are not measured
+        self._dictionary_ready = TimedPhase("dictionary_ready")
         self._app_logic = AppLogic()
         self.closeEvent = self.on_close
         self._r = self._app_logic.get_resources()
         self._status_label = None
+        self._loading_label = None
         self._web_lookup_button = None
         self._transfer_button = None
         self._translations_listbox = None
@@ -71,6 +108,8 @@ class MangAnkiWindow(QMainWindow):
         self._info_window = InfoWindow()
         self._settings_window = SettingsWindow(self._app_logic)
         self._info_menu = None
+        self._import_menu = None
+        self._next_word_button = None
         self._canvas_box = None
         self._focus_counter = None
         self._audio_label = None
@@ -80,19 +119,62 @@ class MangAnkiWindow(QMainWindow):
         self._in_process_of_state_updating = False
         self.build_gui()
         self.add_listeners()
-        self._splash_screen = SplashScreen()
+        # settings select the dictionary backend; screenshots and markings work
+        # while the dictionary is loaded, expressions are looked up once it is
+        self._app_logic.read_stored_program_state()
         self._prep_worker = PreparationWorker(self._app_logic)
-        self._prep_worker.finished.connect(self.on_preparation_done)
-        self._splash_screen.show()
-        self.hide()
+        self._prep_worker.progress.connect(self.on_loading_progress)
+        self._prep_worker.dictionary_loaded.connect(self.on_dictionary_loaded)
+        # the loaded (and rebuilt) dictionaries have the glosses for this language
+        self._dictionary_language = self._r.PreferredTranslationLanguage
+        # the language the glosses of the current dictionary are read for
+        self._loaded_language = None
+        self._language_worker = LanguageWorker(self._app_logic)
+        self._language_worker.languages_loaded.connect(self.on_languages_loaded)
+        # whether the preferred language changed while the worker was running
+        self._languages_pending = False
+        self.on_loading_progress("Loading the dictionary...")
+        self.update_audio_edit_content()
+        self.show()
+        window_shown.finish()
         self._prep_worker.start()
 
-    def on_preparation_done(self):
-        self._splash_screen.close()
-        self.show()
-        self._settings_window.on_preparation_done()
-        self._r["AppState"] = AppState.INITIAL
-        self._r["AudioPath"] = ""
+    def on_loading_progress(self, message):
+        self._loading_label.setText(message)
+        self._loading_label.show()
+
+    def on_dictionary_loaded(self, dictionary):
+        self._app_logic.set_dictionary(dictionary)
+        self._loaded_language = self._dictionary_language
+        self._loading_label.hide()
+        self._dictionary_ready.finish()
+        # the preferred language may have changed while it was loaded
+        if self._r.PreferredTranslationLanguage != self._loaded_language:
+            self.load_languages()
+        if is_profiling_requested():
+            self._settings_window.show_memory_report()
+
+    def load_languages(self):
+        """Reads the glosses needed for the preferred translation language into the
+        dictionary on the LanguageWorker, unless the dictionary is still being
+        loaded; one language change after the other."""
+        if not self._app_logic.is_dictionary_loaded():
+            return
+        if self._language_worker.isRunning():
+            self._languages_pending = True
+            return
+        self._loaded_language = self._r.PreferredTranslationLanguage
+        self.on_loading_progress("Loading the translations...")
+        self._language_worker.load(self._r.Dictionary)
+
+    def on_languages_loaded(self, dictionary):
+        self._app_logic.on_languages_loaded(dictionary)
+        self._loading_label.hide()
+        if self._languages_pending:
+            self._languages_pending = False
+            # the signal is sent right before the thread ends
+            self._language_worker.wait()
+            self.load_languages()
 
     def build_gui(self):
         self.setWindowTitle("MangAnki")
@@ -101,6 +183,10 @@ class MangAnkiWindow(QMainWindow):
         self._info_menu.aboutToShow.connect(self.open_info_window)
         self._settings_menu = menubar.addMenu("Settings")
         self._settings_menu.aboutToShow.connect(self.open_settings_window)
+        self._import_menu = menubar.addMenu("Import")
+        self._import_menu.addAction("Word list...").triggered.connect(
+            self.on_import_word_list
+        )
         self._central_widget = QWidget()
         self._default_font = QFont()
         self._default_font.setPointSize(14)
@@ -135,6 +221,8 @@ class MangAnkiWindow(QMainWindow):
         self._list_box_label = QLabel("Found entries:")
         self._layout.addWidget(self._list_box_label)
         self._translations_listbox = QListWidget()
+        # texts currently shown in the list box
+        self._listbox_texts = None
         self.update_listbox()
         self._layout.addWidget(self._translations_listbox)
         self._translations_listbox.itemSelectionChanged.connect(
@@ -161,10 +249,16 @@ class MangAnkiWindow(QMainWindow):
         self._web_lookup_button = QPushButton("Web lookup")
         self._web_lookup_button.clicked.connect(self.on_link_click)
         hbox_layout.addWidget(self._web_lookup_button)
+        self._next_word_button = QPushButton()
+        self._next_word_button.clicked.connect(self.on_next_word_click)
+        hbox_layout.addWidget(self._next_word_button)
+        self.update_next_word_button()
         hbox_layout.setSizeConstraint(QLayout.SizeConstraint.SetFixedSize)
         self._layout.addLayout(hbox_layout)
         self._status_label = QLabel()
         self.statusBar().addWidget(self._status_label)
+        self._loading_label = QLabel()
+        self.statusBar().addPermanentWidget(self._loading_label)
         self.setFixedSize(self.minimumSizeHint())
         self.update_status_for_gui_controls()
 
@@ -185,6 +279,9 @@ class MangAnkiWindow(QMainWindow):
         self._r.add_listener("AppState", self.update_status_for_gui_controls)
         self._r.add_listener("PossibleEntries", self.update_listbox)
         self._r.add_listener("AudioPath", self.update_audio_edit_content)
+        self._r.add_listener("CurrentEntry", self.update_entry_edit_content)
+        self._r.add_listener("ImportedWords", self.update_next_word_button)
+        self._r.add_listener("PreferredTranslationLanguage", self.load_languages)
 
     def stress_on_canvas(self):
         self._focus_counter = 5
@@ -205,22 +302,18 @@ class MangAnkiWindow(QMainWindow):
         self._app_logic.store_program_state()
 
     def update_listbox(self):
-        entries = self._r["PossibleEntries"]
-        self._translations_listbox.clear()
-        if entries:
-            for entry in entries:
-                assert isinstance(entry, DictionaryEntry)
-                self._translations_listbox.addItem(
-                    entry.stringify(self._r["PreferredTranslationLanguage"])
-                )
+        texts = self._r["PossibleEntryTexts"] or _NO_TEXTS
+        # called several times per state change, mostly with unchanged entries
+        if texts is not self._listbox_texts:
+            self._translations_listbox.clear()
+            self._translations_listbox.addItems(texts)
+            self._listbox_texts = texts
         self._translations_listbox.clearSelection()
         self._translations_listbox.setSizePolicy(
             QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed
         )
 
     def update_status_for_gui_controls(self):
-        if self._r["AppState"] == AppState.LOADING_AND_PREPARING:
-            return
         self._in_process_of_state_updating = True
         self._settings_window.update_status_for_gui_controls()
         current_state = self._r["AppState"]
@@ -279,6 +372,43 @@ class MangAnkiWindow(QMainWindow):
             return
         self._r["CurrentEntry"] = self._entry_edit.text()
 
+    def update_entry_edit_content(self):
+        text = self._r["CurrentEntry"] or ""
+        if self._entry_edit.text() != text:
+            self._entry_edit.setText(text)
+
+    def update_next_word_button(self):
+        remaining = len(self._r["ImportedWords"])
+        self._next_word_button.setText("Next word (%d)" % remaining)
+        self._next_word_button.setEnabled(remaining > 0)
+
+    def on_import_word_list(self):
+        if not self._app_logic.is_dictionary_loaded():
+            self.set_status_message("Please wait until the dictionary is loaded.")
+            return
+        file_name, _ = QFileDialog.getOpenFileName(
+            self,
+            "Import word list",
+            "",
+            "Word lists (*.txt *.csv *.tsv);;All files (*)",
+        )
+        if not file_name:
+            return
+        try:
+            words = self._app_logic.import_word_list(file_name)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            self.show_error_message("Could not import word list: %s" % e)
+            return
+        self._app_logic.show_next_imported_word()
+        unknown = sum(1 for word in words if not word.entries)
+        self.set_status_message(
+            "Imported %d words (%d not found in the dictionary)."
+            % (len(words), unknown)
+        )
+
+    def on_next_word_click(self):
+        self._app_logic.show_next_imported_word()
+
     def on_selection_changed(self):
         if self._in_process_of_state_updating:
             return
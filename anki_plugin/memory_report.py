@@ -0,0 +1,180 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Memory diagnostics of the loaded dictionary: the size of its parts
+# (entries, translation strings, reading indexes, language sets and
+# every further index), the process peak RSS and, if tracemalloc was
+# started before loading, the lines that allocated the most memory.
+# Setting the environment variable MANGANKI_MEMORY_PROFILE starts
+# tracemalloc with the add-on and shows the report once the
+# dictionary is loaded; it can also be shown from the settings at
+# any time.
+######################################################################
+
+import os
+import sys
+import threading
+import tracemalloc
+import types
+
+try:
+    from .load_timing import peak_rss
+    from .dict_service import RemoteDictionary
+except:
+    from load_timing import peak_rss
+    from dict_service import RemoteDictionary
+
+PROFILE_VARIABLE = "MANGANKI_MEMORY_PROFILE"
+# stack frames stored per allocation while tracing
+TRACED_FRAMES = 1
+TOP_ALLOCATION_SITES = 15
+
+# never looked into: shared by everything, or not owned by the dictionary
+_OPAQUE_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+    type(threading.Lock()),
+)
+# attributes of DictionaryLookup reported under their own names, in this order;
+# objects shared by several parts are counted with the first one
+_DICTIONARY_PARTS = [
+    ("translation strings", None),
+    ("entries", "_entries"),
+    ("kana index", "_kana_to_entry"),
+    ("kanji index", "_kanji_to_entry"),
+    ("languages", "_language_abbreviations"),
+    ("loaded languages", "_loaded_languages"),
+]
+
+
+def is_profiling_requested():
+    return bool(os.environ.get(PROFILE_VARIABLE))
+
+
+def start_tracing():
+    """Starts tracing allocations, if MANGANKI_MEMORY_PROFILE is set; to be called
+    before the dictionary is loaded."""
+    if is_profiling_requested() and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACED_FRAMES)
+
+
+def deep_size(obj, seen=None) -> int:
+    """Returns the size in bytes of obj and all objects reachable from it through
+    containers, __slots__ and __dict__, except those whose ids are in seen (which
+    is extended by the ids counted)."""
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _OPAQUE_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            for name in getattr(type(obj), "__slots__", ()):
+                if hasattr(obj, name):
+                    stack.append(getattr(obj, name))
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+    return size
+
+
+def dictionary_parts(dictionary):
+    """Returns (part, size in bytes) of the dictionary's parts in memory. Data of
+    memory-mapped files and databases is not included."""
+    seen = set()
+    # the attributes themselves are counted as parts
+    seen.add(id(dictionary))
+    attributes = dict(vars(dictionary))
+    seen.add(id(vars(dictionary)))
+    parts = []
+    for part, name in _DICTIONARY_PARTS:
+        if name is None:
+            if attributes.get("_entries") is not None:
+                senses = [entry.senses for entry in attributes["_entries"]]
+                parts.append((part, deep_size(senses, seen)))
+        elif name in attributes:
+            parts.append((part, deep_size(attributes.pop(name), seen)))
+    for name, value in sorted(attributes.items()):
+        parts.append((name.lstrip("_").replace("_", " "), deep_size(value, seen)))
+    return parts
+
+
+def _format_size(size):
+    return "{:,.0f} kB".format(size / 1024).rjust(14)
+
+
+def _allocation_sites(limit):
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ]
+    )
+    lines = []
+    for statistic in snapshot.statistics("lineno")[:limit]:
+        frame = statistic.traceback[0]
+        lines.append(
+            "  %s:%d %s in %d blocks"
+            % (
+                os.path.basename(frame.filename),
+                frame.lineno,
+                _format_size(statistic.size).strip(),
+                statistic.count,
+            )
+        )
+    return lines
+
+
+def memory_report(dictionary, top=TOP_ALLOCATION_SITES) -> str:
+    """Returns the memory diagnostics of the dictionary (of any backend, or None if
+    not loaded yet) as text."""
+    lines = []
+    if hasattr(dictionary, "get_primary"):
+        # further dictionaries are memory-mapped files
+        dictionary = dictionary.get_primary()
+    if dictionary is None:
+        lines.append("The dictionary has not been loaded yet.")
+    elif isinstance(dictionary, RemoteDictionary):
+        lines.append("The dictionary is held by the dictionary service process.")
+    else:
+        description = type(dictionary).__name__
+        if hasattr(dictionary, "get_entries") and not dictionary.is_lazy():
+            description += ", %d entries" % len(dictionary.get_entries())
+        lines.append("Dictionary (%s):" % description)
+        parts = dictionary_parts(dictionary)
+        for part, size in sorted(parts, key=lambda item: -item[1]):
+            lines.append("  %-28s %s" % (part, _format_size(size)))
+        lines.append("  %-28s %s" % ("total", _format_size(sum(s for _, s in parts))))
+        if not hasattr(dictionary, "get_entries"):
+            lines.append("  (without the memory-mapped file or database)")
+    rss = peak_rss()
+    if rss is not None:
+        lines.append("Process peak RSS: %s" % _format_size(rss).strip())
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append(
+            "Traced memory: %s now, %s at peak"
+            % (_format_size(current).strip(), _format_size(peak).strip())
+        )
+        lines.append("Top allocation sites:")
+        lines += _allocation_sites(top)
+    else:
+        lines.append(
+            "Set the environment variable %s before starting Anki to see where the "
+            "memory was allocated." % PROFILE_VARIABLE
+        )
+    return "\n".join(lines)
@@ -13,10 +13,12 @@ try:
     from .app_logic import AppState
     from .dict_lookup import DictionaryEntry
     from .app_logic import AppState, AppLogic
+    from .dict_loader import BACKENDS
 except:
     from app_logic import AppState, AppLogic
     from dict_lookup import DictionaryEntry
     from app_logic import AppState, AppLogic
+    from dict_loader import BACKENDS
 
 
 class SettingsWindow(QDialog):
@@ -32,6 +34,10 @@ class SettingsWindow(QDialog):
         self._language_combo_box = None
         self._tag_label = None
         self._tag_edit = None
+        self._backend_combo_box = None
+        self._languages_check_box = None
+        self._service_check_box = None
+        self._memory_button = None
         self._in_process_of_state_updating = False
         self.build_gui()
         self.add_listeners()
@@ -61,26 +67,55 @@ class SettingsWindow(QDialog):
         hbox_layout.addWidget(self._tag_edit)
         self._tag_edit.textEdited.connect(self.on_tag_edit_changed)
         self._layout.addLayout(hbox_layout)
+        backend_label = QLabel("Dictionary backend (used after restart):")
+        backend_label.setFont(self._default_font)
+        self._layout.addWidget(backend_label)
+        self._backend_combo_box = QComboBox()
+        for backend, description in BACKENDS.items():
+            self._backend_combo_box.addItem(description, backend)
+        self._backend_combo_box.currentIndexChanged.connect(self.on_backend_changed)
+        self._backend_combo_box.setFont(self._default_font)
+        self._layout.addWidget(self._backend_combo_box)
+        self.update_backend_combobox()
+        self._languages_check_box = QCheckBox(
+            "Load only preferred language and English (used after restart)"
+        )
+        self._languages_check_box.setFont(self._default_font)
+        self._languages_check_box.toggled.connect(self.on_languages_check_box_toggled)
+        self._layout.addWidget(self._languages_check_box)
+        self.update_languages_check_box()
+        self._service_check_box = QCheckBox(
+            "Keep the dictionary in a separate process, shared between Anki "
+            "sessions (used after restart)"
+        )
+        self._service_check_box.setFont(self._default_font)
+        self._service_check_box.toggled.connect(self.on_service_check_box_toggled)
+        self._layout.addWidget(self._service_check_box)
+        self.update_service_check_box()
+        self._memory_button = QPushButton("Show memory usage...")
+        self._memory_button.setFont(self._default_font)
+        self._memory_button.clicked.connect(self.show_memory_report)
+        self._layout.addWidget(self._memory_button)
         # self.setFixedSize(self.minimumSizeHint())
         self.update_status_for_gui_controls()
 
     def add_listeners(self):
         self._r.add_listener("Tag", self.update_tag_edit_content)
-
-    def on_preparation_done(self):
-        self._language_combo_box.clear()
+        self._r.add_listener("DictionaryBackend", self.update_backend_combobox)
+        self._r.add_listener("PreferredLanguagesOnly", self.update_languages_check_box)
+        self._r.add_listener("DictionaryService", self.update_service_check_box)
+        # known once the dictionary has been loaded
+        self._r.add_listener(
+            "TranslationLanguages", self.update_status_for_gui_controls
+        )
 
     def update_language_combobox(self):
-        if self._r["AppState"] == AppState.LOADING_AND_PREPARING:
-            return
         self._language_combo_box.setCurrentText(self._r["PreferredTranslationLanguage"])
 
     def update_status_for_gui_controls(self):
-        if self._r["AppState"] == AppState.LOADING_AND_PREPARING:
-            return
         self._in_process_of_state_updating = True
         self._language_combo_box.clear()
-        for language in sorted(self._r["TranslationLanguages"]):
+        for language in sorted(self._r["TranslationLanguages"] or ()):
             self._language_combo_box.addItem(language)
         self.update_language_combobox()
         current_state = self._r["AppState"]
@@ -101,6 +136,8 @@ class SettingsWindow(QDialog):
     def on_preferred_language_changed(self):
         if self._in_process_of_state_updating:
             return
+        # glosses of a language not loaded so far are read in the background, see
+        # MangAnkiWindow.load_languages()
         self._r["PreferredTranslationLanguage"] = self._language_combo_box.currentText()
 
     def on_tag_edit_changed(self):
@@ -110,3 +147,49 @@ class SettingsWindow(QDialog):
     def update_tag_edit_content(self):
         if self._tag_edit.text() != self._r["Tag"]:
             self._tag_edit.setText(self._r["Tag"])
+
+    def on_backend_changed(self):
+        if self._backend_combo_box.currentData() != self._r["DictionaryBackend"]:
+            self._r["DictionaryBackend"] = self._backend_combo_box.currentData()
+
+    def update_backend_combobox(self):
+        index = self._backend_combo_box.findData(self._r["DictionaryBackend"])
+        if index != self._backend_combo_box.currentIndex():
+            self._backend_combo_box.setCurrentIndex(index)
+
+    def on_languages_check_box_toggled(self):
+        if self._languages_check_box.isChecked() != self._r["PreferredLanguagesOnly"]:
+            self._r["PreferredLanguagesOnly"] = self._languages_check_box.isChecked()
+
+    def update_languages_check_box(self):
+        if self._languages_check_box.isChecked() != self._r["PreferredLanguagesOnly"]:
+            self._languages_check_box.setChecked(self._r["PreferredLanguagesOnly"])
+
+    def on_service_check_box_toggled(self):
+        if self._service_check_box.isChecked() != self._r["DictionaryService"]:
+            self._r["DictionaryService"] = self._service_check_box.isChecked()
+
+    def update_service_check_box(self):
+        if self._service_check_box.isChecked() != self._r["DictionaryService"]:
+            self._service_check_box.setChecked(self._r["DictionaryService"])
+
+    def show_memory_report(self):
+        """Shows the memory diagnostics of the dictionary; collecting them takes a
+        few seconds for the whole JMdict."""
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            text = self._app_logic.get_memory_report()
+        finally:
+            QApplication.restoreOverrideCursor()
+        dialog = QDialog(self)
+        dialog.setWindowTitle("MangAnki memory usage")
+        layout = QVBoxLayout(dialog)
+        report_edit = QPlainTextEdit(text)
+        report_edit.setReadOnly(True)
+        report_edit.setFont(
+            QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont)
+        )
+        report_edit.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        layout.addWidget(report_edit)
+        dialog.resize(700, 500)
+        dialog.exec()
@@ -0,0 +1,64 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Helpers for searching sorted key sequences with bisect. Keys are
+# either str (sorted by code point) or UTF-8 encoded bytes (sorted
+# bytewise), which results in the same order.
+######################################################################
+
+import bisect
+import itertools
+import sys
+import typing
+
+
+def prefix_successor(prefix):
+    """Returns the smallest key that is greater than every key starting with prefix,
+    or None if there is no such key."""
+    if isinstance(prefix, bytes):
+        # UTF-8 text never contains the byte 0xff
+        return prefix[:-1] + bytes((prefix[-1] + 1,)) if prefix else None
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def prefix_range(keys: typing.Sequence, prefix) -> typing.Tuple[int, int]:
+    """Returns (start, end) such that keys[start:end] are exactly the keys of the
+    sorted sequence keys that start with prefix."""
+    start = bisect.bisect_left(keys, prefix)
+    successor = prefix_successor(prefix)
+    if successor is None:
+        return start, len(keys)
+    return start, bisect.bisect_left(keys, successor, start)
+
+
+def take_distinct(id_lists: typing.Iterable[typing.Iterable[int]], limit: int):
+    """Returns up to limit distinct ids from the given id lists, in order of first
+    occurrence. Only as many lists are consumed as needed."""
+    result = {}
+    for entry_id in itertools.chain.from_iterable(id_lists):
+        result[entry_id] = None
+        if len(result) >= limit:
+            break
+    return list(result)
+
+
+def matching_prefixes(keys: typing.Sequence, prefixes: typing.Iterable):
+    """Takes ever longer prefixes of some text and yields (index, position) for every
+    prefix that is a key of the sorted sequence keys, with index referring to
+    prefixes and position to keys. The searched range shrinks with every prefix, and
+    no further prefixes are taken once no key starts with the current one."""
+    start, end = 0, len(keys)
+    for index, prefix in enumerate(prefixes):
+        start = bisect.bisect_left(keys, prefix, start, end)
+        successor = prefix_successor(prefix)
+        if successor is not None:
+            end = bisect.bisect_left(keys, successor, start, end)
+        if start == end:
+            return
+        if keys[start] == prefix:
+            yield index, start
@@ -0,0 +1,49 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Scanner finding all dictionary words in a piece of text, as
+# popup dictionaries do: for every position, the readings starting
+# there are looked up, longest first. Works with every dictionary
+# backend offering match_prefixes() and get_entry().
+######################################################################
+
+import typing
+
+
+class ScanMatch(typing.NamedTuple):
+    """Dictionary entries for the word text[start:end] of a scanned text."""
+
+    start: int
+    end: int
+    entries: list
+
+
+def iter_matches(dictionary, text: str) -> typing.Iterator[ScanMatch]:
+    """Yields the matches for every word of text that the dictionary knows, ordered
+    by start position, and longest first for the same start position."""
+    for start in range(len(text)):
+        if text[start].isspace():
+            continue
+        for end, entry_ids in dictionary.match_prefixes(text, start):
+            yield ScanMatch(
+                start, end, [dictionary.get_entry(entry_id) for entry_id in entry_ids]
+            )
+
+
+def scan_text(dictionary, text: str) -> typing.List[ScanMatch]:
+    """Returns all matches of iter_matches() as a list."""
+    return list(iter_matches(dictionary, text))
+
+
+def entries_in_text(dictionary, text: str, limit: int):
+    """Returns up to limit distinct entries for the words found in text, in the order
+    of iter_matches(); the text is only scanned as far as needed."""
+    result = {}
+    for match in iter_matches(dictionary, text):
+        for entry in match.entries:
+            result.setdefault(entry.unique_id, entry)
+            if len(result) >= limit:
+                return list(result.values())
+    return list(result.values())
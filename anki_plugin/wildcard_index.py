@@ -0,0 +1,160 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Wildcard search over the readings: * stands for any number of
+# characters, ? for exactly one, e.g. *食* or 食べ*. Readings
+# containing the longest literal part of a pattern are found with a
+# suffix array: the sorted readings themselves cover the suffixes
+# starting at their first character, the suffix array holds
+# (reading position, offset) for all other suffixes, sorted by the
+# suffix. Found readings are then checked against the whole pattern.
+######################################################################
+
+import array
+import bisect
+import re
+import typing
+
+try:
+    from .sorted_keys import prefix_range
+except:
+    from sorted_keys import prefix_range
+
+_WILDCARDS = str.maketrans("＊？", "*?")
+_SPLIT = re.compile(r"[*?]")
+
+
+class WildcardPattern(typing.NamedTuple):
+    regex: typing.Pattern
+    # literal text before the first wildcard
+    prefix: str
+    # longest literal part
+    literal: str
+
+
+def is_pattern(text: str) -> bool:
+    """Checks whether text contains wildcards (also in their full-width forms)."""
+    text = text.translate(_WILDCARDS)
+    return "*" in text or "?" in text
+
+
+def parse_pattern(text: str) -> typing.Optional[WildcardPattern]:
+    """Returns the pattern for text, or None if it has no literal part, as such
+    patterns match too many readings."""
+    text = text.translate(_WILDCARDS)
+    parts = _SPLIT.split(text)
+    literal = max(parts, key=len)
+    if not literal:
+        return None
+    regex = "".join(
+        ".*" if char == "*" else "." if char == "?" else re.escape(char)
+        for char in text
+    )
+    return WildcardPattern(re.compile(regex, re.DOTALL), parts[0], literal)
+
+
+def _suffix_offsets(key):
+    if isinstance(key, bytes):
+        # only offsets at the start of a UTF-8 encoded character
+        return [offset for offset in range(1, len(key)) if key[offset] & 0xC0 != 0x80]
+    return range(1, len(key))
+
+
+def build_suffix_array(keys: typing.Sequence):
+    """Returns (key positions, offsets) of all suffixes of the sorted keys (str, or
+    UTF-8 bytes with byte offsets) except the keys themselves, sorted by suffix."""
+    suffixes = sorted(
+        (key[offset:], position, offset)
+        for position, key in enumerate(keys)
+        for offset in _suffix_offsets(key)
+    )
+    return (
+        array.array("I", (position for _, position, _ in suffixes)),
+        array.array("H", (offset for _, _, offset in suffixes)),
+    )
+
+
+def update_suffix_array(old_keys: typing.Sequence, keys: typing.Sequence, suffixes):
+    """Returns the (key positions, offsets) of build_suffix_array(keys), given those
+    of build_suffix_array(old_keys): the suffixes of removed keys are dropped, those
+    of kept keys get their new positions, and those of added keys are inserted."""
+    positions = {key: position for position, key in enumerate(keys)}
+    new_positions = [positions.pop(key, -1) for key in old_keys]
+    kept_positions = array.array("I")
+    kept_offsets = array.array("H")
+    for position, offset in zip(*suffixes):
+        position = new_positions[position]
+        if position >= 0:
+            kept_positions.append(position)
+            kept_offsets.append(offset)
+    # positions now holds the added keys only
+    added = sorted(
+        (key[offset:], position, offset)
+        for key, position in positions.items()
+        for offset in _suffix_offsets(key)
+    )
+    if not added:
+        return kept_positions, kept_offsets
+    kept = SuffixArray(keys, kept_positions, kept_offsets)
+    result_positions = array.array("I")
+    result_offsets = array.array("H")
+    start = 0
+    for suffix, position, offset in added:
+        # equal suffixes are ordered by the position of their key
+        end = bisect.bisect_left(kept, suffix, start)
+        end = bisect.bisect_left(
+            kept_positions, position, end, bisect.bisect_right(kept, suffix, end)
+        )
+        result_positions += kept_positions[start:end]
+        result_offsets += kept_offsets[start:end]
+        result_positions.append(position)
+        result_offsets.append(offset)
+        start = end
+    result_positions += kept_positions[start:]
+    result_offsets += kept_offsets[start:]
+    return result_positions, result_offsets
+
+
+class SuffixArray:
+    """Read-only sorted sequence of the suffixes given by build_suffix_array(), for
+    searching with bisect."""
+
+    def __init__(self, keys: typing.Sequence, key_positions, offsets):
+        self._keys = keys
+        self._key_positions = key_positions
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._key_positions)
+
+    def __getitem__(self, index):
+        return self._keys[self._key_positions[index]][self._offsets[index] :]
+
+    def key_position(self, index):
+        return self._key_positions[index]
+
+
+def find_matching_keys(
+    pattern: WildcardPattern,
+    keys: typing.Sequence,
+    suffixes: SuffixArray,
+    encode: typing.Callable = str,
+    decode: typing.Callable = str,
+) -> typing.Iterator[int]:
+    """Yields the positions of all sorted keys matching pattern, in key order.
+    encode converts text into a key, decode a key into text."""
+    if len(pattern.prefix) >= len(pattern.literal):
+        start, end = prefix_range(keys, encode(pattern.prefix))
+        candidates = range(start, end)
+    else:
+        literal = encode(pattern.literal)
+        start, end = prefix_range(keys, literal)
+        candidates = set(range(start, end))
+        start, end = prefix_range(suffixes, literal)
+        candidates.update(suffixes.key_position(index) for index in range(start, end))
+        candidates = sorted(candidates)
+    for position in candidates:
+        if pattern.regex.fullmatch(decode(keys[position])):
+            yield position
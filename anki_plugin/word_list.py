@@ -0,0 +1,42 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Import of word lists: expressions are read from a text or CSV file
+# and looked up in one batch (see batch_lookup), so that cards can be
+# created for them one after the other.
+######################################################################
+
+import csv
+import typing
+
+
+class ImportedWord(typing.NamedTuple):
+    text: str
+    # found entries, best first; empty if the word is unknown
+    entries: list
+
+
+def read_word_list(file_name: str) -> typing.List[str]:
+    """Returns the distinct expressions of a word list, in their order. The file has
+    one expression per line; further columns separated by tabs (or commas in .csv
+    files) are ignored, as are empty lines and lines starting with #."""
+    words = []
+    with open(file_name, encoding="utf-8-sig", newline="") as f:
+        if file_name.lower().endswith(".csv"):
+            rows = csv.reader(f)
+        else:
+            rows = (line.split("\t") for line in f)
+        for row in rows:
+            word = row[0].strip() if row else ""
+            if word and not word.startswith("#"):
+                words.append(word)
+    return list(dict.fromkeys(words))
+
+
+def import_word_list(dictionary, file_name: str) -> typing.List[ImportedWord]:
+    """Reads the word list file_name and looks up all of its words. Raises OSError,
+    UnicodeDecodeError or csv.Error if the file cannot be read."""
+    found = dictionary.look_up_many(read_word_list(file_name))
+    return [ImportedWord(text, entries) for text, entries in found.items()]
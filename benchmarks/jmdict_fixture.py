@@ -0,0 +1,204 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Generator of synthetic dictionary files in the format of
+# jmdict-simplified (see jmdict-all-3.5.0.json), for benchmarks and
+# tests without the real file. Words get kana readings built from
+# common morae (so readings share prefixes and some collide, as in
+# JMdict), kanji spellings for most of them, reading tags such as
+# rK/io that are skipped on import, and senses with glosses in
+# several languages. The same arguments always give the same file.
+#
+#   python jmdict_fixture.py out.json --words 200000
+######################################################################
+
+import argparse
+import json
+import random
+import typing
+
+LANGUAGES = ["eng", "ger", "rus", "fre", "spa", "dut", "hun", "swe", "slv"]
+PARTS_OF_SPEECH = ["n", "v1", "v5k", "v5u", "v5r", "adj-i", "adj-na", "vs", "adv"]
+# rare readings, skipped by the dictionary
+RARE_TAGS = ["rK", "io"]
+OTHER_TAGS = ["ateji", "ik", "oK", "sK"]
+_MORAE = (
+    "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめも"
+    "やゆよらりるれろわんがぎぐげござじずぜぞだでどばびぶべぼぱぴぷぺぽ"
+)
+_LONG_MORAE = ["きゃ", "しゅ", "ちょ", "りょ", "じゃ", "にゅ", "っ"]
+_KANJI = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+_GLOSS_WORDS = (
+    "umbrella rain water fire eat drink go come see read book tree person day "
+    "night house river mountain speak write child school train friend money "
+    "time year work think heart sky flower sea light sound"
+).split()
+
+
+def _kana(rnd, length):
+    morae = [rnd.choice(_MORAE) for _ in range(length)]
+    if rnd.random() < 0.15:
+        morae.insert(rnd.randrange(1, length + 1), rnd.choice(_LONG_MORAE))
+    return "".join(morae)
+
+
+def _katakana(text):
+    return "".join(chr(ord(char) + 0x60) for char in text) + "ー"
+
+
+def _reading_tags(rnd):
+    roll = rnd.random()
+    if roll < 0.03:
+        return [rnd.choice(RARE_TAGS)]
+    if roll < 0.06:
+        return [rnd.choice(OTHER_TAGS)]
+    return []
+
+
+def _sense(rnd, word_number, languages):
+    glosses = [
+        {
+            "lang": language,
+            "gender": None,
+            "type": None,
+            "text": "%s %s %d"
+            % (
+                " ".join(rnd.sample(_GLOSS_WORDS, rnd.randint(1, 3))),
+                language,
+                word_number,
+            ),
+        }
+        for language in languages
+        for _ in range(rnd.randint(1, 2))
+    ]
+    return {
+        "partOfSpeech": rnd.sample(PARTS_OF_SPEECH, rnd.randint(1, 2)),
+        "appliesToKanji": ["*"],
+        "appliesToKana": ["*"],
+        "related": [],
+        "antonym": [],
+        "field": [],
+        "dialect": [],
+        "misc": [],
+        "info": [],
+        "languageSource": [],
+        "gloss": glosses,
+    }
+
+
+def generate_words(
+    count: int, seed: int = 1, languages: typing.Sequence[str] = LANGUAGES
+) -> typing.Iterator[dict]:
+    """Yields count JMdict words. Every word has English glosses; the other
+    languages get fewer words the later they are listed."""
+    rnd = random.Random(seed)
+    for number in range(count):
+        kana = _kana(rnd, rnd.randint(1, 5))
+        kanji = []
+        if number % 8 == 0:
+            # loan words are written in katakana only
+            kana = _katakana(kana)
+        else:
+            for _ in range(1 if rnd.random() < 0.85 else 2):
+                kanji.append(
+                    {
+                        "common": rnd.random() < 0.2,
+                        "text": "".join(
+                            rnd.choice(_KANJI) for _ in range(rnd.randint(1, 3))
+                        )
+                        + ("る" if rnd.random() < 0.2 else ""),
+                        "tags": _reading_tags(rnd),
+                    }
+                )
+        kana_readings = [
+            {
+                "common": rnd.random() < 0.2,
+                "text": kana,
+                "tags": _reading_tags(rnd),
+                "appliesToKanji": ["*"],
+            }
+        ]
+        if rnd.random() < 0.1:
+            kana_readings.append(
+                {
+                    "common": False,
+                    "text": _kana(rnd, rnd.randint(2, 5)),
+                    "tags": [],
+                    "appliesToKanji": ["*"],
+                }
+            )
+        word_languages = [languages[0]] + [
+            language
+            for position, language in enumerate(languages[1:], 1)
+            if rnd.random() < 1 / (1 + position)
+        ]
+        yield {
+            "id": str(1000000 + number),
+            "kanji": kanji,
+            "kana": kana_readings,
+            "sense": [
+                _sense(rnd, number, word_languages) for _ in range(rnd.randint(1, 3))
+            ],
+        }
+
+
+def write_words(
+    file_name,
+    words: typing.Iterable[dict],
+    languages: typing.Sequence[str] = LANGUAGES,
+):
+    """Writes a dictionary file with the given JMdict words; only one word is in
+    memory at a time."""
+    header = {
+        "version": "3.5.0",
+        "languages": list(languages),
+        "commonOnly": False,
+        "dictDate": "2024-01-01",
+        "dictRevisions": ["synthetic"],
+        "tags": {tag: tag for tag in PARTS_OF_SPEECH + RARE_TAGS + OTHER_TAGS},
+    }
+    with open(file_name, "w", encoding="utf-8") as f:
+        # the words array last, as in the real file
+        f.write(json.dumps(header, ensure_ascii=False)[:-1] + ', "words": [\n')
+        for number, word in enumerate(words):
+            if number:
+                f.write(",\n")
+            f.write(json.dumps(word, ensure_ascii=False))
+        f.write("\n]}\n")
+
+
+def write_fixture(
+    file_name,
+    count: int,
+    seed: int = 1,
+    languages: typing.Sequence[str] = LANGUAGES,
+):
+    """Writes a dictionary file with count words."""
+    write_words(file_name, generate_words(count, seed, languages), languages)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Writes a synthetic dictionary file in jmdict-simplified format."
+    )
+    parser.add_argument("file_name", help="dictionary file to write")
+    parser.add_argument("--words", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--languages",
+        default=",".join(LANGUAGES),
+        help="comma-separated language codes, the first one is used by all words",
+    )
+    arguments = parser.parse_args()
+    write_fixture(
+        arguments.file_name,
+        arguments.words,
+        arguments.seed,
+        arguments.languages.split(","),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Benchmarks of the dictionary, runnable without Qt or Anki: building
+# it from the JSON file, adding decoded words, the pickled cache,
+# lookups in all backends and formatting entries. They run on a
+# synthetic dictionary (see jmdict_fixture) unless another file is
+# given. Results can be stored and compared with those of an earlier
+# run, e.g. before and after a change on the same machine; the run
+# fails if a benchmark got slower by more than the tolerance.
+#
+#   python run_benchmarks.py --words 50000 --output before.json
+#   python run_benchmarks.py --words 50000 --baseline before.json
+######################################################################
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import typing
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "anki_plugin")
+)
+
+import dict_lookup
+from dict_lookup import DictionaryLookup
+from dict_binary import BinaryDictionary, write_binary_dictionary
+from dict_sqlite import SqliteDictionary, build_sqlite_dictionary
+from dict_build import default_process_count
+from json_stream import iter_json_array
+from jmdict_fixture import write_fixture
+
+
+class Measurement(typing.NamedTuple):
+    # seconds of each repetition
+    times: typing.List[float]
+    # operations per repetition, e.g. lookups
+    count: int = 1
+    # seconds of the single operations, for percentiles
+    latencies: typing.Sequence[float] = ()
+
+    def to_dict(self):
+        result = {
+            "best": min(self.times),
+            "mean": sum(self.times) / len(self.times),
+            "count": self.count,
+        }
+        if self.count > 1:
+            result["per_second"] = self.count / result["best"]
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            for percentile in (50, 90, 99):
+                index = min(len(latencies) - 1, len(latencies) * percentile // 100)
+                result["p%d" % percentile] = latencies[index]
+        return result
+
+
+class Context:
+    """Fixture file, its decoded words and the dictionaries built from it, shared by
+    the benchmarks; everything is written into a temporary directory."""
+
+    def __init__(self, file_name, directory, repeat, queries):
+        self.file_name = file_name
+        self.directory = directory
+        self.repeat = repeat
+        self.queries = queries
+        with open(file_name, encoding="utf-8", newline="") as f:
+            self.words = list(iter_json_array(f, "words"))
+        self._dictionaries = {}
+
+    def dictionary(self, backend):
+        """Returns the dictionary of the backend, built once."""
+        if backend not in self._dictionaries:
+            self._dictionaries[backend] = self._build(backend)
+        return self._dictionaries[backend]
+
+    def _build(self, backend):
+        if backend == "memory":
+            dictionary = DictionaryLookup()
+            dictionary.parse_file(self.file_name)
+            return dictionary
+        if backend == "lazy":
+            dictionary = DictionaryLookup(lazy=True)
+            dictionary.parse_file(self.file_name)
+            return dictionary
+        if backend == "binary":
+            file_name = os.path.join(self.directory, "dictionary.bin")
+            write_binary_dictionary(self.dictionary("memory"), file_name)
+            return BinaryDictionary.open(file_name)
+        file_name = os.path.join(self.directory, "dictionary.sqlite")
+        build_sqlite_dictionary(file_name, self.file_name)
+        return SqliteDictionary.open(file_name)
+
+    def query_texts(self):
+        """Readings of random words, and one text in ten not in the dictionary."""
+        rnd = random.Random(1)
+        texts = []
+        for _ in range(self.queries):
+            if rnd.random() < 0.1:
+                texts.append("ゑ" * rnd.randint(2, 4))
+                continue
+            word = rnd.choice(self.words)
+            readings = word["kanji"] + word["kana"]
+            texts.append(rnd.choice(readings)["text"])
+        return texts
+
+
+def _repeat(context, function, setup=None):
+    times = []
+    for _ in range(context.repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def bench_parse_file(context):
+    """The whole build from the JSON file, including the derived indexes."""
+    return Measurement(
+        _repeat(context, lambda _: DictionaryLookup().parse_file(context.file_name))
+    )
+
+
+def bench_parse_file_lazy(context):
+    return Measurement(
+        _repeat(
+            context,
+            lambda _: DictionaryLookup(lazy=True).parse_file(context.file_name),
+        )
+    )
+
+
+def bench_parse_file_parallel(context):
+    processes = default_process_count()
+    return Measurement(
+        _repeat(
+            context,
+            lambda _: DictionaryLookup().parse_file(context.file_name, processes),
+        )
+    )
+
+
+def bench_add_words(context):
+    """Entries and reading indexes of words already decoded from JSON, one word at a
+    time; sorting the postings and the further indexes built afterwards are left
+    out, parse_file measures them as part of the whole build."""
+
+    def add_words(words):
+        dictionary = DictionaryLookup()
+        for word in words:
+            dictionary.add_word(word)
+
+    return Measurement(
+        _repeat(context, add_words, lambda: json.loads(json.dumps(context.words))),
+        len(context.words),
+    )
+
+
+def bench_pickle(context):
+    dictionary = context.dictionary("memory")
+    return Measurement(_repeat(context, lambda _: dictionary.pickle()))
+
+
+def bench_de_pickle(context):
+    context.dictionary("memory").pickle()
+    return Measurement(_repeat(context, lambda _: DictionaryLookup.de_pickle()))
+
+
+def _bench_look_up(backend):
+    def bench(context):
+        dictionary = context.dictionary(backend)
+        texts = context.query_texts()
+        latencies = []
+
+        def look_up(_):
+            for text in texts:
+                start = time.perf_counter()
+                dictionary.look_up(text)
+                latencies.append(time.perf_counter() - start)
+
+        return Measurement(_repeat(context, look_up), len(texts), latencies)
+
+    return bench
+
+
+def bench_stringify(context):
+    entries = context.dictionary("memory").get_entries()
+
+    def stringify(_):
+        for entry in entries:
+            entry.stringify("ger")
+            entry.get_translation("ger")
+
+    return Measurement(_repeat(context, stringify), len(entries))
+
+
+BENCHMARKS = {
+    "parse_file": bench_parse_file,
+    "parse_file_lazy": bench_parse_file_lazy,
+    "parse_file_parallel": bench_parse_file_parallel,
+    "add_words": bench_add_words,
+    "pickle": bench_pickle,
+    "de_pickle": bench_de_pickle,
+    "look_up_memory": _bench_look_up("memory"),
+    "look_up_lazy": _bench_look_up("lazy"),
+    "look_up_binary": _bench_look_up("binary"),
+    "look_up_sqlite": _bench_look_up("sqlite"),
+    "stringify": bench_stringify,
+}
+
+
+def _format_result(name, result):
+    text = "%-20s best %9.4f s  mean %9.4f s" % (name, result["best"], result["mean"])
+    if "per_second" in result:
+        text += "  %10.0f/s" % result["per_second"]
+    if "p50" in result:
+        text += "  p50 %6.1f us  p90 %6.1f us  p99 %6.1f us" % tuple(
+            result[key] * 1e6 for key in ("p50", "p90", "p99")
+        )
+    return text
+
+
+def compare(results, baseline, tolerance):
+    """Returns the names of the benchmarks whose best time exceeds that of the
+    baseline by more than the tolerance (a fraction)."""
+    slower = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        change = result["best"] / before["best"] - 1
+        print("%-20s %+6.1f%%" % (name, 100 * change))
+        if change > tolerance:
+            slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs the dictionary benchmarks without Qt or Anki."
+    )
+    parser.add_argument(
+        "--fixture", help="dictionary file to use instead of a synthetic one"
+    )
+    parser.add_argument(
+        "--words", type=int, default=20000, help="words of the synthetic dictionary"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument(
+        "--only", help="comma-separated benchmarks to run: %s" % ", ".join(BENCHMARKS)
+    )
+    parser.add_argument("--output", help="JSON file to store the results in")
+    parser.add_argument("--baseline", help="JSON file with earlier results")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="slowdown against the baseline that fails the run (default 0.25)",
+    )
+    arguments = parser.parse_args()
+    names = arguments.only.split(",") if arguments.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmarks: %s" % ", ".join(unknown))
+
+    directory = tempfile.mkdtemp(prefix="manganki-benchmarks-")
+    try:
+        file_name = arguments.fixture
+        if file_name is None:
+            file_name = os.path.join(directory, "jmdict.json")
+            write_fixture(file_name, arguments.words)
+        # keep the pickled cache out of the add-on directory
+        dict_lookup.PICKLE_FILE_NAME = os.path.join(directory, "dictionary.pickle")
+        context = Context(file_name, directory, arguments.repeat, arguments.queries)
+        print(
+            "%d words, %.1f MB, Python %s"
+            % (
+                len(context.words),
+                os.path.getsize(file_name) / (1 << 20),
+                platform.python_version(),
+            )
+        )
+        results = {}
+        for name in names:
+            results[name] = BENCHMARKS[name](context).to_dict()
+            print(_format_result(name, results[name]))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "words": len(context.words),
+                    "platform": platform.platform(),
+                    "python": platform.python_version(),
+                    "benchmarks": results,
+                },
+                f,
+                indent=1,
+            )
+    if arguments.baseline:
+        with open(arguments.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("words") != len(context.words):
+            print("The baseline was measured with %s words." % baseline.get("words"))
+        slower = compare(results, baseline["benchmarks"], arguments.tolerance)
+        if slower:
+            print("Slower than the baseline: %s" % ", ".join(slower))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
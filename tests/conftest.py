@@ -0,0 +1,67 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Shared fixtures of the tests: a synthetic dictionary file (see
+# benchmarks/jmdict_fixture.py) and the dictionaries of all backends
+# built from it. The modules of the add-on are imported without Anki,
+# like the benchmarks do.
+######################################################################
+
+import os
+import sys
+
+import pytest
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_ROOT, "anki_plugin"))
+sys.path.insert(0, os.path.join(_ROOT, "benchmarks"))
+
+import dict_lookup
+from dict_lookup import DictionaryLookup
+from dict_binary import BinaryDictionary, write_binary_dictionary
+from dict_sqlite import SqliteDictionary, build_sqlite_dictionary
+from jmdict_fixture import write_fixture
+
+FIXTURE_WORDS = 1500
+BACKENDS = ["memory", "lazy", "binary", "sqlite"]
+
+
+@pytest.fixture(autouse=True)
+def _pickle_file(tmp_path, monkeypatch):
+    # keep the pickled cache out of the add-on directory
+    monkeypatch.setattr(
+        dict_lookup, "PICKLE_FILE_NAME", str(tmp_path / "dictionary.pickle")
+    )
+
+
+@pytest.fixture(scope="session")
+def fixture_file(tmp_path_factory):
+    file_name = str(tmp_path_factory.mktemp("fixture") / "jmdict.json")
+    write_fixture(file_name, FIXTURE_WORDS)
+    return file_name
+
+
+def parse(file_name, **options):
+    dictionary = DictionaryLookup(**options)
+    assert dictionary.parse_file(file_name)
+    return dictionary
+
+
+@pytest.fixture(scope="session")
+def dictionaries(fixture_file, tmp_path_factory):
+    """Backend name -> dictionary built from the fixture file."""
+    directory = tmp_path_factory.mktemp("backends")
+    memory = parse(fixture_file)
+    write_binary_dictionary(memory, str(directory / "dictionary.bin"))
+    build_sqlite_dictionary(str(directory / "dictionary.sqlite"), fixture_file)
+    result = {
+        "memory": memory,
+        "lazy": parse(fixture_file, lazy=True),
+        "binary": BinaryDictionary.open(str(directory / "dictionary.bin")),
+        "sqlite": SqliteDictionary.open(str(directory / "dictionary.sqlite")),
+    }
+    yield result
+    result["binary"].close()
+    result["sqlite"].close()
@@ -0,0 +1,175 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# All backends built from the same file answer every kind of lookup
+# with the same entries in the same order.
+######################################################################
+
+import random
+
+import pytest
+
+from conftest import BACKENDS
+from deinflector import look_up_deinflected
+from dict_sqlite import SqliteDictionary, build_sqlite_dictionary
+from kana import normalize_kana
+
+OTHER_BACKENDS = [backend for backend in BACKENDS if backend != "memory"]
+
+
+def _readings(dictionary, count=150):
+    keys = sorted(dictionary.get_keys())
+    return random.Random(1).sample(keys, count)
+
+
+def _misspelled(readings):
+    rnd = random.Random(2)
+    result = []
+    for reading in readings:
+        position = rnd.randrange(len(reading))
+        result.append(reading[:position] + "ぬ" + reading[position + 1 :])
+    return result
+
+
+def _katakana(text):
+    return "".join(
+        chr(ord(char) + 0x60) if "ぁ" <= char <= "ゖ" else char for char in text
+    )
+
+
+def _queries(memory):
+    readings = _readings(memory)
+    return {
+        "look_up": readings + ["ゑゑゑ", ""],
+        "look_up_normalized": [_katakana(reading) for reading in readings]
+        + [reading + "ー" for reading in readings[:20]],
+        "look_up_prefix": [reading[:1] for reading in readings[:40]]
+        + [reading[:2] for reading in readings[:40]],
+        "look_up_similar": _misspelled(readings),
+        "look_up_pattern": ["*" + reading[-1] for reading in readings[:30]]
+        + [reading[0] + "?" + reading[2:] for reading in readings[:30]]
+        + ["*" + reading[1:3] + "*" for reading in readings[:30]],
+        "look_up_translation": [
+            "rain",
+            "umbrella water",
+            "eng 12",
+            "ger",
+            "Fire",
+            "rus 100",
+            "unknownword",
+        ],
+        "match_prefixes": [reading + "はを" for reading in readings[:40]],
+    }
+
+
+def _ids(entries):
+    return [entry.unique_id for entry in entries]
+
+
+def _answers(dictionary, queries):
+    answers = {}
+    for text in queries["look_up"]:
+        answers["look_up", text] = dictionary.look_up(text)
+    for text in queries["look_up_normalized"]:
+        answers["look_up_normalized", text] = dictionary.look_up_normalized(text)
+    for text in queries["look_up_prefix"]:
+        answers["look_up_prefix", text] = _ids(dictionary.look_up_prefix(text, 20))
+    for text in queries["look_up_similar"]:
+        answers["look_up_similar", text] = _ids(dictionary.look_up_similar(text, 10))
+    for text in queries["look_up_pattern"]:
+        answers["look_up_pattern", text] = _ids(dictionary.look_up_pattern(text, 30))
+    for text in queries["look_up_translation"]:
+        for language in ("eng", "ger"):
+            answers["look_up_translation", text, language] = _ids(
+                dictionary.look_up_translation(text, language, 25)
+            )
+    for text in queries["match_prefixes"]:
+        answers["match_prefixes", text] = [
+            (end, list(entry_ids)) for end, entry_ids in dictionary.match_prefixes(text)
+        ]
+    texts = queries["look_up"]
+    answers["get_entry_ids_many"] = {
+        text: list(entry_ids)
+        for text, entry_ids in dictionary.get_entry_ids_many(texts).items()
+    }
+    answers["look_up_many"] = {
+        text: _ids(entries) for text, entries in dictionary.look_up_many(texts).items()
+    }
+    return answers
+
+
+@pytest.fixture(scope="module")
+def expected(dictionaries):
+    memory = dictionaries["memory"]
+    queries = _queries(memory)
+    return queries, _answers(memory, queries)
+
+
+def test_queries_find_something(expected):
+    _, answers = expected
+    for kind in ("look_up", "look_up_similar", "look_up_pattern", "look_up_prefix"):
+        assert any(found for key, found in answers.items() if key[0] == kind), kind
+    assert answers["look_up_translation", "rain", "eng"]
+    assert answers["look_up_translation", "umbrella water", "eng"]
+
+
+@pytest.mark.parametrize("backend", OTHER_BACKENDS)
+def test_same_answers_as_memory(dictionaries, expected, backend):
+    queries, answers = expected
+    found = _answers(dictionaries[backend], queries)
+    for key, value in answers.items():
+        assert found[key] == value, key
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_languages(dictionaries, backend):
+    assert (
+        dictionaries[backend].get_languages() == dictionaries["memory"].get_languages()
+    )
+
+
+@pytest.mark.parametrize("backend", OTHER_BACKENDS)
+def test_deinflected_lookups(dictionaries, backend):
+    texts = ["かかない", "たべました", "みなかった", "いきたい", "はしって"]
+    memory = dictionaries["memory"]
+    texts += [reading + "ない" for reading in _readings(memory, 30)]
+    for text in texts:
+        assert _ids(
+            item.entry for item in look_up_deinflected(dictionaries[backend], text)
+        ) == _ids(item.entry for item in look_up_deinflected(memory, text))
+
+
+def test_entries_by_reading_are_ranked(dictionaries):
+    memory = dictionaries["memory"]
+    for reading in _readings(memory):
+        entry_ids = memory.get_entry_ids(reading)
+        ranks = [memory.get_entry_rank(entry_id) for entry_id in entry_ids]
+        assert ranks == sorted(ranks)
+
+
+def test_normalized_lookup_finds_katakana_spelling(dictionaries):
+    memory = dictionaries["memory"]
+    for reading in _readings(memory, 40):
+        found = memory.look_up_normalized(_katakana(reading))
+        assert all(
+            normalize_kana(reading)
+            in {normalize_kana(r) for r in e.kanji_readings + e.kana_readings}
+            for e in found
+        )
+        if normalize_kana(reading) == reading:
+            assert set(_ids(memory.look_up(reading))) <= set(_ids(found))
+
+
+def test_sqlite_path_with_uri_characters(fixture_file, tmp_path):
+    directory = tmp_path / "Anki 100% #1?"
+    directory.mkdir()
+    file_name = str(directory / "dictionary.sqlite")
+    build_sqlite_dictionary(file_name, fixture_file)
+    dictionary = SqliteDictionary.open(file_name)
+    assert dictionary is not None
+    try:
+        assert dictionary.get_languages()
+    finally:
+        dictionary.close()
@@ -0,0 +1,77 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Tests of the rule-based deinflection of verbs and adjectives.
+######################################################################
+
+import pytest
+
+from deinflector import (
+    ADJ_I,
+    GODAN,
+    ICHIDAN,
+    SURU,
+    deinflect,
+    has_word_type,
+    look_up_deinflected,
+)
+from dict_lookup import DictionaryEntry, DictionaryLookup
+
+
+@pytest.mark.parametrize(
+    "text, word, types, reasons",
+    [
+        ("食べない", "食べる", ICHIDAN, ("negative",)),
+        ("書きました", "書く", GODAN, ("polite", "past")),
+        ("行って", "行く", GODAN, ("te",)),
+        ("高かった", "高い", ADJ_I, ("past",)),
+        ("勉強した", "勉強する", SURU, ("past",)),
+        ("読みたくない", "読む", GODAN, ("-tai", "negative")),
+    ],
+)
+def test_deinflect(text, word, types, reasons):
+    candidates = {
+        (candidate.word, candidate.reasons)
+        for candidate in deinflect(text)
+        if candidate.types & types
+    }
+    assert (word, reasons) in candidates
+
+
+def test_deinflect_leaves_out_the_text_itself():
+    assert all(candidate.word != "食べる" for candidate in deinflect("食べる"))
+
+
+def _word(word_id, kanji, kana, part_of_speech):
+    return {
+        "id": word_id,
+        "kanji": [{"common": True, "text": kanji, "tags": []}],
+        "kana": [{"common": True, "text": kana, "tags": [], "appliesToKanji": ["*"]}],
+        "sense": [
+            {
+                "partOfSpeech": part_of_speech,
+                "gloss": [{"lang": "eng", "text": "meaning of %s" % kanji}],
+            }
+        ],
+    }
+
+
+def test_look_up_deinflected_checks_the_part_of_speech():
+    dictionary = DictionaryLookup()
+    dictionary.add_word(_word("1", "食べる", "たべる", ["v1", "vt"]))
+    # a noun that looks like a dictionary form
+    dictionary.add_word(_word("2", "書く", "かく", ["n"]))
+    dictionary.add_word(_word("3", "書く", "かく", ["v5k", "vt"]))
+    found = look_up_deinflected(dictionary, "書かなかった")
+    assert [(item.entry.unique_id, item.word) for item in found] == [("3", "書く")]
+    assert found[0].reasons == ("negative", "past")
+    found = look_up_deinflected(dictionary, "たべます")
+    assert [item.entry.unique_id for item in found] == ["1"]
+
+
+def test_has_word_type():
+    entry = DictionaryEntry(senses=[(("adj-i",), ("eng", "high"))])
+    assert has_word_type(entry, ADJ_I)
+    assert not has_word_type(entry, GODAN | ICHIDAN)
@@ -0,0 +1,163 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Tests of the in-memory dictionary: the pickled cache, glosses of
+# further languages loaded later on, and parallel parsing.
+######################################################################
+
+import threading
+
+import pytest
+
+import dict_lookup
+from conftest import parse
+from dict_lookup import DictionaryLookup
+from bounded_cache import BoundedCache
+from lookup_cache import CachedLookup, LookupCache
+
+
+def _entries(dictionary):
+    return list(dictionary.get_entries())
+
+
+def _ids(entries):
+    return [entry.unique_id for entry in entries]
+
+
+def test_pickle_round_trip(fixture_file):
+    dictionary = parse(fixture_file)
+    dictionary.pickle()
+    loaded = DictionaryLookup.de_pickle()
+    assert loaded is not None
+    assert _entries(loaded) == _entries(dictionary)
+    assert loaded.get_source() == dictionary.get_source()
+    for key in list(dictionary.get_keys())[:200]:
+        assert loaded.look_up(key) == dictionary.look_up(key)
+
+
+def test_de_pickle_without_cache():
+    assert DictionaryLookup.de_pickle() is None
+
+
+def test_parse_file_in_worker_processes(fixture_file):
+    dictionary = parse(fixture_file)
+    parallel = DictionaryLookup()
+    assert parallel.parse_file(fixture_file, processes=3)
+    assert _entries(parallel) == _entries(dictionary)
+    assert parallel.get_keys() == dictionary.get_keys()
+    for key in dictionary.get_keys():
+        assert parallel.get_entry_ids(key) == dictionary.get_entry_ids(key)
+    assert parallel.get_entry_hashes() == dictionary.get_entry_hashes()
+
+
+def _only(entries, languages):
+    return [
+        [
+            (part_of_speech, glosses)
+            for part_of_speech, glosses in (
+                (
+                    part_of_speech,
+                    tuple(
+                        item
+                        for index in range(0, len(glosses), 2)
+                        if glosses[index] in languages
+                        for item in glosses[index : index + 2]
+                    ),
+                )
+                for part_of_speech, glosses in entry.senses
+            )
+        ]
+        for entry in entries
+    ]
+
+
+def test_load_languages(fixture_file):
+    everything = parse(fixture_file)
+    dictionary = parse(fixture_file, languages=["eng"])
+    assert dictionary.get_languages() == everything.get_languages()
+    assert [list(entry.senses) for entry in _entries(dictionary)] == _only(
+        _entries(everything), {"eng"}
+    )
+    assert not dictionary.look_up_translation("ger", "ger", 10)
+    assert dictionary.load_languages(["ger", "eng"])
+    assert dictionary.get_loaded_languages() == {"eng", "ger"}
+    assert [list(entry.senses) for entry in _entries(dictionary)] == _only(
+        _entries(everything), {"eng", "ger"}
+    )
+    assert _ids(dictionary.look_up_translation("ger", "ger", 10)) == _ids(
+        everything.look_up_translation("ger", "ger", 10)
+    )
+
+
+def test_load_languages_while_looking_up(fixture_file):
+    everything = parse(fixture_file, lazy=True)
+    dictionary = parse(fixture_file, lazy=True, languages=["eng"])
+    entry_ids = range(200)
+    loader = threading.Thread(target=dictionary.load_languages, args=(["ger"],))
+    loader.start()
+    while loader.is_alive():
+        for entry_id in entry_ids:
+            dictionary.get_entry(entry_id)
+    loader.join()
+    # no entry decoded before is still cached without the glosses
+    assert [list(dictionary.get_entry(entry_id).senses) for entry_id in entry_ids] == (
+        _only(
+            [everything.get_entry(entry_id) for entry_id in entry_ids], {"eng", "ger"}
+        )
+    )
+
+
+def _not_on_lookup(*args):
+    raise AssertionError("index built on lookup")
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_search_indexes_are_pickled(fixture_file, monkeypatch, lazy):
+    everything = parse(fixture_file)
+    reading = next(key for key in sorted(everything.get_keys()) if len(key) >= 4)
+    misspelled = reading[:-1] + "ぬ"
+    similar = _ids(everything.look_up_similar(misspelled, 10))
+    assert similar
+    translations = {
+        language: _ids(everything.look_up_translation(language, language, 10))
+        for language in ("eng", "ger")
+    }
+    dictionary = parse(fixture_file, lazy=lazy, languages=["eng"])
+    dictionary.build_search_indexes()
+    dictionary.pickle()
+    loaded = DictionaryLookup.de_pickle()
+    monkeypatch.setattr(dict_lookup, "build_gloss_index", _not_on_lookup)
+    monkeypatch.setattr(dict_lookup, "build_gram_index", _not_on_lookup)
+    assert _ids(loaded.look_up_similar(misspelled, 10)) == similar
+    assert _ids(loaded.look_up_translation("eng", "eng", 10)) == translations["eng"]
+    # further languages get their indexes when they are loaded
+    assert loaded.load_languages(["ger"])
+    for language in ("eng", "ger"):
+        assert (
+            _ids(loaded.look_up_translation(language, language, 10))
+            == translations[language]
+        )
+
+
+def test_bounded_cache_drops_least_recently_used():
+    cache = BoundedCache(2)
+    cache.put(1, "a")
+    cache.put(2, "b")
+    assert cache.get(1) == "a"
+    cache.put(3, "c")
+    assert 1 in cache and 3 in cache and 2 not in cache
+    assert len(cache) == 2
+
+
+def test_lookup_cache_counts_hits():
+    cache = LookupCache(max_size=2)
+    lookup = CachedLookup(["entry"], ["text"])
+    assert cache.get("たべる", "eng") is None
+    cache.put("たべる", "eng", lookup)
+    assert cache.get("たべる", "eng") is lookup
+    assert cache.get("たべる", "ger") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,181 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Updating a dictionary to a new release of its file gives the same
+# dictionary as building it from the new file.
+######################################################################
+
+import copy
+import filecmp
+
+import pytest
+
+from conftest import parse
+from dict_binary import (
+    BinaryDictionary,
+    update_binary_dictionary,
+    write_binary_dictionary,
+)
+from dict_update import (
+    REMOVED,
+    WordSpan,
+    diff_entries,
+    remap_postings,
+    scan_words,
+)
+from jmdict_fixture import generate_words, write_words
+
+WORDS = 800
+
+
+def _new_release(words):
+    """Returns the words of the next release: some removed, some changed and some
+    added in between."""
+    added = list(generate_words(40, seed=7))
+    result = []
+    for number, word in enumerate(words):
+        if number % 50 == 3:
+            continue
+        if number % 37 == 5:
+            word = copy.deepcopy(word)
+            word["sense"][0]["gloss"][0]["text"] = "changed meaning %d" % number
+        if number % 30 == 11:
+            new_word = added.pop()
+            new_word["id"] = "9%06d" % number
+            result.append(new_word)
+        result.append(word)
+    return result + added[:5]
+
+
+@pytest.fixture(scope="module")
+def releases(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("releases")
+    words = list(generate_words(WORDS))
+    old_file = str(directory / "old.json")
+    new_file = str(directory / "new.json")
+    write_words(old_file, words)
+    write_words(new_file, _new_release(words))
+    return old_file, new_file
+
+
+def _entries(dictionary):
+    return list(dictionary.get_entries())
+
+
+def _assert_same(updated, built):
+    assert _entries(updated) == _entries(built)
+    assert updated.get_keys() == built.get_keys()
+    for key in built.get_keys():
+        assert updated.get_entry_ids(key) == built.get_entry_ids(key)
+    assert set(updated.get_normalized_keys()) == set(built.get_normalized_keys())
+    for key in built.get_normalized_keys():
+        assert updated.get_variant_entry_ids(key) == built.get_variant_entry_ids(key)
+    assert updated.get_entry_hashes() == built.get_entry_hashes()
+    assert updated.get_languages() == built.get_languages()
+    for text in ("rain", "changed meaning", "eng 20", "water fire"):
+        assert updated.look_up_translation(text, "eng", 50) == (
+            built.look_up_translation(text, "eng", 50)
+        )
+    for text in ("*る", "*し*", "か?"):
+        assert updated.look_up_pattern(text, 100) == built.look_up_pattern(text, 100)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_update_from_file_equals_fresh_build(releases, lazy):
+    old_file, new_file = releases
+    old = parse(old_file, lazy=lazy)
+    # indexes built on first use before the update are taken over
+    old.look_up_translation("rain", "eng", 10)
+    old_entries = _entries(old)
+    updated = old.update_from_file(new_file)
+    assert updated is not None
+    _assert_same(updated, parse(new_file, lazy=lazy))
+    # the old dictionary stays usable
+    assert _entries(old) == old_entries
+
+
+def test_update_of_unchanged_file_keeps_everything(releases):
+    old_file, _ = releases
+    old = parse(old_file)
+    updated = old.update_from_file(old_file)
+    _assert_same(updated, old)
+
+
+def test_updated_binary_file_equals_fresh_build(releases, tmp_path):
+    old_file, new_file = releases
+    write_binary_dictionary(parse(old_file), str(tmp_path / "old.bin"))
+    write_binary_dictionary(parse(new_file), str(tmp_path / "built.bin"))
+    old = BinaryDictionary.open(str(tmp_path / "old.bin"))
+    try:
+        assert update_binary_dictionary(
+            old, new_file, file_name=str(tmp_path / "updated.bin")
+        )
+    finally:
+        old.close()
+    assert filecmp.cmp(
+        str(tmp_path / "updated.bin"), str(tmp_path / "built.bin"), shallow=False
+    )
+
+
+def test_binary_update_of_unchanged_file(releases, tmp_path):
+    old_file, _ = releases
+    write_binary_dictionary(parse(old_file), str(tmp_path / "old.bin"))
+    old = BinaryDictionary.open(str(tmp_path / "old.bin"))
+    try:
+        assert update_binary_dictionary(
+            old, old_file, file_name=str(tmp_path / "updated.bin")
+        )
+    finally:
+        old.close()
+    assert filecmp.cmp(
+        str(tmp_path / "updated.bin"), str(tmp_path / "old.bin"), shallow=False
+    )
+
+
+def test_binary_update_of_reordered_file(releases, tmp_path):
+    old_file, _ = releases
+    write_binary_dictionary(parse(old_file), str(tmp_path / "old.bin"))
+    new_file = str(tmp_path / "new.json")
+    write_words(new_file, list(reversed(list(generate_words(WORDS)))))
+    old = BinaryDictionary.open(str(tmp_path / "old.bin"))
+    try:
+        # has to be built from scratch
+        assert not update_binary_dictionary(
+            old, new_file, file_name=str(tmp_path / "updated.bin")
+        )
+    finally:
+        old.close()
+
+
+def test_scan_words_locates_every_word(releases):
+    old_file, _ = releases
+    spans = scan_words(old_file)
+    assert len(spans) == WORDS
+    with open(old_file, "rb") as f:
+        data = f.read()
+    for span, word in zip(spans, generate_words(WORDS)):
+        assert data[span.offset : span.offset + span.length].startswith(
+            b'{"id": "%s"' % word["id"].encode()
+        )
+
+
+def _spans(digests):
+    return [WordSpan(0, 0, digest) for digest in digests]
+
+
+def test_diff_entries():
+    diff = diff_entries([1, 2, 3, 4], _spans([1, 5, 3, 4, 6]))
+    assert list(diff.new_ids) == [0, REMOVED, 2, 3]
+    assert diff.added_ids == [1, 4]
+    assert diff.in_order
+    assert not diff_entries([1, 2], _spans([2, 1])).in_order
+
+
+def test_remap_postings():
+    new_ids = [0, REMOVED, 1]
+    assert remap_postings({"a": [0, 1, 2], "b": [1], "c": [2]}, new_ids) == {
+        "a": [0, 1],
+        "c": [1],
+    }
@@ -0,0 +1,174 @@
+######################################################################
+# MangAnki
+# Anki plugin to help with vocab mining of online mangas
+# Copyright 2024, Andreas Gaiser
+######################################################################
+# Tests of the text helpers of the lookups: kana normalization,
+# sorted key search, wildcard and approximate matching of readings.
+######################################################################
+
+import io
+import json
+import random
+
+import pytest
+
+from fuzzy_index import build_gram_index, edit_distance, find_similar, prepare_query
+from json_stream import iter_json_array
+from kana import normalize_kana
+from sorted_keys import matching_prefixes, prefix_range, take_distinct
+from wildcard_index import (
+    SuffixArray,
+    build_suffix_array,
+    find_matching_keys,
+    is_pattern,
+    parse_pattern,
+    update_suffix_array,
+)
+
+KEYS = sorted(
+    [
+        "たべる",
+        "たべもの",
+        "たまご",
+        "食べる",
+        "食べ物",
+        "ひと",
+        "ひとり",
+        "カード",
+        "り",
+    ]
+)
+
+
+@pytest.mark.parametrize(
+    "text, normalized",
+    [
+        ("カード", "かあど"),
+        ("ｶｰﾄﾞ", "かあど"),
+        ("きゃっと", "きやっと"),
+        ("食べる", "食べる"),
+        ("ー", "ー"),
+    ],
+)
+def test_normalize_kana(text, normalized):
+    assert normalize_kana(text) == normalized
+
+
+def test_prefix_range():
+    start, end = prefix_range(KEYS, "たべ")
+    assert KEYS[start:end] == ["たべもの", "たべる"]
+    assert prefix_range(KEYS, "ぬ")[0] == prefix_range(KEYS, "ぬ")[1]
+    encoded = [key.encode("utf-8") for key in KEYS]
+    assert prefix_range(encoded, "たべ".encode("utf-8")) == (start, end)
+
+
+def test_matching_prefixes():
+    text = "ひとりで"
+    found = [
+        KEYS[position]
+        for _, position in matching_prefixes(
+            KEYS, (text[:end] for end in range(1, len(text) + 1))
+        )
+    ]
+    assert found == ["ひと", "ひとり"]
+
+
+def test_take_distinct():
+    assert take_distinct([[3, 1], [1, 2], [4]], 3) == [3, 1, 2]
+    assert take_distinct([], 5) == []
+
+
+def test_json_stream_matches_json_load():
+    document = {
+        "version": "3.5.0",
+        "words": [{"id": str(n), "text": "語%d" % n, "n": n * 1.5} for n in range(300)],
+        "tags": {"a": "b"},
+    }
+    text = json.dumps(document, ensure_ascii=False)
+    header = {}
+    words = list(iter_json_array(io.StringIO(text), "words", header, chunk_size=7))
+    assert words == document["words"]
+    assert header == {"version": "3.5.0", "tags": {"a": "b"}}
+
+
+def test_json_stream_spans(tmp_path):
+    words = [{"id": str(n), "text": "語" * n} for n in range(50)]
+    file_name = tmp_path / "words.json"
+    file_name.write_text(json.dumps({"words": words}, ensure_ascii=False), "utf-8")
+    data = file_name.read_bytes()
+    with open(file_name, encoding="utf-8", newline="") as f:
+        for word, offset, length in iter_json_array(
+            f, "words", chunk_size=16, with_spans=True
+        ):
+            assert json.loads(data[offset : offset + length]) == word
+
+
+def test_json_stream_rejects_malformed_input():
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('{"words": [1, 2'), "words"))
+
+
+def test_edit_distance():
+    assert edit_distance("たべる", "たべる", 1) == 0
+    assert edit_distance("たべる", "たぺる", 1) == 1
+    assert edit_distance("たべる", "たる", 1) == 1
+    assert edit_distance("たべる", "のみもの", 1) == 2
+
+
+def test_find_similar():
+    keys = sorted(["たべる", "たべもの", "しらべる", "のみもの", "食べる"])
+    index = build_gram_index(keys)
+    positions = find_similar(
+        "たぺる", lambda gram: index.get(gram, ()), keys.__getitem__, 5
+    )
+    assert [keys[position] for position in positions] == ["たべる"]
+    assert prepare_query("") is None
+    assert prepare_query("あ" * 20) is None
+
+
+def test_find_similar_two_kanji():
+    keys = sorted(["漢字", "漢方", "感じ", "かんじ", "字"])
+    index = build_gram_index(keys)
+    positions = find_similar(
+        "漢時", lambda gram: index.get(gram, ()), keys.__getitem__, 5
+    )
+    assert [keys[position] for position in positions] == ["漢字", "漢方"]
+    assert prepare_query("漢字") is not None
+    assert prepare_query("かん") is None
+    assert prepare_query("カン") is None
+
+
+def test_parse_pattern():
+    assert is_pattern("食＊")
+    assert not is_pattern("食べる")
+    assert parse_pattern("**") is None
+    pattern = parse_pattern("た*る")
+    assert pattern.prefix == "た"
+    assert pattern.regex.fullmatch("たべる")
+
+
+@pytest.mark.parametrize("text", ["*べ*", "た*", "?べる", "*る", "食?*"])
+def test_find_matching_keys(text):
+    pattern = parse_pattern(text)
+    suffixes = SuffixArray(KEYS, *build_suffix_array(KEYS))
+    found = [KEYS[position] for position in find_matching_keys(pattern, KEYS, suffixes)]
+    assert found == [key for key in KEYS if pattern.regex.fullmatch(key)]
+
+
+def test_update_suffix_array():
+    rnd = random.Random(3)
+    alphabet = "あいうかきく"
+    old_keys = sorted(
+        {
+            "".join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 5)))
+            for _ in range(200)
+        }
+    )
+    keys = sorted(
+        set(rnd.sample(old_keys, len(old_keys) * 3 // 4))
+        | {"".join(rnd.choice(alphabet) for _ in range(4)) for _ in range(30)}
+    )
+    updated = update_suffix_array(old_keys, keys, build_suffix_array(old_keys))
+    # the same arrays, with equal suffixes in the same order
+    assert updated == build_suffix_array(keys)